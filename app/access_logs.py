@@ -0,0 +1,476 @@
+"""
+Reading the tenant Nginx access logs.
+
+The wildcard server writes every tenant's requests to one log,
+TENANT_ACCESS_LOG, as one JSON object per request naming its tenant
+(log_format tenant_json in routing.py). Per-tenant {tenant}_access.log
+files from older server blocks, and lines in the older tenant_combined
+text format, are still understood so existing logs keep working.
+"""
+import os
+import re
+import json
+import time
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import TenantTrafficMinute, AccessLogOffset
+from .routing import NGINX_LOG_DIR, TENANT_ACCESS_LOG
+from .rollups import bucket_start, histogram_index, histogram_percentile
+
+logger = logging.getLogger(__name__)
+
+# The older text format: ... "$request" $status $body_bytes_sent "..." "..." cache=X rt=Y
+COMBINED_LINE_RE = re.compile(
+    r'^(?P<remote_addr>\S+) - \S+ \[(?P<time_local>[^\]]+)\] "(?P<request>[^"]*)" '
+    r'(?P<status>\d{3}) (?P<body_bytes_sent>\d+|-) "[^"]*" "[^"]*" '
+    r'cache=(?P<cache>\S+) rt=(?P<request_time>[\d.]+)'
+)
+
+CACHE_HIT_STATUSES = {'HIT', 'STALE', 'UPDATING', 'REVALIDATED'}
+CACHE_MISS_STATUSES = {'MISS', 'EXPIRED'}
+
+ACCESS_LOG_SUFFIX = '_access.log'
+DEFAULT_TAIL_BYTES = 4 * 1024 * 1024
+
+ACCESS_LOG_POLL_INTERVAL = getattr(settings, 'ACCESS_LOG_POLL_INTERVAL', 1.0)
+ACCESS_LOG_FLUSH_INTERVAL = getattr(settings, 'ACCESS_LOG_FLUSH_INTERVAL', 10.0)
+# Kept a little over a month so monthly bandwidth can be summed
+TRAFFIC_RETENTION_DAYS = getattr(settings, 'TRAFFIC_RETENTION_DAYS', 35)
+# Upper bound per file per poll so one busy tenant can't starve the rest
+MAX_READ_PER_POLL = 16 * 1024 * 1024
+LATENCY_HISTOGRAM_MIN = 0.001
+# Window for the hit ratio shown on the project metrics page
+CACHE_STATS_WINDOW = getattr(settings, 'CACHE_STATS_WINDOW', 3600)
+
+
+def tail_lines(path, max_bytes=DEFAULT_TAIL_BYTES):
+    """Complete lines from the last max_bytes of a log file"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - max_bytes, 0))
+        data = f.read()
+    lines = data.split(b'\n')
+    if size > max_bytes:
+        lines = lines[1:]  # first line is probably partial
+    return [line.decode('utf-8', 'replace') for line in lines if line]
+
+
+def parse_line(line):
+    """Fields of one access log line as a dict, or None if it can't be parsed"""
+    if line.startswith('{'):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    match = COMBINED_LINE_RE.match(line)
+    if not match:
+        return None
+    entry = match.groupdict()
+    entry['status'] = int(entry['status'])
+    entry['bytes_sent'] = int(entry['body_bytes_sent']) if entry['body_bytes_sent'] != '-' else 0
+    entry['request_time'] = float(entry['request_time'])
+    try:
+        entry['time'] = datetime.strptime(entry['time_local'], '%d/%b/%Y:%H:%M:%S %z').isoformat()
+    except ValueError:
+        entry['time'] = None
+    return entry
+
+
+def _count_cache_status(stats, entry):
+    status = (entry or {}).get('cache') or '-'
+    if status in CACHE_HIT_STATUSES:
+        stats['hits'] += 1
+    elif status in CACHE_MISS_STATUSES:
+        stats['misses'] += 1
+    else:
+        stats['bypassed'] += 1
+
+
+def _empty_cache_stats():
+    return {'hits': 0, 'misses': 0, 'bypassed': 0, 'hit_ratio': None}
+
+
+def _finish_cache_stats(stats):
+    cacheable = stats['hits'] + stats['misses']
+    if cacheable:
+        stats['hit_ratio'] = round(stats['hits'] / cacheable, 4)
+    return stats
+
+
+def cache_stats_for_log(path, max_bytes=DEFAULT_TAIL_BYTES):
+    """Count cache hits and misses in a tenant access log"""
+    stats = _empty_cache_stats()
+    for line in tail_lines(path, max_bytes):
+        _count_cache_status(stats, parse_line(line))
+    return _finish_cache_stats(stats)
+
+
+def shared_log_cache_stats(log_dir=NGINX_LOG_DIR, max_bytes=DEFAULT_TAIL_BYTES):
+    """{tenant: stats} from the shared tenant access log"""
+    results = {}
+    try:
+        lines = tail_lines(os.path.join(log_dir, TENANT_ACCESS_LOG), max_bytes)
+    except FileNotFoundError:
+        return results
+    except OSError as e:
+        logger.warning(f"Could not read {TENANT_ACCESS_LOG}: {str(e)}")
+        return results
+
+    for line in lines:
+        entry = parse_line(line)
+        tenant = (entry or {}).get('tenant')
+        if tenant:
+            _count_cache_status(results.setdefault(tenant, _empty_cache_stats()), entry)
+    return {tenant: _finish_cache_stats(stats) for tenant, stats in results.items()}
+
+
+def tenant_cache_stats(tenant, log_dir=NGINX_LOG_DIR, max_bytes=DEFAULT_TAIL_BYTES):
+    """Cache statistics for one tenant's own (legacy) log, or None if it has none"""
+    path = os.path.join(log_dir, f"{tenant}{ACCESS_LOG_SUFFIX}")
+    try:
+        return cache_stats_for_log(path, max_bytes)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {str(e)}")
+        return None
+
+
+def all_tenant_cache_stats(log_dir=NGINX_LOG_DIR, max_bytes=DEFAULT_TAIL_BYTES):
+    """{tenant: stats} for every tenant in the shared log and in per-tenant logs in log_dir"""
+    results = shared_log_cache_stats(log_dir, max_bytes)
+    try:
+        entries = list(os.scandir(log_dir))
+    except OSError as e:
+        logger.warning(f"Could not list {log_dir}: {str(e)}")
+        return results
+
+    for entry in entries:
+        tenant = log_tenant(entry.name)
+        if entry.is_file() and tenant:
+            stats = tenant_cache_stats(tenant, log_dir, max_bytes)
+            if stats is None:
+                continue
+            shared = results.get(tenant, _empty_cache_stats())
+            results[tenant] = _finish_cache_stats({
+                key: stats[key] + shared[key] for key in ('hits', 'misses', 'bypassed')
+            } | {'hit_ratio': None})
+    return results
+
+
+def log_tenant(name):
+    """Tenant a per-tenant log file belongs to; None for the shared log and other files"""
+    if name == TENANT_ACCESS_LOG or not name.endswith(ACCESS_LOG_SUFFIX):
+        return None
+    return name[:-len(ACCESS_LOG_SUFFIX)] or None
+
+
+def _upstream_seconds(value):
+    """$upstream_response_time is "-", "0.012" or "0.010, 0.020" after retries"""
+    total, seen = 0.0, False
+    for part in str(value or '').replace(':', ',').split(','):
+        try:
+            total += float(part.strip())
+            seen = True
+        except ValueError:
+            continue
+    return total if seen else None
+
+
+def _entry_minute(entry):
+    try:
+        moment = datetime.fromisoformat(entry['time'])
+    except (KeyError, TypeError, ValueError):
+        moment = timezone.now()
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return bucket_start(moment, 60)
+
+
+class TrafficAggregator:
+    """Per tenant per minute totals, held in memory until the next flush"""
+
+    def __init__(self):
+        self.minutes = {}
+
+    def add(self, tenant, entry):
+        key = (tenant, _entry_minute(entry))
+        stats = self.minutes.get(key)
+        if stats is None:
+            stats = self.minutes[key] = {
+                'requests': 0, 'status_2xx': 0, 'status_3xx': 0, 'status_4xx': 0, 'status_5xx': 0,
+                'bytes_sent': 0, 'bytes_received': 0, 'request_time_total': 0.0, 'request_time_max': 0.0,
+                'request_time_histogram': {}, 'upstream_time_total': 0.0, 'upstream_requests': 0,
+                'cache_hits': 0, 'cache_misses': 0,
+            }
+
+        stats['requests'] += 1
+        status_class = f"status_{str(entry.get('status', 0))[:1]}xx"
+        if status_class in stats:
+            stats[status_class] += 1
+        stats['bytes_sent'] += int(entry.get('bytes_sent') or 0)
+        stats['bytes_received'] += int(entry.get('request_length') or 0)
+
+        request_time = float(entry.get('request_time') or 0.0)
+        stats['request_time_total'] += request_time
+        stats['request_time_max'] = max(stats['request_time_max'], request_time)
+        index = str(histogram_index(request_time, LATENCY_HISTOGRAM_MIN))
+        stats['request_time_histogram'][index] = stats['request_time_histogram'].get(index, 0) + 1
+
+        upstream = _upstream_seconds(entry.get('upstream_response_time'))
+        if upstream is not None:
+            stats['upstream_time_total'] += upstream
+            stats['upstream_requests'] += 1
+
+        cache_status = entry.get('cache') or '-'
+        if cache_status in CACHE_HIT_STATUSES:
+            stats['cache_hits'] += 1
+        elif cache_status in CACHE_MISS_STATUSES:
+            stats['cache_misses'] += 1
+
+    def drain(self):
+        minutes, self.minutes = self.minutes, {}
+        return minutes
+
+
+def _merge_traffic(row, stats):
+    for field in ('requests', 'status_2xx', 'status_3xx', 'status_4xx', 'status_5xx', 'bytes_sent',
+                  'bytes_received', 'request_time_total', 'upstream_time_total', 'upstream_requests',
+                  'cache_hits', 'cache_misses'):
+        setattr(row, field, getattr(row, field) + stats[field])
+    row.request_time_max = max(row.request_time_max, stats['request_time_max'])
+    for index, count in stats['request_time_histogram'].items():
+        row.request_time_histogram[index] = row.request_time_histogram.get(index, 0) + count
+    for q, field in ((0.5, 'request_time_p50'), (0.95, 'request_time_p95'), (0.99, 'request_time_p99')):
+        setattr(row, field, histogram_percentile(
+            row.request_time_histogram, row.requests, q, 0.0, row.request_time_max, LATENCY_HISTOGRAM_MIN
+        ))
+
+
+def store_traffic(minutes):
+    """Add drained per-minute totals into TenantTrafficMinute"""
+    if not minutes:
+        return
+    existing = {
+        (row.tenant, row.minute): row
+        for row in TenantTrafficMinute.objects.filter(
+            tenant__in={tenant for tenant, _ in minutes},
+            minute__in={minute for _, minute in minutes},
+        )
+    }
+    created, updated = [], []
+    for (tenant, minute), stats in minutes.items():
+        row = existing.get((tenant, minute))
+        if row is None:
+            row = TenantTrafficMinute(tenant=tenant, minute=minute, request_time_histogram={})
+            created.append(row)
+        else:
+            updated.append(row)
+        _merge_traffic(row, stats)
+
+    if created:
+        TenantTrafficMinute.objects.bulk_create(created)
+    if updated:
+        TenantTrafficMinute.objects.bulk_update(updated, [
+            'requests', 'status_2xx', 'status_3xx', 'status_4xx', 'status_5xx', 'bytes_sent',
+            'bytes_received', 'request_time_total', 'request_time_max', 'request_time_p50',
+            'request_time_p95', 'request_time_p99', 'request_time_histogram',
+            'upstream_time_total', 'upstream_requests', 'cache_hits', 'cache_misses',
+        ])
+
+
+class FollowedLog:
+    def __init__(self, path, tenant, inode, offset):
+        self.path = path
+        self.tenant = tenant
+        self.inode = inode
+        self.offset = offset
+        self.handle = None
+        self.saved = None  # (inode, offset) last written to AccessLogOffset
+
+
+class AccessLogFollower:
+    """
+    Tails the shared tenant access log and any per-tenant logs left in
+    log_dir. Offsets are stored in
+    AccessLogOffset in the same transaction as the traffic they produced,
+    so a restart neither skips nor double counts lines.
+
+    Rotation: when the path's inode changes, the rest of the old file is
+    read through the still-open handle (or from `<path>.1` after a
+    restart) before following the new file from the start. A file that
+    shrinks below the offset was truncated and is re-read from the start.
+    """
+
+    def __init__(self, log_dir=NGINX_LOG_DIR):
+        self.log_dir = log_dir
+        self.aggregator = TrafficAggregator()
+        self.logs = {}
+        self._saved = {
+            o.path: o for o in AccessLogOffset.objects.filter(path__startswith=os.path.join(log_dir, ''))
+        }
+
+    def _read_from(self, log, handle, start):
+        """Aggregate complete lines from start; returns the offset after the last one"""
+        handle.seek(start)
+        data = handle.read(MAX_READ_PER_POLL)
+        end = data.rfind(b'\n')
+        if end < 0:
+            return start
+        for line in data[:end].split(b'\n'):
+            entry = parse_line(line.decode('utf-8', 'replace').strip())
+            tenant = (entry or {}).get('tenant') or log.tenant
+            if tenant:
+                self.aggregator.add(tenant, entry)
+        return start + end + 1
+
+    def _drain(self, log, handle, start):
+        offset = start
+        while True:
+            new_offset = self._read_from(log, handle, offset)
+            if new_offset == offset:
+                return offset
+            offset = new_offset
+
+    def _open(self, path, tenant, stat):
+        saved = self._saved.get(path)
+        log = FollowedLog(path, tenant, stat.st_ino, 0)
+        if saved:
+            log.saved = (saved.inode, saved.offset)
+            if saved.inode == stat.st_ino:
+                log.offset = saved.offset if saved.offset <= stat.st_size else 0
+            else:
+                self._finish_rotated(log, saved)
+        log.handle = open(path, 'rb')
+        return log
+
+    def _finish_rotated(self, log, saved):
+        """Read what was left of a file rotated while we weren't running"""
+        rotated = f"{log.path}.1"
+        try:
+            if os.stat(rotated).st_ino != saved.inode:
+                logger.warning(f"{log.path} was rotated past {rotated}; lines after offset {saved.offset} are lost")
+                return
+            with open(rotated, 'rb') as handle:
+                self._drain(log, handle, saved.offset)
+        except FileNotFoundError:
+            logger.warning(f"{log.path} was rotated and {rotated} is gone; lines after offset {saved.offset} are lost")
+
+    def poll(self):
+        """Read whatever has been appended to every tenant log since the last poll"""
+        try:
+            names = [n for n in os.listdir(self.log_dir) if n == TENANT_ACCESS_LOG or log_tenant(n)]
+        except OSError as e:
+            logger.warning(f"Could not list {self.log_dir}: {str(e)}")
+            return
+
+        for name in names:
+            path = os.path.join(self.log_dir, name)
+            # Lines of the shared log name their tenant
+            tenant = log_tenant(name)
+            try:
+                stat = os.stat(path)
+                log = self.logs.get(path)
+                if log is None:
+                    log = self.logs[path] = self._open(path, tenant, stat)
+                elif stat.st_ino != log.inode:
+                    # Rotated: finish the old file through the handle we still hold
+                    self._drain(log, log.handle, log.offset)
+                    log.handle.close()
+                    log.handle = open(path, 'rb')
+                    log.inode, log.offset = stat.st_ino, 0
+                elif stat.st_size < log.offset:
+                    log.offset = 0
+                log.offset = self._read_from(log, log.handle, log.offset)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Could not read {path}: {str(e)}")
+
+        for path in [p for p in self.logs if os.path.basename(p) not in names]:
+            self.logs.pop(path).handle.close()
+
+    def flush(self):
+        """Write aggregated traffic and the offsets it was read up to, atomically"""
+        minutes = self.aggregator.minutes
+        changed = [log for log in self.logs.values() if log.saved != (log.inode, log.offset)]
+        if not minutes and not changed:
+            return
+
+        with transaction.atomic():
+            store_traffic(minutes)
+            for log in changed:
+                AccessLogOffset.objects.update_or_create(
+                    path=log.path, defaults={'inode': log.inode, 'offset': log.offset}
+                )
+        # Only forget the totals once they are committed; a failed flush is retried next time
+        self.aggregator.drain()
+        for log in changed:
+            log.saved = (log.inode, log.offset)
+
+    def close(self):
+        for log in self.logs.values():
+            log.handle.close()
+        self.logs = {}
+
+
+def prune_traffic(now=None):
+    cutoff = (now or timezone.now()) - timedelta(days=TRAFFIC_RETENTION_DAYS)
+    deleted, _ = TenantTrafficMinute.objects.filter(minute__lt=cutoff).delete()
+    return deleted
+
+
+def follow_access_logs(log_dir=NGINX_LOG_DIR, poll_interval=ACCESS_LOG_POLL_INTERVAL,
+                       flush_interval=ACCESS_LOG_FLUSH_INTERVAL):
+    """Follow the tenant logs until interrupted"""
+    follower = AccessLogFollower(log_dir)
+    flushed_at = pruned_at = time.monotonic()
+    try:
+        while True:
+            follower.poll()
+            now = time.monotonic()
+            if now - flushed_at >= flush_interval:
+                try:
+                    follower.flush()
+                except Exception as e:
+                    logger.error(f"Could not store access log traffic: {str(e)}")
+                flushed_at = now
+            if now - pruned_at >= 3600:
+                prune_traffic()
+                pruned_at = now
+            time.sleep(poll_interval)
+    finally:
+        follower.flush()
+        follower.close()
+
+
+def monthly_bandwidth(tenants=None):
+    """{tenant: bytes sent since the start of this month}"""
+    month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    rows = TenantTrafficMinute.objects.filter(minute__gte=month_start)
+    if tenants is not None:
+        rows = rows.filter(tenant__in=tenants)
+    return {
+        row['tenant']: row['total']
+        for row in rows.values('tenant').annotate(total=Sum('bytes_sent'))
+    }
+
+
+def recent_cache_stats(tenant, seconds=CACHE_STATS_WINDOW):
+    """Edge cache hits and misses over the last `seconds`, from the stored traffic minutes"""
+    totals = TenantTrafficMinute.objects.filter(
+        tenant=tenant, minute__gte=timezone.now() - timedelta(seconds=seconds)
+    ).aggregate(hits=Sum('cache_hits'), misses=Sum('cache_misses'))
+    hits, misses = totals['hits'] or 0, totals['misses'] or 0
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
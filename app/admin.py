@@ -2,6 +2,7 @@ from django.contrib import admin
 import os
 from .models import (
     Website,
+    WorkerNode,
     DjangoProject,
     DeploymentLog,
     ServerResource,
@@ -22,13 +23,35 @@ class WebsiteAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
 
 
+@admin.register(WorkerNode)
+class WorkerNodeAdmin(admin.ModelAdmin):
+    list_display = (
+        'name', 'host', 'agent_port', 'is_active', 'available_memory_mb',
+        'load_average', 'running_projects', 'last_heartbeat'
+    )
+    list_filter = ('is_active',)
+    search_fields = ('name', 'host')
+    readonly_fields = (
+        'total_memory_mb', 'available_memory_mb', 'cpu_count', 'load_average',
+        'running_projects', 'last_heartbeat', 'last_error', 'created_at'
+    )
+    actions = ['refresh_heartbeat']
+
+    @admin.action(description='Refresh heartbeat from node agents')
+    def refresh_heartbeat(self, request, queryset):
+        from .nodes import refresh_node_stats
+        nodes = refresh_node_stats(queryset)
+        healthy = sum(1 for n in nodes if not n.last_error)
+        self.message_user(request, f"{healthy} of {len(nodes)} node(s) responded.")
+
+
 @admin.register(DjangoProject)
 class DjangoProjectAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'user', 'project_name', 'python_version', 'subdomain',
-        'deployment_status', 'is_active', 'created_at'
+        'node', 'deployment_status', 'is_active', 'created_at'
     )
-    list_filter = ('deployment_status', 'is_active', 'python_version', 'created_at')
+    list_filter = ('deployment_status', 'is_active', 'python_version', 'node', 'created_at')
     search_fields = (
         'project_name', 'subdomain', 'custom_domain', 
         'domain_name', 'user__username'
@@ -96,6 +119,7 @@ class SSLCertificateAdmin(admin.ModelAdmin):
 
 from django.contrib import admin
 from .models import UserFile, StorageSettings, PaymentRequest
+from .summary import invalidate_user_summary
 
 @admin.register(UserFile)
 class UserFileAdmin(admin.ModelAdmin):
@@ -131,11 +155,15 @@ class PaymentRequestAdmin(admin.ModelAdmin):
     @admin.action(description='Approve selected payments')
     def approve_payments(self, request, queryset):
         updated = queryset.update(status='approved')
+        # QuerySet.update() sends no post_save
+        invalidate_user_summary(*queryset.values_list('user_id', flat=True))
         self.message_user(request, f"{updated} payment(s) approved.")
 
     @admin.action(description='Reject selected payments')
     def reject_payments(self, request, queryset):
         updated = queryset.update(status='rejected')
+        # QuerySet.update() sends no post_save
+        invalidate_user_summary(*queryset.values_list('user_id', flat=True))
         self.message_user(request, f"{updated} payment(s) rejected.")
 
 
@@ -0,0 +1,82 @@
+"""
+Incremental disk usage for project folders.
+
+A directory's mtime changes whenever an entry is added, removed or
+renamed in it, so a directory whose mtime is unchanged since the last
+scan keeps its cached file total and sub-directory list; only changed
+directories are listed again. Files growing in place don't touch the
+directory mtime, so each root is fully rescanned every
+DISK_USAGE_RESCAN_SECONDS as well.
+"""
+import os
+import time
+import logging
+from collections import namedtuple
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DISK_USAGE_RESCAN_SECONDS = getattr(settings, 'DISK_USAGE_RESCAN_SECONDS', 3600)
+
+CachedDir = namedtuple('CachedDir', ['mtime_ns', 'file_bytes', 'subdirs'])
+
+
+class DiskUsageTracker:
+    """Per-directory byte totals, reused across calls while directory mtimes hold"""
+
+    def __init__(self, rescan_seconds=DISK_USAGE_RESCAN_SECONDS):
+        self.rescan_seconds = rescan_seconds
+        self._dirs = {}
+        self._full_scan_at = {}
+        self.listed = 0  # directories listed by the last usage() call
+
+    def _list(self, path, mtime_ns):
+        file_bytes, subdirs = 0, []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        file_bytes += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+        self.listed += 1
+        return CachedDir(mtime_ns, file_bytes, subdirs)
+
+    def forget(self, root):
+        prefix = root.rstrip(os.sep) + os.sep
+        for path in [p for p in self._dirs if p == root or p.startswith(prefix)]:
+            del self._dirs[path]
+        self._full_scan_at.pop(root, None)
+
+    def usage(self, root):
+        """Total bytes of regular files under root (0 if it doesn't exist)"""
+        root = os.path.abspath(root)
+        self.listed = 0
+        if time.monotonic() - self._full_scan_at.get(root, float('-inf')) > self.rescan_seconds:
+            self.forget(root)
+            self._full_scan_at[root] = time.monotonic()
+
+        total, seen, stack = 0, set(), [root]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                cached = self._dirs.get(path)
+                if cached is None or cached.mtime_ns != mtime_ns:
+                    cached = self._list(path, mtime_ns)
+                    self._dirs[path] = cached
+            except OSError:
+                # Removed since its parent was listed
+                continue
+            seen.add(path)
+            total += cached.file_bytes
+            stack.extend(cached.subdirs)
+
+        # Drop directories that no longer exist under root
+        prefix = root + os.sep
+        for path in [p for p in self._dirs if (p == root or p.startswith(prefix)) and p not in seen]:
+            del self._dirs[path]
+
+        return total
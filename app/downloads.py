@@ -0,0 +1,120 @@
+"""
+File downloads handed off to the web server.
+
+Django resolves the path and checks access, then answers with an empty
+response carrying `X-Accel-Redirect` so Nginx streams the file itself.
+The platform's server block needs one internal location per root:
+
+    location /protected/media/ {
+        internal;
+        alias /path/to/project/media/;
+    }
+
+With SENDFILE_BACKEND = 'python' (the default when DEBUG is on) the file
+is returned as a FileResponse instead, which uses the WSGI server's
+sendfile support where available.
+"""
+import os
+import logging
+import mimetypes
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import content_disposition_header
+
+from .models import DjangoProject, PaymentRequest, Website, DatabaseBackup
+
+logger = logging.getLogger(__name__)
+
+SENDFILE_BACKEND = getattr(settings, 'SENDFILE_BACKEND', 'python' if settings.DEBUG else 'nginx')
+SENDFILE_INTERNAL_PREFIX = getattr(settings, 'SENDFILE_INTERNAL_PREFIX', '/protected/media/')
+
+# Media sub-directories anyone may read: they back public pages, or hold
+# files users share by URL ("Copy URL" on the uploads page)
+PUBLIC_MEDIA_DIRS = ('payment_qr', 'profile_images', 'videos', 'user_uploads', 'uploads')
+
+
+def resolve_path(root, relative_path):
+    """Absolute path of relative_path under root, or Http404 if it escapes root or isn't a file"""
+    root = os.path.realpath(root)
+    full_path = os.path.realpath(os.path.join(root, relative_path))
+    if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+        raise Http404("File not found")
+    return full_path
+
+
+def send_file(full_path, as_attachment=False):
+    """Response that makes the web server deliver full_path (under MEDIA_ROOT)"""
+    filename = os.path.basename(full_path)
+
+    if SENDFILE_BACKEND == 'nginx':
+        relative_path = os.path.relpath(full_path, os.path.realpath(settings.MEDIA_ROOT))
+        content_type, encoding = mimetypes.guess_type(filename)
+        response = HttpResponse(content_type=content_type or 'application/octet-stream')
+        response['X-Accel-Redirect'] = quote(SENDFILE_INTERNAL_PREFIX + relative_path.replace(os.sep, '/'))
+        if as_attachment:
+            response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    return FileResponse(open(full_path, 'rb'), as_attachment=as_attachment, filename=filename)
+
+
+def can_access_media(user, relative_path):
+    """Whether user may download MEDIA_ROOT/relative_path"""
+    parts = relative_path.replace('\\', '/').split('/')
+    top = parts[0]
+
+    if top in PUBLIC_MEDIA_DIRS:
+        return True
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+
+    if top == 'payment_proofs':
+        return PaymentRequest.objects.filter(user=user, payment_proof=relative_path).exists()
+    if top == 'django_projects':
+        return DjangoProject.objects.filter(user=user, project_file=relative_path).exists()
+    if top == 'website_uploads':
+        return Website.objects.filter(user=user, uploaded_file=relative_path).exists()
+    if top == 'backups':
+        return DatabaseBackup.objects.filter(django_project__user=user, backup_file=relative_path).exists()
+    if top == 'websites' and len(parts) > 2:
+        return is_own_deployment_folder(user, parts[1])
+    return False
+
+
+def is_own_deployment_folder(user, folder):
+    """Deployment folders are named {username}_{safe_name}, as deploy_django_project creates them"""
+    prefix = f"{user.username}_"
+    if not folder.startswith(prefix):
+        return False
+    safe_name = folder[len(prefix):]
+    # Non-alphanumerics in the project name become _ in the folder name
+    return any(
+        "".join(c if c.isalnum() else "_" for c in project_name) == safe_name
+        for project_name in DjangoProject.objects.filter(user=user).values_list('project_name', flat=True)
+    )
+
+
+def serve_media(request, path):
+    """MEDIA_URL downloads, with per-owner access checks"""
+    full_path = resolve_path(settings.MEDIA_ROOT, path)
+    relative_path = os.path.relpath(full_path, os.path.realpath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+
+    if not can_access_media(request.user, relative_path):
+        # Don't reveal whether someone else's file exists
+        raise Http404("File not found")
+
+    return send_file(full_path, as_attachment=request.GET.get('download') == '1')
+
+
+def serve_site_file(request, path):
+    """Legacy /sites/ URLs, which map onto MEDIA_ROOT/websites/ and have always been public"""
+    return send_file(resolve_path(os.path.join(settings.MEDIA_ROOT, 'websites'), path))
+
+
+def serve_upload(request, path):
+    """Legacy /uploads/ URLs, which map onto MEDIA_ROOT/uploads/ and have always been public"""
+    return send_file(resolve_path(os.path.join(settings.MEDIA_ROOT, 'uploads'), path))
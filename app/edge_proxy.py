@@ -0,0 +1,436 @@
+import time
+import random
+import signal
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import DjangoProject, DeployedProject
+
+logger = logging.getLogger(__name__)
+
+EDGE_CONNECT_TIMEOUT = getattr(settings, 'EDGE_CONNECT_TIMEOUT', 10)
+EDGE_READ_TIMEOUT = getattr(settings, 'EDGE_READ_TIMEOUT', 60)
+EDGE_CLIENT_IDLE_TIMEOUT = getattr(settings, 'EDGE_CLIENT_IDLE_TIMEOUT', 75)
+# Idle keepalive connections kept per upstream, mirroring `keepalive 16` in Nginx
+EDGE_UPSTREAM_KEEPALIVE = getattr(settings, 'EDGE_UPSTREAM_KEEPALIVE', 16)
+EDGE_UPSTREAM_IDLE_TIMEOUT = getattr(settings, 'EDGE_UPSTREAM_IDLE_TIMEOUT', 60)
+# Seconds a replica that refused a connection is skipped, mirroring fail_timeout=10s
+EDGE_FAIL_TIMEOUT = getattr(settings, 'EDGE_FAIL_TIMEOUT', 10)
+
+MAX_HEAD_SIZE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer', 'upgrade'}
+
+
+class ProxyError(Exception):
+    """Request could not be proxied; status is sent to the client"""
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+def load_routes():
+    """
+    Host -> [(host, port), ...] for every deployed tenant, built from
+    DjangoProject domains with their port leases and running GitHub projects.
+    """
+    routes = {}
+    try:
+        projects = DjangoProject.objects.filter(deployment_status='deployed').prefetch_related('port_leases')
+        for project in projects:
+            upstreams = [(lease.host, lease.port) for lease in project.port_leases.all()]
+            if not upstreams:
+                continue
+            for hostname in (project.domain_name, project.custom_domain):
+                if hostname:
+                    routes[hostname.lower()] = upstreams
+
+        for project in DeployedProject.objects.filter(running=True):
+            routes[project.subdomain.lower()] = [('127.0.0.1', project.port)]
+    finally:
+        close_old_connections()
+    return routes
+
+
+class EdgeRoutes:
+    """In-memory routing table, swapped wholesale on refresh"""
+
+    def __init__(self, routes=None):
+        self.routes = routes or {}
+
+    def replace(self, routes):
+        if routes != self.routes:
+            logger.info(f"Edge routes updated: {len(routes)} host(s)")
+        self.routes = routes
+
+    def lookup(self, host):
+        """Upstreams for a Host header, starting at a random replica"""
+        upstreams = self.routes.get(host.split(':', 1)[0].lower())
+        if not upstreams:
+            return []
+        start = random.randrange(len(upstreams))
+        return upstreams[start:] + upstreams[:start]
+
+
+class UpstreamPool:
+    """Idle keepalive connections per upstream address"""
+
+    def __init__(self, max_idle=EDGE_UPSTREAM_KEEPALIVE, idle_timeout=EDGE_UPSTREAM_IDLE_TIMEOUT):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = {}
+
+    async def acquire(self, address):
+        """Returns (reader, writer, reused)"""
+        idle = self._idle.get(address, [])
+        while idle:
+            reader, writer, released_at = idle.pop()
+            if reader.at_eof() or writer.is_closing() or time.monotonic() - released_at > self.idle_timeout:
+                writer.close()
+                continue
+            return reader, writer, True
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), EDGE_CONNECT_TIMEOUT)
+        return reader, writer, False
+
+    def release(self, address, reader, writer):
+        idle = self._idle.setdefault(address, [])
+        if len(idle) >= self.max_idle or writer.is_closing():
+            writer.close()
+            return
+        idle.append((reader, writer, time.monotonic()))
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer, _ in idle:
+                writer.close()
+        self._idle.clear()
+
+
+async def read_head(reader, timeout):
+    """Read a request/response head. Returns (start_line, [(name, value), ...]) or None on EOF."""
+    try:
+        data = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise ProxyError(400, 'Bad Request')
+    except asyncio.LimitOverrunError:
+        raise ProxyError(431, 'Request Header Fields Too Large')
+
+    lines = data[:-4].decode('latin-1').split('\r\n')
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if not sep:
+            raise ProxyError(400, 'Bad Request')
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def get_header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def connection_tokens(headers):
+    value = get_header(headers, 'Connection') or ''
+    return {token.strip().lower() for token in value.split(',') if token.strip()}
+
+
+def strip_hop_by_hop(headers):
+    drop = HOP_BY_HOP | connection_tokens(headers)
+    return [(k, v) for k, v in headers if k.lower() not in drop]
+
+
+def serialize_head(start_line, headers):
+    lines = [start_line] + [f"{k}: {v}" for k, v in headers]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def relay_exact(reader, writer, length):
+    remaining = length
+    while remaining > 0:
+        chunk = await asyncio.wait_for(reader.read(min(remaining, CHUNK_SIZE)), EDGE_READ_TIMEOUT)
+        if not chunk:
+            raise ConnectionError("Connection closed mid-body")
+        writer.write(chunk)
+        await writer.drain()
+        remaining -= len(chunk)
+
+
+async def relay_chunked(reader, writer):
+    """Pass a chunked body through unchanged, including trailers"""
+    while True:
+        size_line = await asyncio.wait_for(reader.readuntil(b'\r\n'), EDGE_READ_TIMEOUT)
+        writer.write(size_line)
+        size = int(size_line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            while True:
+                trailer = await asyncio.wait_for(reader.readuntil(b'\r\n'), EDGE_READ_TIMEOUT)
+                writer.write(trailer)
+                if trailer == b'\r\n':
+                    await writer.drain()
+                    return
+        await relay_exact(reader, writer, size + 2)
+
+
+async def relay_until_eof(reader, writer):
+    while True:
+        chunk = await asyncio.wait_for(reader.read(CHUNK_SIZE), EDGE_READ_TIMEOUT)
+        if not chunk:
+            return
+        writer.write(chunk)
+        await writer.drain()
+
+
+async def relay_body(reader, writer, headers):
+    """Stream a Content-Length or chunked body. Returns False if neither framing is present."""
+    if 'chunked' in (get_header(headers, 'Transfer-Encoding') or '').lower():
+        await relay_chunked(reader, writer)
+        return True
+    length = get_header(headers, 'Content-Length')
+    if length is not None:
+        await relay_exact(reader, writer, int(length))
+        return True
+    return False
+
+
+async def pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        if writer.can_write_eof() and not writer.is_closing():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
+
+
+class EdgeProxy:
+    """
+    HTTP/1.1 reverse proxy routing by Host header. Bodies are streamed in
+    both directions, upstream connections are pooled, and WebSocket upgrades
+    become a raw bidirectional pipe.
+    """
+
+    def __init__(self, routes, pool=None):
+        self.routes = routes
+        self.pool = pool or UpstreamPool()
+        # address -> monotonic time until which it is skipped, like Nginx's fail_timeout
+        self._down_until = {}
+
+    async def handle_client(self, client_reader, client_writer):
+        peer = client_writer.get_extra_info('peername')
+        client_ip = peer[0] if peer else ''
+        try:
+            while True:
+                head = await read_head(client_reader, EDGE_CLIENT_IDLE_TIMEOUT)
+                if head is None:
+                    break
+                keep_alive = await self.handle_request(head, client_reader, client_writer, client_ip)
+                if not keep_alive:
+                    break
+        except ProxyError as e:
+            await self.send_error(client_writer, e.status, e.reason)
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Edge proxy error: {str(e)}")
+        finally:
+            client_writer.close()
+
+    async def send_error(self, writer, status, reason):
+        body = f"{status} {reason}\n".encode()
+        writer.write(serialize_head(f"HTTP/1.1 {status} {reason}", [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(len(body))),
+            ('Connection', 'close'),
+        ]) + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    def upstream_headers(self, headers, client_ip, upgrade):
+        forwarded = get_header(headers, 'X-Forwarded-For')
+        out = [(k, v) for k, v in strip_hop_by_hop(headers)
+               if k.lower() not in ('x-forwarded-for', 'x-real-ip', 'x-forwarded-host', 'x-forwarded-proto')]
+        out += [
+            ('X-Real-IP', client_ip),
+            ('X-Forwarded-For', f"{forwarded}, {client_ip}" if forwarded else client_ip),
+            ('X-Forwarded-Host', get_header(headers, 'Host') or ''),
+            ('X-Forwarded-Proto', 'http'),
+        ]
+        if upgrade:
+            out += [('Connection', 'Upgrade'), ('Upgrade', get_header(headers, 'Upgrade'))]
+        else:
+            out.append(('Connection', 'keep-alive'))
+        return out
+
+    async def open_upstream(self, upstreams, reuse):
+        """Connect to the first reachable replica. Returns (address, reader, writer, reused)."""
+        now = time.monotonic()
+        healthy = [a for a in upstreams if self._down_until.get(a, 0) <= now]
+        last_error = None
+        for address in healthy or upstreams:
+            try:
+                if reuse:
+                    reader, writer, reused = await self.pool.acquire(address)
+                else:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), EDGE_CONNECT_TIMEOUT)
+                    reused = False
+                return address, reader, writer, reused
+            except (OSError, asyncio.TimeoutError) as e:
+                logger.warning(f"Upstream {address[0]}:{address[1]} unavailable: {str(e)}")
+                self._down_until[address] = time.monotonic() + EDGE_FAIL_TIMEOUT
+                last_error = e
+        raise ProxyError(504 if isinstance(last_error, asyncio.TimeoutError) else 502, 'Bad Gateway')
+
+    async def handle_request(self, head, client_reader, client_writer, client_ip):
+        """Proxy one request. Returns True if the client connection can be reused."""
+        request_line, headers = head
+        try:
+            method, target, version = request_line.split(' ', 2)
+        except ValueError:
+            raise ProxyError(400, 'Bad Request')
+
+        upstreams = self.routes.lookup(get_header(headers, 'Host') or '')
+        if not upstreams:
+            raise ProxyError(404, 'Not Found')
+
+        client_tokens = connection_tokens(headers)
+        if version == 'HTTP/1.0':
+            client_keep_alive = 'keep-alive' in client_tokens
+        else:
+            client_keep_alive = 'close' not in client_tokens
+        upgrade = 'upgrade' in client_tokens and get_header(headers, 'Upgrade') is not None
+        has_body = get_header(headers, 'Content-Length') not in (None, '0') or get_header(headers, 'Transfer-Encoding')
+
+        request_head = serialize_head(f"{method} {target} HTTP/1.1", self.upstream_headers(headers, client_ip, upgrade))
+
+        # A pooled connection may have been closed by the upstream while idle;
+        # bodiless requests are safe to retry once on a fresh connection.
+        for attempt in range(2):
+            address, up_reader, up_writer, reused = await self.open_upstream(upstreams, reuse=not upgrade and attempt == 0)
+            try:
+                up_writer.write(request_head)
+                await up_writer.drain()
+                if has_body:
+                    await relay_body(client_reader, up_writer, headers)
+
+                response = await read_head(up_reader, EDGE_READ_TIMEOUT)
+                while response and response[0].split(' ', 2)[1].startswith('1') and response[0].split(' ', 2)[1] != '101':
+                    # Interim response such as 100 Continue
+                    client_writer.write(serialize_head(*response))
+                    await client_writer.drain()
+                    response = await read_head(up_reader, EDGE_READ_TIMEOUT)
+                if response is None:
+                    raise ConnectionError("Upstream closed the connection")
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                up_writer.close()
+                if reused and not has_body and attempt == 0:
+                    continue
+                logger.warning(f"Upstream {address[0]}:{address[1]} failed: {str(e)}")
+                raise ProxyError(502, 'Bad Gateway')
+            except asyncio.TimeoutError:
+                up_writer.close()
+                raise ProxyError(504, 'Gateway Timeout')
+
+        status_line, response_headers = response
+        status = status_line.split(' ', 2)[1]
+
+        if status == '101' and upgrade:
+            client_writer.write(serialize_head(status_line, response_headers))
+            await client_writer.drain()
+            await self.tunnel(client_reader, client_writer, up_reader, up_writer)
+            return False
+
+        upstream_tokens = connection_tokens(response_headers)
+        upstream_reusable = 'close' not in upstream_tokens and not status_line.startswith('HTTP/1.0')
+        no_body = method == 'HEAD' or status in ('204', '304')
+        framed = no_body or get_header(response_headers, 'Content-Length') is not None or \
+            'chunked' in (get_header(response_headers, 'Transfer-Encoding') or '').lower()
+        if not framed:
+            # Body runs until the upstream closes, so the client can't reuse its connection either
+            client_keep_alive = upstream_reusable = False
+
+        out_headers = strip_hop_by_hop(response_headers)
+        out_headers.append(('Connection', 'keep-alive' if client_keep_alive else 'close'))
+        client_writer.write(serialize_head(status_line, out_headers))
+        await client_writer.drain()
+
+        try:
+            if not no_body and not await relay_body(up_reader, client_writer, response_headers):
+                await relay_until_eof(up_reader, client_writer)
+        except Exception:
+            up_writer.close()
+            raise
+
+        if upstream_reusable:
+            self.pool.release(address, up_reader, up_writer)
+        else:
+            up_writer.close()
+        return client_keep_alive
+
+    async def tunnel(self, client_reader, client_writer, up_reader, up_writer):
+        """Pipe an upgraded (WebSocket) connection until either side closes"""
+        tasks = [
+            asyncio.ensure_future(pipe(client_reader, up_writer)),
+            asyncio.ensure_future(pipe(up_reader, client_writer)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            up_writer.close()
+
+
+async def refresh_routes(routes, interval, wakeup):
+    """Reload the routing table from the database every interval seconds, or as soon as wakeup is set"""
+    while True:
+        try:
+            routes.replace(await sync_to_async(load_routes, thread_sensitive=False)())
+        except Exception as e:
+            logger.error(f"Failed to refresh edge routes: {str(e)}")
+        try:
+            await asyncio.wait_for(wakeup.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+
+async def serve(host, port, refresh_interval=5):
+    routes = EdgeRoutes()
+    proxy = EdgeProxy(routes)
+    wakeup = asyncio.Event()
+    if hasattr(signal, 'SIGHUP'):
+        # `kill -HUP` picks up a new deployment immediately
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, wakeup.set)
+    refresher = asyncio.ensure_future(refresh_routes(routes, refresh_interval, wakeup))
+    server = await asyncio.start_server(proxy.handle_client, host, port, limit=MAX_HEAD_SIZE)
+    logger.info(f"Edge proxy listening on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        refresher.cancel()
+        proxy.pool.close()
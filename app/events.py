@@ -0,0 +1,165 @@
+"""
+Per-user dashboard event stream (Server-Sent Events).
+
+The platform runs under WSGI, so a stream must not hold a worker open.
+Each response sends what changed since the client's cursor and ends; the
+browser's EventSource reconnects after the `retry` interval, sending the
+cursor back as its Last-Event-ID.
+
+Nothing is kept in the process: the cursor itself records how far the
+client has got (a timestamp, a digest of the deploy states it was sent
+and the offset reached in each project's log), and every request reads
+the current state from the database and the log files. Any worker can
+therefore answer any request, and a dashboard costs two queries per
+retry interval however many widgets it shows.
+"""
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DjangoProject, ServerResource
+from .resource_sampler import RESOURCE_SAMPLE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# How long the browser waits before asking again, in milliseconds
+EVENT_STREAM_RETRY_MS = getattr(settings, 'EVENT_STREAM_RETRY_MS', 3000)
+# Rows are timestamped before they commit, so look back a little past the
+# cursor; status and metrics events carry whole state, so a repeat is harmless
+EVENT_CURSOR_OVERLAP = 2
+LOG_READ_LIMIT = 64 * 1024
+LOG_REPLAY_LINES = 50
+# Bytes of an existing log shown to a client that hasn't seen it yet
+LOG_FIRST_READ = LOG_READ_LIMIT // 16
+
+
+def format_cursor(moment, deploy_digest, log_offsets):
+    """'<ms>.<deploy digest>.<project>:<offset>,...' sent as the SSE event id"""
+    offsets = ','.join(f"{project_id}:{offset}" for project_id, offset in sorted(log_offsets.items()))
+    return f"{int(moment.timestamp() * 1000)}.{deploy_digest}.{offsets}"
+
+
+def parse_cursor(value):
+    """(since, deploy digest, {project_id: log offset}), or None for a new or unreadable cursor"""
+    try:
+        millis, deploy_digest, offsets = (value or '').split('.', 2)
+        since = datetime.fromtimestamp(int(millis) / 1000, tz=dt_timezone.utc)
+        log_offsets = {}
+        for item in filter(None, offsets.split(',')):
+            project_id, offset = item.split(':')
+            log_offsets[int(project_id)] = int(offset)
+    except (ValueError, OverflowError, OSError):
+        return None
+    return since, deploy_digest, log_offsets
+
+
+def _deploy_digest(deploys):
+    encoded = json.dumps(deploys, sort_keys=True).encode()
+    return hashlib.md5(encoded, usedforsecurity=False).hexdigest()[:12]
+
+
+def poll_events(user_id, cursor=None):
+    """
+    Events for `user_id` since `cursor` as ([(event, data)], next cursor).
+    Without a cursor the current state of everything is sent.
+    """
+    now = timezone.now()
+    previous = parse_cursor(cursor)
+    since, sent_digest, log_offsets = previous if previous else (None, None, {})
+
+    events = []
+    projects = list(DjangoProject.objects.filter(user_id=user_id).select_related('user', 'status'))
+
+    deploys = [
+        {'project_id': p.id, 'deployment_status': p.deployment_status, 'is_active': p.is_active}
+        for p in projects
+    ]
+    digest = _deploy_digest(deploys)
+    if digest != sent_digest:
+        events.extend(('deploy', deploy) for deploy in deploys)
+
+    overlap = since - timedelta(seconds=EVENT_CURSOR_OVERLAP) if since else None
+    next_offsets = {}
+    for project in projects:
+        status = getattr(project, 'status', None)
+        if status is not None and (overlap is None or status.changed_at > overlap):
+            data = status.as_dict()
+            data.update({'project_id': project.id, 'changed_at': status.changed_at.isoformat()})
+            if data.get('exited_at'):
+                data['exited_at'] = data['exited_at'].isoformat()
+            events.append(('status', data))
+
+        lines, next_offsets[project.id] = _read_log(project, log_offsets.get(project.id))
+        if lines:
+            events.append(('log', {'project_id': project.id, 'lines': lines}))
+
+    # Only rows from the last couple of sampling rounds, via the (user, recorded_at) index
+    window = now - timedelta(seconds=2 * RESOURCE_SAMPLE_INTERVAL)
+    samples = (
+        ServerResource.objects
+        .filter(user_id=user_id, recorded_at__gte=max(window, overlap) if overlap else window,
+                django_project__isnull=False)
+        .order_by('recorded_at')
+    )
+    latest = {sample.django_project_id: sample for sample in samples}
+    for sample in latest.values():
+        events.append(('metrics', {
+            'project_id': sample.django_project_id,
+            'cpu_usage': sample.cpu_usage,
+            'memory_usage': sample.memory_usage,
+            'memory_pss': sample.memory_pss,
+            'open_connections': sample.open_connections,
+            'disk_usage': sample.disk_usage,
+            'bandwidth_usage': sample.bandwidth_usage,
+            'over_limit': sample.is_over_limit(),
+            'sampled_at': sample.recorded_at.isoformat(),
+        }))
+
+    return events, format_cursor(now, digest, next_offsets)
+
+
+def _log_file(project):
+    if not project.project_folder:
+        return None
+    safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
+    return os.path.join(project.project_folder, f'{project.user.username}_{safe_name}.log')
+
+
+def _read_log(project, offset):
+    """
+    Complete lines appended to the project's main log after `offset`, and
+    the offset to resume from. A missing offset (or a truncated log)
+    starts from the last few KB.
+    """
+    log_file = _log_file(project)
+    try:
+        size = os.path.getsize(log_file) if log_file else 0
+    except OSError:
+        return [], 0
+
+    first_look = offset is None or size < offset
+    if first_look:
+        offset = max(0, size - LOG_FIRST_READ)
+    if size == offset:
+        return [], offset
+
+    start = max(offset, size - LOG_READ_LIMIT)
+    try:
+        with open(log_file, 'rb') as f:
+            f.seek(start)
+            data = f.read(size - start)
+    except OSError:
+        return [], offset
+
+    end = data.rfind(b'\n')
+    if end < 0:
+        # Only part of a line so far; send it once it is complete
+        return [], offset
+    lines = data[:end].split(b'\n')
+    if start > 0 and (first_look or start > offset):
+        lines = lines[1:]  # starts mid-line
+    return [line.decode('utf-8', 'replace') for line in lines][-LOG_REPLAY_LINES:], start + end + 1
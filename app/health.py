@@ -0,0 +1,299 @@
+"""
+HTTP health probes for every tenant upstream.
+
+One asyncio process probes each DjangoProject replica and running
+DeployedProject with a HEAD request on a kept-alive connection. Probes
+are spread over the interval with jitter so thousands of upstreams don't
+fire at once, and results are written to UpstreamHealth in batches.
+Run it with `manage.py run_health_prober`.
+"""
+import heapq
+import random
+import asyncio
+import logging
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import DjangoProject, DeployedProject, UpstreamHealth
+from .edge_proxy import ProxyError, read_head, connection_tokens
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL = getattr(settings, 'HEALTH_CHECK_INTERVAL', 30)
+HEALTH_CHECK_TIMEOUT = getattr(settings, 'HEALTH_CHECK_TIMEOUT', 5)
+HEALTH_CHECK_PATH = getattr(settings, 'HEALTH_CHECK_PATH', '/')
+HEALTH_CHECK_CONCURRENCY = getattr(settings, 'HEALTH_CHECK_CONCURRENCY', 256)
+# Consecutive failed probes before an upstream is marked down
+HEALTH_FAILURE_THRESHOLD = getattr(settings, 'HEALTH_FAILURE_THRESHOLD', 3)
+# Idle connections kept for reuse; beyond this probes reconnect, to stay under the fd limit
+HEALTH_MAX_IDLE_CONNECTIONS = getattr(settings, 'HEALTH_MAX_IDLE_CONNECTIONS', 768)
+HEALTH_JITTER = 0.1
+HEALTH_FLUSH_INTERVAL = 5
+HEALTH_REFRESH_INTERVAL = 60
+
+
+class Target:
+    def __init__(self, host, port, host_header, django_project_id=None, deployed_project_id=None):
+        self.host = host
+        self.port = port
+        self.host_header = host_header
+        self.django_project_id = django_project_id
+        self.deployed_project_id = deployed_project_id
+
+    @property
+    def upstream(self):
+        return f"{self.host}:{self.port}"
+
+
+def load_targets():
+    """{upstream: Target} for every deployed replica and running GitHub project"""
+    targets = {}
+    try:
+        projects = DjangoProject.objects.filter(deployment_status='deployed').prefetch_related('port_leases')
+        for project in projects:
+            host_header = project.domain_name or project.custom_domain or 'localhost'
+            for lease in project.port_leases.all():
+                target = Target(lease.host, lease.port, host_header, django_project_id=project.id)
+                targets[target.upstream] = target
+
+        for project in DeployedProject.objects.filter(running=True):
+            target = Target('127.0.0.1', project.port, project.subdomain, deployed_project_id=project.id)
+            targets[target.upstream] = target
+
+        # Forget upstreams that are no longer deployed
+        UpstreamHealth.objects.exclude(upstream__in=list(targets)).delete()
+    finally:
+        close_old_connections()
+    return targets
+
+
+def store_results(results, targets):
+    """Apply a batch of probe results {upstream: [(ok, status_code, latency_ms, error, checked_at), ...]}"""
+    try:
+        rows = {row.upstream: row for row in UpstreamHealth.objects.filter(upstream__in=list(results))}
+        created, updated = [], []
+
+        for upstream, probes in results.items():
+            target = targets.get(upstream)
+            if target is None:
+                continue
+            row = rows.get(upstream)
+            if row is None:
+                row = UpstreamHealth(upstream=upstream)
+                created.append(row)
+            else:
+                updated.append(row)
+
+            row.django_project_id = target.django_project_id
+            row.deployed_project_id = target.deployed_project_id
+            for ok, status_code, latency_ms, error, checked_at in probes:
+                row.checks += 1
+                row.status_code = status_code
+                row.latency_ms = latency_ms
+                row.checked_at = checked_at
+                if ok:
+                    row.successes += 1
+                    row.consecutive_failures = 0
+                    row.last_error = ''
+                    status = 'up'
+                else:
+                    row.consecutive_failures += 1
+                    row.last_error = error[:500]
+                    status = 'down' if row.consecutive_failures >= HEALTH_FAILURE_THRESHOLD else row.status
+
+                if status != row.status:
+                    logger.info(f"Upstream {upstream} is now {status}")
+                    row.status = status
+                    row.changed_at = checked_at
+
+        if created:
+            UpstreamHealth.objects.bulk_create(created, ignore_conflicts=True)
+        if updated:
+            UpstreamHealth.objects.bulk_update(updated, [
+                'django_project', 'deployed_project', 'status', 'status_code', 'latency_ms',
+                'consecutive_failures', 'checks', 'successes', 'last_error', 'checked_at', 'changed_at',
+            ], batch_size=500)
+    finally:
+        close_old_connections()
+
+
+def summarize_health(checks):
+    """Roll up a project's UpstreamHealth rows (one per replica) for display"""
+    checks = [check for check in checks if check.checks]
+    if not checks:
+        return {'status': 'unknown', 'availability': None, 'latency_ms': None}
+    up = sum(1 for check in checks if check.status == 'up')
+    if up == len(checks):
+        status = 'up'
+    elif up:
+        status = 'degraded'
+    else:
+        status = 'down' if any(check.status == 'down' for check in checks) else 'unknown'
+    latencies = [check.latency_ms for check in checks if check.status == 'up' and check.latency_ms is not None]
+    return {
+        'status': status,
+        'availability': round(sum(c.successes for c in checks) / sum(c.checks for c in checks) * 100, 2),
+        'latency_ms': round(sum(latencies) / len(latencies), 1) if latencies else None,
+        'replicas_up': up,
+        'replicas': len(checks),
+    }
+
+
+def raise_fd_limit():
+    """
+    Lift the soft open-file limit to the hard limit; one socket per
+    in-flight or idle probe. Returns the limit, or None where there are
+    no rlimits (Windows).
+    """
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not raise open file limit from {soft}: {str(e)}")
+            return soft
+        return hard
+    return soft
+
+
+class HealthProber:
+    def __init__(self, interval=HEALTH_CHECK_INTERVAL, timeout=HEALTH_CHECK_TIMEOUT,
+                 concurrency=HEALTH_CHECK_CONCURRENCY):
+        self.interval = interval
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.targets = {}
+        self.results = {}
+        self._idle = {}
+        self._schedule = []
+        self._scheduled = set()
+        self._tasks = set()
+
+    def set_targets(self, targets):
+        now = asyncio.get_running_loop().time()
+        self.targets = targets
+        for upstream in targets:
+            if upstream not in self._scheduled:
+                # Spread new upstreams over the whole interval
+                heapq.heappush(self._schedule, (now + random.uniform(0, self.interval), upstream))
+                self._scheduled.add(upstream)
+        for upstream in [u for u in self._idle if u not in targets]:
+            self._idle.pop(upstream)[1].close()
+
+    async def _request(self, target):
+        """Send one HEAD request; returns the status code"""
+        connection = self._idle.pop(target.upstream, None)
+        reused = connection is not None
+        if connection is None:
+            connection = await asyncio.open_connection(target.host, target.port)
+        reader, writer = connection
+
+        try:
+            writer.write(
+                f"HEAD {HEALTH_CHECK_PATH} HTTP/1.1\r\nHost: {target.host_header}\r\n"
+                f"User-Agent: platform-health-check\r\nAccept: */*\r\n\r\n".encode('latin-1')
+            )
+            await writer.drain()
+            head = await read_head(reader, self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if reused:
+                # The kept-alive connection went stale; try once on a fresh one
+                return await self._request(target)
+            raise
+        except BaseException:
+            writer.close()
+            raise
+
+        if head is None:
+            writer.close()
+            if reused:
+                return await self._request(target)
+            raise ConnectionResetError("Connection closed without a response")
+
+        start_line, headers = head
+        status_code = int(start_line.split(' ', 2)[1])
+        tokens = connection_tokens(headers)
+        keep_alive = 'close' not in tokens and (start_line.startswith('HTTP/1.1') or 'keep-alive' in tokens)
+        if keep_alive and len(self._idle) < HEALTH_MAX_IDLE_CONNECTIONS:
+            self._idle[target.upstream] = connection
+        else:
+            writer.close()
+        return status_code
+
+    async def probe(self, target, semaphore):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            started = loop.time()
+            try:
+                status_code = await asyncio.wait_for(self._request(target), self.timeout)
+                ok = status_code < 500
+                error = '' if ok else f"HTTP {status_code}"
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ProxyError, ValueError, IndexError) as e:
+                status_code, ok = None, False
+                error = str(e) or e.__class__.__name__
+            latency_ms = round((loop.time() - started) * 1000, 2)
+
+        self.results.setdefault(target.upstream, []).append((ok, status_code, latency_ms, error, timezone.now()))
+
+        if target.upstream in self.targets:
+            due = loop.time() + self.interval * random.uniform(1 - HEALTH_JITTER, 1 + HEALTH_JITTER)
+            heapq.heappush(self._schedule, (due, target.upstream))
+        else:
+            self._scheduled.discard(target.upstream)
+
+    async def flush(self):
+        if not self.results:
+            return
+        results, self.results = self.results, {}
+        try:
+            await asyncio.to_thread(store_results, results, self.targets)
+        except Exception as e:
+            logger.error(f"Could not store health results: {str(e)}")
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                self.set_targets(await asyncio.to_thread(load_targets))
+            except Exception as e:
+                logger.error(f"Could not load health check targets: {str(e)}")
+            await asyncio.sleep(HEALTH_REFRESH_INTERVAL)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(HEALTH_FLUSH_INTERVAL)
+            await self.flush()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        background = [asyncio.create_task(self._refresh_loop()), asyncio.create_task(self._flush_loop())]
+        try:
+            while True:
+                now = loop.time()
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, upstream = heapq.heappop(self._schedule)
+                    target = self.targets.get(upstream)
+                    if target is None:
+                        self._scheduled.discard(upstream)
+                        continue
+                    task = asyncio.create_task(self.probe(target, semaphore))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+                delay = self._schedule[0][0] - now if self._schedule else 1.0
+                await asyncio.sleep(min(max(delay, 0.01), 1.0))
+        finally:
+            for task in background + list(self._tasks):
+                task.cancel()
+            await self.flush()
+            for _, writer in self._idle.values():
+                writer.close()
@@ -0,0 +1,144 @@
+"""
+Non-blocking logging for the platform.
+
+QueuedFileHandler only puts records on an in-memory queue; a
+QueueListener thread owns the file and does all formatting and disk
+I/O, so a request thread never waits on the log file. When the queue is
+full, records are dropped and counted rather than blocking.
+
+Many processes append to the same file (web workers, collectors, node
+agents), so none of them rotates it: the file is opened in append mode
+through a WatchedFileHandler, which reopens it when logrotate moves it
+away. Rotate it externally, e.g. /etc/logrotate.d/platform:
+
+    /path/to/project/deployment.log {
+        size 10M
+        rotate 5
+        compress
+        delaycompress
+        missingok
+        notifempty
+    }
+
+log_context() tags every record logged inside it with project, user
+and stage fields, which JSONFormatter writes out as keys.
+"""
+import os
+import copy
+import json
+import queue
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+CONTEXT_FIELDS = ('project', 'user', 'stage')
+
+_log_context = contextvars.ContextVar('log_context', default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (project=, user=, stage=) to records logged in this block"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    Log file written by a background thread and rotated externally. Takes
+    the same filename/encoding arguments as WatchedFileHandler, so it can
+    be configured from LOGGING like any other handler.
+    """
+
+    def __init__(self, filename, encoding='utf-8', queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = WatchedFileHandler(filename, encoding=encoding, delay=True)
+        self.dropped = 0
+        self._listener = None
+        self._owner_pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread
+        self.target.setFormatter(fmt)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self.target.setLevel(level)
+
+    def _ensure_listener(self):
+        if self._owner_pid == os.getpid():
+            return
+        with self._start_lock:
+            # Threads don't survive fork; each worker starts its own writer
+            if self._owner_pid == os.getpid():
+                return
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._owner_pid = os.getpid()
+
+    def prepare(self, record):
+        """
+        Resolve everything that can't wait for the writer thread: the
+        message arguments, the traceback and the current log_context.
+        Works on a copy, as other handlers still see the original.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for field, value in _log_context.get().items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, value)
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None and self._owner_pid == os.getpid():
+            listener.stop()
+            if self.dropped:
+                self.target.handle(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f"{self.dropped} log records dropped because the queue was full",
+                }))
+        self.target.close()
+        super().close()
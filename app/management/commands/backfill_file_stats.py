@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Website, DjangoProject, UserFile, file_stats
+from app.summary import clear_user_summaries
+
+BATCH_SIZE = 200
+
+
+class Command(BaseCommand):
+    help = "Store file_size and content_hash for uploads saved before they were recorded on upload"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Recompute rows that already have a size")
+
+    def backfill(self, model, field_name, fields=('file_size', 'content_hash')):
+        rows = model.objects.exclude(**{field_name: ''})
+        if not self.recompute:
+            rows = rows.filter(file_size__isnull=True)
+
+        updated, missing, batch = 0, 0, []
+        for row in rows.only('id', field_name).iterator(chunk_size=BATCH_SIZE):
+            field_file = getattr(row, field_name)
+            try:
+                size, content_hash = file_stats(field_file)
+            except (OSError, ValueError):
+                missing += 1
+                continue
+            finally:
+                field_file.close()
+            row.file_size = size
+            if 'content_hash' in fields:
+                row.content_hash = content_hash
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        self.stdout.write(f"{model.__name__}: {updated} updated, {missing} file(s) missing")
+
+    def handle(self, *args, **options):
+        self.recompute = options['all']
+        self.backfill(Website, 'uploaded_file')
+        self.backfill(DjangoProject, 'project_file')
+        self.backfill(UserFile, 'file', fields=('file_size',))
+        # bulk_update sends no signals
+        clear_user_summaries()
@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import time
+import subprocess
+
+from django.core.management.base import BaseCommand
+
+from app.routing import (
+    NGINX_LOG_DIR, NGINX_CACHE_PATH, RouteTable, render_tenant_server, render_upstream, upstream_name,
+)
+
+NGINX_MAIN_CONF = """worker_processes 1;
+pid {prefix}/nginx.pid;
+error_log {prefix}/logs/error.log;
+events {{ worker_connections 1024; }}
+http {{
+    include {include};
+}}
+"""
+
+
+def render_legacy_site(tenant, port, log_dir):
+    """One server block per tenant, as sites-available looked before the routing table"""
+    return f"""{render_upstream(tenant, [f"127.0.0.1:{port}"])}
+server {{
+    listen 80;
+    server_name {tenant}.bench.test;
+    access_log {log_dir}/{tenant}_access.log;
+    error_log {log_dir}/{tenant}_error.log;
+    location / {{
+        proxy_pass http://{upstream_name(tenant)};
+        proxy_set_header Host $host;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection "upgrade";
+    }}
+    location /static/ {{
+        alias /var/www/{tenant}/staticfiles/;
+        expires 30d;
+    }}
+    location /media/ {{
+        alias /var/www/{tenant}/media/;
+        expires 30d;
+    }}
+}}
+"""
+
+
+def dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class Command(BaseCommand):
+    help = "Compare config write and `nginx -t` time for per-tenant server files vs the shared routing table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=10000)
+        parser.add_argument('--nginx', default=shutil.which('nginx') or '', help="Path to the nginx binary")
+        parser.add_argument('--keep', action='store_true', help="Keep the generated configs for inspection")
+
+    def nginx_test(self, nginx, prefix, conf):
+        """Parse-and-validate time, the bulk of a reload on a config this size"""
+        if not nginx:
+            return None
+        started = time.perf_counter()
+        result = subprocess.run([nginx, '-t', '-q', '-p', prefix, '-c', conf], capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            self.stderr.write(result.stderr.strip()[:500])
+            return None
+        return elapsed
+
+    def handle(self, *args, **options):
+        tenants = options['tenants']
+        nginx = options['nginx']
+        root = tempfile.mkdtemp(prefix='nginx-bench-')
+        tenant_names = [f"t{i:05d}" for i in range(tenants)]
+
+        try:
+            # Before: one file per tenant
+            legacy = os.path.join(root, 'legacy')
+            sites = os.path.join(legacy, 'sites')
+            os.makedirs(sites)
+            os.makedirs(os.path.join(legacy, 'logs'))
+            for i, tenant in enumerate(tenant_names):
+                with open(os.path.join(sites, tenant), 'w') as f:
+                    f.write(render_legacy_site(tenant, 10000 + i, os.path.join(legacy, 'logs')))
+            legacy_conf = os.path.join(legacy, 'nginx.conf')
+            with open(legacy_conf, 'w') as f:
+                f.write(NGINX_MAIN_CONF.format(prefix=legacy, include=f"{sites}/*"))
+
+            started = time.perf_counter()
+            with open(os.path.join(sites, 'new-tenant'), 'w') as f:
+                f.write(render_legacy_site('new-tenant', 9999, os.path.join(legacy, 'logs')))
+            legacy_write = time.perf_counter() - started
+
+            # After: one wildcard server plus the map/upstream tables
+            mapped = os.path.join(root, 'map')
+            table = RouteTable(os.path.join(mapped, 'tenants'))
+            os.makedirs(os.path.join(mapped, 'logs'))
+            routes = {
+                f"{tenant}.bench.test": {'tenant': tenant, 'servers': [f"127.0.0.1:{10000 + i}"]}
+                for i, tenant in enumerate(tenant_names)
+            }
+            table.write(routes)
+            server_conf = os.path.join(mapped, 'tenants.conf')
+            with open(server_conf, 'w') as f:
+                f.write(
+                    render_tenant_server(table.routes_dir)
+                    .replace(NGINX_LOG_DIR, os.path.join(mapped, 'logs'))
+                    .replace(NGINX_CACHE_PATH, os.path.join(mapped, 'cache'))
+                )
+            mapped_conf = os.path.join(mapped, 'nginx.conf')
+            with open(mapped_conf, 'w') as f:
+                f.write(NGINX_MAIN_CONF.format(prefix=mapped, include=server_conf))
+
+            started = time.perf_counter()
+            table.update(lambda current: current.update({
+                'new-tenant.bench.test': {'tenant': 'new-tenant', 'servers': ['127.0.0.1:9999']}
+            }))
+            mapped_write = time.perf_counter() - started
+
+            legacy_test = self.nginx_test(nginx, legacy, legacy_conf)
+            mapped_test = self.nginx_test(nginx, mapped, mapped_conf)
+
+            self.stdout.write(f"Tenants: {tenants}")
+            self.stdout.write(
+                f"Per-tenant files: {tenants} files, {dir_size(sites) / 1024:.0f} KB, "
+                f"add tenant {legacy_write * 1000:.1f} ms"
+                + (f", nginx -t {legacy_test:.2f} s" if legacy_test is not None else "")
+            )
+            self.stdout.write(
+                f"Routing table:    {len(os.listdir(table.routes_dir))} files, {dir_size(table.routes_dir) / 1024:.0f} KB, "
+                f"add tenant {mapped_write * 1000:.1f} ms"
+                + (f", nginx -t {mapped_test:.2f} s" if mapped_test is not None else "")
+            )
+            if not nginx:
+                self.stdout.write(self.style.WARNING("nginx not found; pass --nginx to time config parsing"))
+            if options['keep']:
+                self.stdout.write(f"Configs kept in {root}")
+        finally:
+            if not options['keep']:
+                shutil.rmtree(root, ignore_errors=True)
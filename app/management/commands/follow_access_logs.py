@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from app.access_logs import ACCESS_LOG_FLUSH_INTERVAL, ACCESS_LOG_POLL_INTERVAL, follow_access_logs
+from app.routing import NGINX_LOG_DIR
+
+
+class Command(BaseCommand):
+    help = "Tail the tenant Nginx access logs into per-minute traffic, bandwidth and latency totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log-dir', default=NGINX_LOG_DIR)
+        parser.add_argument('--interval', type=float, default=ACCESS_LOG_POLL_INTERVAL, help="Seconds between reads")
+        parser.add_argument(
+            '--flush-interval', type=float, default=ACCESS_LOG_FLUSH_INTERVAL,
+            help="Seconds between writes to the database"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Following tenant access logs in {options['log_dir']}")
+        try:
+            follow_access_logs(options['log_dir'], options['interval'], options['flush_interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Website, DjangoProject, DeployedProject
+from app.routing import route_table, install_tenant_server
+from app.utils import BASE_DOMAIN, NGINX_SITES_AVAILABLE, remove_legacy_nginx_site, tenant_key, website_hostnames
+from app.views import MAIN_DOMAIN
+
+
+def collect_routes():
+    """
+    Routing table rebuilt from the deployments recorded in the database,
+    with the same hostnames and tenant names the deploy paths route
+    """
+    routes = {}
+
+    # Static sites, as deploy_website routes them through set_site_route
+    for website in Website.objects.filter(is_active=True, domain_name__isnull=False).exclude(domain_name=''):
+        site = website.domain_name.split('.', 1)[0]
+        for hostname in website_hostnames(site, website.custom_domain):
+            routes[hostname] = {'tenant': site, 'kind': 'site', 'servers': []}
+
+    projects = DjangoProject.objects.filter(deployment_status='deployed').prefetch_related('port_leases')
+    for project in projects:
+        servers = [f"{lease.host}:{lease.port}" for lease in sorted(project.port_leases.all(), key=lambda l: l.replica)]
+        if not servers:
+            continue
+        tenant = tenant_key(project)
+        route = {'tenant': tenant, 'servers': servers}
+        if project.get_cache_ttl():
+            route['cache_ttl'] = project.get_cache_ttl()
+        hostnames = {f"{tenant}.{BASE_DOMAIN}", project.domain_name, project.custom_domain}
+        for hostname in hostnames:
+            if hostname:
+                routes[hostname.strip().lower()] = dict(route)
+
+    for project in DeployedProject.objects.filter(running=True):
+        routes[f"{project.name}.{MAIN_DOMAIN}"] = {'tenant': project.name, 'servers': [f"127.0.0.1:{project.port}"]}
+
+    return routes
+
+
+class Command(BaseCommand):
+    help = "Install the wildcard tenant server and (optionally) rebuild the shared routing table from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help="Replace the routing table with the deployments recorded in the database"
+        )
+        parser.add_argument(
+            '--remove-legacy', action='store_true',
+            help=f"Delete per-tenant server files in {NGINX_SITES_AVAILABLE} for every routed hostname"
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            routes = collect_routes()
+
+            def replace(current):
+                current.clear()
+                current.update(routes)
+
+            route_table.update(replace)
+            self.stdout.write(f"Routing table rebuilt with {len(routes)} hostname(s)")
+
+        if options['remove_legacy']:
+            for hostname in route_table.load():
+                remove_legacy_nginx_site(hostname)
+                remove_legacy_nginx_site(hostname.replace(f".{BASE_DOMAIN}", ""))
+
+        success, message = install_tenant_server()
+        if not success:
+            raise CommandError(message)
+        self.stdout.write(self.style.SUCCESS(message))
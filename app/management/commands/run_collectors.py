@@ -0,0 +1,48 @@
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.metrics import registry
+from app.nodes import refresh_node_stats
+from app.tasks import STATUS_COLLECT_INTERVAL, collect_project_status, collect_user_storage
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Refresh project status and node heartbeats in the background so page views don't have to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=STATUS_COLLECT_INTERVAL,
+            help="Seconds between collection rounds"
+        )
+        parser.add_argument('--once', action='store_true', help="Run one round and exit")
+
+    def run_round(self):
+        collectors = (
+            ('project status', collect_project_status),
+            ('node stats', refresh_node_stats),
+            ('user storage', collect_user_storage),
+        )
+        for name, collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Collector {name} failed: {str(e)}")
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        registry.ensure_flusher()
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            self.run_round()
+            if options['once']:
+                break
+            try:
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,25 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from app.edge_proxy import serve
+
+
+class Command(BaseCommand):
+    help = "Run the built-in asyncio reverse proxy that routes tenant hostnames without Nginx"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=getattr(settings, 'EDGE_PROXY_HOST', '127.0.0.1'))
+        parser.add_argument('--port', type=int, default=getattr(settings, 'EDGE_PROXY_PORT', 8080))
+        parser.add_argument(
+            '--refresh', type=float, default=5,
+            help="Seconds between routing table reloads from the database (SIGHUP reloads immediately)"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Edge proxy listening on {options['host']}:{options['port']}")
+        try:
+            asyncio.run(serve(options['host'], options['port'], options['refresh']))
+        except KeyboardInterrupt:
+            pass
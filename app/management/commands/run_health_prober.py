@@ -0,0 +1,25 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from app.health import (
+    HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT, HEALTH_CHECK_CONCURRENCY, HealthProber, raise_fd_limit
+)
+
+
+class Command(BaseCommand):
+    help = "Probe every deployed tenant upstream over HTTP and record availability in UpstreamHealth"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=HEALTH_CHECK_INTERVAL, help="Seconds between probes of one upstream")
+        parser.add_argument('--timeout', type=float, default=HEALTH_CHECK_TIMEOUT, help="Seconds before a probe counts as failed")
+        parser.add_argument('--concurrency', type=int, default=HEALTH_CHECK_CONCURRENCY, help="Probes in flight at once")
+
+    def handle(self, *args, **options):
+        limit = raise_fd_limit()
+        self.stdout.write(f"Health prober running every {options['interval']}s (open file limit {limit})")
+        prober = HealthProber(options['interval'], options['timeout'], options['concurrency'])
+        try:
+            asyncio.run(prober.run())
+        except KeyboardInterrupt:
+            pass
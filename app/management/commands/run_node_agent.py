@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import hmac
+import logging
+import ipaddress
+import psutil
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.utils import (
+    MEDIA_ROOT,
+    get_local_ip,
+    deploy_django_project,
+    stop_django_project,
+    scale_django_project,
+    check_django_deployment_status,
+    cleanup_django_deployment,
+)
+
+logger = logging.getLogger(__name__)
+
+# Django usernames: letters, digits and @/./+/-/_
+USERNAME_RE = re.compile(r'^[\w.@+-]+\Z')
+
+
+def safe_name(value):
+    """Name with non-alphanumerics replaced by _, as deployment folders use"""
+    return "".join(c if c.isalnum() else "_" for c in value)
+
+
+def valid_username(username):
+    """Usernames end up in folder names, so refuse anything that isn't a plain name"""
+    return bool(USERNAME_RE.match(username)) and username.strip('.') != ''
+
+
+def valid_project_name(project_name):
+    """The control plane sends project names already passed through safe_name()"""
+    return bool(project_name) and safe_name(project_name) == project_name
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def count_running_projects():
+    """Count deployments on this node whose PID file points at a live process"""
+    running = 0
+    if not os.path.isdir(MEDIA_ROOT):
+        return running
+
+    for entry in os.scandir(MEDIA_ROOT):
+        if not entry.is_dir():
+            continue
+        pid_file = os.path.join(entry.path, f"{entry.name}.pid")
+        try:
+            with open(pid_file, 'r') as f:
+                if psutil.pid_exists(int(f.read().strip())):
+                    running += 1
+        except (OSError, ValueError):
+            continue
+    return running
+
+
+class NodeAgentHandler(BaseHTTPRequestHandler):
+    """
+    HTTP API exposing the local start/stop/status operations to the control plane.
+
+    GET  /health                      node capacity for placement
+    POST /deploy?username=&project_name=[&custom_domain=&replicas=]   body: project ZIP
+    POST /scale?username=&project_name=&replicas=
+    POST /stop?username=&project_name=[&cleanup=1]
+    GET  /status?username=&project_name=&domain_name=
+    """
+
+    server_version = 'NodeAgent/1.0'
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        if not token:
+            return True
+        return hmac.compare_digest(self.headers.get('X-Agent-Token', ''), token)
+
+    def _params(self):
+        query = parse_qs(urlparse(self.path).query)
+        return {key: values[0] for key, values in query.items()}
+
+    def _invalid_target(self, params):
+        """Error message if username or project_name can't be used in a folder name, else None"""
+        if not valid_username(params.get('username', '')):
+            return 'Invalid username'
+        if not valid_project_name(params.get('project_name', '')):
+            return 'Invalid project_name'
+        return None
+
+    def do_GET(self):
+        if not self._authorized():
+            return self._send_json({'error': 'Unauthorized'}, 401)
+
+        path = urlparse(self.path).path
+        params = self._params()
+
+        if path == '/health':
+            memory = psutil.virtual_memory()
+            return self._send_json({
+                'ip': get_local_ip(),
+                'total_memory_mb': round(memory.total / (1024 * 1024), 1),
+                'available_memory_mb': round(memory.available / (1024 * 1024), 1),
+                'cpu_count': psutil.cpu_count() or 1,
+                'load_average': os.getloadavg()[0] if hasattr(os, 'getloadavg') else 0.0,
+                'running_projects': count_running_projects(),
+            })
+
+        if path == '/status':
+            error = self._invalid_target(params)
+            if error:
+                return self._send_json({'success': False, 'error': error}, 400)
+            return self._send_json(check_django_deployment_status(
+                params['username'], params['project_name'], params.get('domain_name', '')
+            ))
+
+        return self._send_json({'error': 'Not found'}, 404)
+
+    def do_POST(self):
+        if not self._authorized():
+            return self._send_json({'error': 'Unauthorized'}, 401)
+
+        path = urlparse(self.path).path
+        params = self._params()
+        username = params.get('username')
+        project_name = params.get('project_name')
+
+        if not username or not project_name:
+            return self._send_json({'success': False, 'error': 'username and project_name are required'}, 400)
+        error = self._invalid_target(params)
+        if error:
+            return self._send_json({'success': False, 'error': error}, 400)
+        try:
+            replicas = int(params.get('replicas', 1))
+        except ValueError:
+            return self._send_json({'success': False, 'error': 'replicas must be a number'}, 400)
+
+        if path == '/deploy':
+            return self._deploy(username, project_name, params.get('custom_domain'), replicas)
+
+        if path == '/scale':
+            # The control plane owns the edge Nginx config and has already drained removed replicas
+            return self._send_json(scale_django_project(username, project_name, replicas, configure_nginx=False))
+
+        if path == '/stop':
+            if params.get('cleanup'):
+                cleanup_django_deployment(username, project_name)
+            else:
+                stop_django_project(username, project_name)
+            return self._send_json({'success': True})
+
+        return self._send_json({'error': 'Not found'}, 404)
+
+    def _deploy(self, username, project_name, custom_domain, replicas):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return self._send_json({'success': False, 'error': 'Empty upload'}, 400)
+
+        upload_dir = os.path.realpath(self.server.upload_dir)
+        upload_path = os.path.realpath(os.path.join(upload_dir, f"{safe_name(username)}_{project_name}.zip"))
+        if os.path.dirname(upload_path) != upload_dir:
+            return self._send_json({'success': False, 'error': 'Invalid upload name'}, 400)
+        os.makedirs(upload_dir, exist_ok=True)
+
+        # Stream the upload to disk instead of holding it in memory
+        remaining = length
+        with open(upload_path, 'wb') as f:
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+
+        if remaining:
+            return self._send_json({'success': False, 'error': 'Incomplete upload'}, 400)
+
+        result = deploy_django_project(
+            username, project_name, upload_path, custom_domain, configure_nginx=False, replicas=replicas
+        )
+        return self._send_json(result)
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+def make_server(host, port, token, upload_dir):
+    """Agent HTTP server, not yet serving; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), NodeAgentHandler)
+    server.daemon_threads = True
+    server.token = token
+    server.upload_dir = upload_dir
+    return server
+
+
+class Command(BaseCommand):
+    help = "Run the worker node agent that deploys, stops and reports on Django projects for the control plane"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=getattr(settings, 'NODE_AGENT_HOST', '127.0.0.1'))
+        parser.add_argument('--port', type=int, default=getattr(settings, 'NODE_AGENT_PORT', 9100))
+        parser.add_argument(
+            '--upload-dir',
+            default=os.path.join(settings.MEDIA_ROOT, 'node_uploads'),
+            help="Where uploaded project archives are stored before extraction"
+        )
+
+    def handle(self, *args, **options):
+        token = getattr(settings, 'NODE_AGENT_TOKEN', '')
+        if not token and not is_loopback(options['host']):
+            raise CommandError(
+                f"NODE_AGENT_TOKEN is not set; refusing to listen on {options['host']}, where anyone "
+                "who can reach the agent could deploy code. Set a token or bind to 127.0.0.1."
+            )
+
+        server = make_server(options['host'], options['port'], token, options['upload_dir'])
+        self.stdout.write(f"Node agent listening on {options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
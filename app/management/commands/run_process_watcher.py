@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.tasks import PROCESS_WATCH_REFRESH, ExitWatcher
+
+
+class Command(BaseCommand):
+    help = "Record Django project replica exits as they happen instead of polling PIDs from views"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--refresh', type=float, default=PROCESS_WATCH_REFRESH,
+            help="Seconds between rereads of the pid files to pick up new replicas"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            ExitWatcher(options['refresh']).run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from app.resource_sampler import RESOURCE_SAMPLE_INTERVAL, run_sampler
+
+
+class Command(BaseCommand):
+    help = "Sample CPU, memory and connections of every locally hosted project into ServerResource"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=RESOURCE_SAMPLE_INTERVAL)
+        parser.add_argument('--rounds', type=int, default=None, help="Stop after this many samples")
+
+    def handle(self, *args, **options):
+        try:
+            run_sampler(options['interval'], options['rounds'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from app.access_logs import DEFAULT_TAIL_BYTES, all_tenant_cache_stats
+from app.routing import NGINX_LOG_DIR
+
+
+class Command(BaseCommand):
+    help = "Per-tenant edge cache hit ratio from the Nginx access logs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log-dir', default=NGINX_LOG_DIR)
+        parser.add_argument(
+            '--tail-mb', type=float, default=DEFAULT_TAIL_BYTES / (1024 * 1024),
+            help="How much of the end of each log to read"
+        )
+
+    def handle(self, *args, **options):
+        stats = all_tenant_cache_stats(options['log_dir'], int(options['tail_mb'] * 1024 * 1024))
+        if not stats:
+            self.stdout.write("No tenant access logs found")
+            return
+
+        self.stdout.write(f"{'tenant':<40} {'hits':>8} {'misses':>8} {'bypassed':>9} {'hit ratio':>10}")
+        for tenant, row in sorted(stats.items()):
+            ratio = f"{row['hit_ratio'] * 100:.1f}%" if row['hit_ratio'] is not None else '-'
+            self.stdout.write(f"{tenant:<40} {row['hits']:>8} {row['misses']:>8} {row['bypassed']:>9} {ratio:>10}")
@@ -0,0 +1,402 @@
+"""
+Prometheus text-format metrics for the platform and its tenants.
+
+Every process (gunicorn workers, run_collectors, run_resource_sampler)
+keeps its metrics in memory and a background thread writes them to
+METRICS_DIR/<pid>-<token>.json about once a second. A scrape of /metrics
+merges those files, so it never touches the database and sees values
+from every worker:
+
+- counters and histograms are summed over all files; files of exited
+  processes are folded into dead.json so their counts aren't lost
+- gauges are summed over live processes only
+"""
+import os
+import hmac
+import json
+import time
+import atexit
+import logging
+import tempfile
+import threading
+from bisect import bisect_left
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'platform-metrics'))
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 1.0)
+# Scrapers must send "Authorization: Bearer <token>". Without a token the
+# endpoint is only open with DEBUG on: requests proxied by the local Nginx
+# or edge proxy arrive from loopback, so the client address proves nothing.
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+DEAD_FILE = 'dead.json'
+
+
+def _atomic_write(path, content):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.dirty = True
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = value
+            self.registry.dirty = True
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.registry.dirty = True
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_all(self, values):
+        """Replace every series at once, e.g. {('tenant-a',): 1.0}; series not given are dropped"""
+        with self.registry.lock:
+            self.values = {tuple(str(v) for v in key): value for key, value in values.items()}
+            self.registry.dirty = True
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            # Per-bucket counts (last one is +Inf), then sum
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+            self.registry.dirty = True
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self._thread = None
+        self._reset_process()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.flush)
+
+    def _reset_process(self):
+        self.pid = os.getpid()
+        self.token = f"{self.pid}-{time.time_ns()}"
+        self._thread = None
+        self._written = False
+
+    def _after_fork(self):
+        # A forked worker starts from zero; the parent keeps reporting its own counts
+        self.lock = threading.Lock()
+        for metric in self.metrics.values():
+            metric.values = {}
+        self._reset_process()
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(self, name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labels, buckets))
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{self.token}.json")
+
+    def ensure_flusher(self):
+        """Start the background writer for this process (once)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+        self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            if self.dirty:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            # A process that never recorded anything needs no file; one that
+            # did must write its empty state, or cleared gauges would live on
+            if not self._written and not any(metric.values for metric in self.metrics.values()):
+                return
+            data = {
+                name: [[list(key), value] for key, value in metric.values.items()]
+                for name, metric in self.metrics.items() if metric.values
+            }
+            self.dirty = False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _atomic_write(self.path, json.dumps(data))
+            self._written = True
+        except Exception as e:
+            logger.error(f"Could not write metrics file: {str(e)}")
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _fold_dead_files(self, files):
+        """Merge counters and histograms of exited processes into dead.json"""
+        dead = [f for f in files if not _pid_alive(int(f.split('-', 1)[0]))]
+        if not dead:
+            return
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            dead_path = os.path.join(self.directory, DEAD_FILE)
+            totals = {}
+            self._accumulate(totals, self._read(dead_path), gauges=False)
+            for name in dead:
+                path = os.path.join(self.directory, name)
+                if os.path.exists(path):
+                    self._accumulate(totals, self._read(path), gauges=False)
+            _atomic_write(dead_path, json.dumps({
+                name: [[list(key), value] for key, value in series.items()]
+                for name, series in totals.items()
+            }))
+            for name in dead:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _accumulate(self, totals, data, gauges=True):
+        for name, series in data.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.kind == 'gauge' and not gauges):
+                continue
+            merged = totals.setdefault(name, {})
+            for key, value in series:
+                key = tuple(key)
+                if metric.kind == 'histogram':
+                    current = merged.get(key)
+                    if current is None or len(current) != len(value):
+                        merged[key] = list(value)
+                    else:
+                        merged[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged[key] = merged.get(key, 0) + value
+
+    def collect(self):
+        """Merged {name: {label values: value}} across every process"""
+        self.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        files = [
+            f for f in os.listdir(self.directory)
+            if f.endswith('.json') and f != DEAD_FILE and f.split('-', 1)[0].isdigit()
+        ]
+        try:
+            self._fold_dead_files(files)
+        except Exception as e:
+            logger.error(f"Could not fold metrics of exited processes: {str(e)}")
+
+        totals = {}
+        self._accumulate(totals, self._read(os.path.join(self.directory, DEAD_FILE)))
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') and name != DEAD_FILE and name.split('-', 1)[0].isdigit():
+                self._accumulate(totals, self._read(os.path.join(self.directory, name)))
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format 0.0.4"""
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(totals.get(name, {}).items()):
+                labels = dict(zip(metric.labels, key))
+                if metric.kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + ('+Inf',), value[:-1]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {value[-1]}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = {**labels, **{k: v for k, v in extra.items()}}
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + '}'
+
+
+registry = Registry()
+
+# Deploys
+deploys_in_progress = registry.gauge(
+    'platform_deploy_queue_depth', "Deployments currently running or waiting"
+)
+deploys_total = registry.counter(
+    'platform_deploys_total', "Finished deployments", ['result']
+)
+deploy_stage_seconds = registry.histogram(
+    'platform_deploy_stage_seconds', "Time spent in each deployment stage", ['stage'], STAGE_BUCKETS
+)
+
+# Nginx
+nginx_reloads_total = registry.counter(
+    'platform_nginx_reloads_total', "Nginx reloads by outcome", ['result']
+)
+nginx_reload_seconds = registry.histogram(
+    'platform_nginx_reload_seconds', "Duration of nginx -t plus reload per batch"
+)
+nginx_reload_queue_depth = registry.gauge(
+    'platform_nginx_reload_queue_depth', "Config changes waiting for the next reload batch"
+)
+
+# Tenants (set by run_collectors and run_resource_sampler)
+tenant_up = registry.gauge(
+    'platform_tenant_up', "1 when the tenant's app is running", ['tenant']
+)
+tenant_cpu_percent = registry.gauge(
+    'platform_tenant_cpu_percent', "CPU use of the tenant's processes", ['tenant']
+)
+tenant_rss_bytes = registry.gauge(
+    'platform_tenant_rss_bytes', "Resident memory of the tenant's processes", ['tenant']
+)
+tenant_disk_bytes = registry.gauge(
+    'platform_tenant_disk_bytes', "Size of the tenant's project folder", ['tenant']
+)
+user_storage_bytes = registry.gauge(
+    'platform_user_storage_bytes', "Bytes of files uploaded by each user", ['user']
+)
+
+# The platform's own views
+http_request_seconds = registry.histogram(
+    'platform_http_request_duration_seconds', "Latency of platform views", ['view', 'method', 'status']
+)
+
+
+class RequestMetricsMiddleware:
+    """Records per-view latency for the platform's own pages"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        registry.ensure_flusher()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        http_request_seconds.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    if METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+            return HttpResponseForbidden("Forbidden")
+    elif not settings.DEBUG:
+        return HttpResponseForbidden("Forbidden")
+
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_profileimage_uservideo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('host', models.CharField(help_text='Address the edge Nginx and control plane use to reach the node', max_length=200)),
+                ('agent_port', models.PositiveIntegerField(default=9100)),
+                ('is_active', models.BooleanField(default=True, help_text='Inactive nodes receive no new deployments')),
+                ('total_memory_mb', models.FloatField(default=0.0)),
+                ('available_memory_mb', models.FloatField(default=0.0)),
+                ('cpu_count', models.PositiveIntegerField(default=0)),
+                ('load_average', models.FloatField(default=0.0)),
+                ('running_projects', models.PositiveIntegerField(default=0)),
+                ('last_heartbeat', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='djangoproject',
+            name='node',
+            field=models.ForeignKey(blank=True, help_text='Worker node running the project (empty when hosted on this server)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='django_projects', to='app.workernode'),
+        ),
+    ]
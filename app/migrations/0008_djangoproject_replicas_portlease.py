@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_workernode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='djangoproject',
+            name='replicas',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Number of server processes behind the load balancer'),
+        ),
+        migrations.CreateModel(
+            name='PortLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('replica', models.PositiveSmallIntegerField(default=0)),
+                ('host', models.CharField(default='127.0.0.1', max_length=200)),
+                ('port', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('django_project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='port_leases', to='app.djangoproject')),
+            ],
+            options={
+                'ordering': ['django_project', 'replica'],
+                'constraints': [models.UniqueConstraint(fields=('host', 'port'), name='unique_port_lease')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_djangoproject_replicas_portlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='djangoproject',
+            name='cache_profile',
+            field=models.CharField(choices=[('off', 'Off'), ('micro', 'Micro-cache (1s)'), ('custom', 'Custom TTL')], default='off', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='djangoproject',
+            name='cache_ttl',
+            field=models.PositiveIntegerField(default=60, help_text='Seconds responses are cached with the custom profile'),
+        ),
+    ]
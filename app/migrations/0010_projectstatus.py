@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_djangoproject_cache_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_running', models.BooleanField(default=False)),
+                ('replicas_running', models.PositiveSmallIntegerField(default=0)),
+                ('ports', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('django_project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='status', to='app.djangoproject')),
+            ],
+            options={
+                'verbose_name_plural': 'Project statuses',
+            },
+        ),
+    ]
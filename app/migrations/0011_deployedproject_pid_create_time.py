@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_projectstatus'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deployedproject',
+            name='pid_create_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_deployedproject_pid_create_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serverresource',
+            name='django_project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resource_samples', to='app.djangoproject'),
+        ),
+        migrations.AddField(
+            model_name='serverresource',
+            name='memory_pss',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='serverresource',
+            name='open_connections',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='serverresource',
+            name='process_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='serverresource',
+            index=models.Index(fields=['django_project', '-recorded_at'], name='app_serverr_django__0e3f71_idx'),
+        ),
+    ]
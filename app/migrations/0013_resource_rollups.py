@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_serverresource_tenant_samples'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('cpu', 'CPU %'), ('memory', 'Memory MB'), ('disk', 'Disk MB'), ('connections', 'Open connections')], max_length=20)),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket', models.DateTimeField(help_text='Start of the interval')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('min', models.FloatField(default=0.0)),
+                ('max', models.FloatField(default=0.0)),
+                ('p95', models.FloatField(default=0.0)),
+                ('histogram', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['bucket'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='serverresource',
+            index=models.Index(fields=['user', 'recorded_at'], name='app_serverr_user_id_0dd319_idx'),
+        ),
+        migrations.AddField(
+            model_name='resourcerollup',
+            name='django_project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resource_rollups', to='app.djangoproject'),
+        ),
+        migrations.AddField(
+            model_name='resourcerollup',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='resourcerollup',
+            index=models.Index(fields=['user', 'resolution', 'bucket'], name='app_resourc_user_id_7c7440_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='resourcerollup',
+            constraint=models.UniqueConstraint(fields=('django_project', 'metric', 'resolution', 'bucket'), name='unique_resource_rollup'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_resource_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessLogOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True)),
+                ('inode', models.BigIntegerField(default=0)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TenantTrafficMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant', models.CharField(max_length=200)),
+                ('minute', models.DateTimeField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('status_2xx', models.PositiveIntegerField(default=0)),
+                ('status_3xx', models.PositiveIntegerField(default=0)),
+                ('status_4xx', models.PositiveIntegerField(default=0)),
+                ('status_5xx', models.PositiveIntegerField(default=0)),
+                ('bytes_sent', models.BigIntegerField(default=0)),
+                ('bytes_received', models.BigIntegerField(default=0)),
+                ('request_time_total', models.FloatField(default=0.0)),
+                ('request_time_max', models.FloatField(default=0.0)),
+                ('request_time_p50', models.FloatField(default=0.0)),
+                ('request_time_p95', models.FloatField(default=0.0)),
+                ('request_time_p99', models.FloatField(default=0.0)),
+                ('request_time_histogram', models.JSONField(default=dict)),
+                ('upstream_time_total', models.FloatField(default=0.0)),
+                ('upstream_requests', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-minute'],
+                'indexes': [models.Index(fields=['minute'], name='app_tenantt_minute_814521_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tenant', 'minute'), name='unique_tenant_traffic_minute')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_upstream_health'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectstatus',
+            name='exit_code',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectstatus',
+            name='exited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_project_exit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='djangoproject',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='djangoproject',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='website',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='website',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_stored_file_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='file_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
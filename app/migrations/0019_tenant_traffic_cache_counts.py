@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_user_file_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenanttrafficminute',
+            name='cache_hits',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tenanttrafficminute',
+            name='cache_misses',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 import os
+import hashlib
 from django.utils.text import slugify
 
 
@@ -13,11 +14,18 @@ class UserFile(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=400)
     file = models.FileField(upload_to=upload_to, max_length=500)
+    # Filled in on upload so storage totals are a single SUM
+    file_size = models.BigIntegerField(null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            self.file_size = self.file.size
+        super().save(*args, **kwargs)
+
     @property
     def size(self):
         return self.file.size  # Size in bytes
@@ -76,6 +84,16 @@ class ProfileImage(models.Model):
 
 
     
+def file_stats(field_file):
+    """(size in bytes, sha256 hex digest) of a FieldFile's content"""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in field_file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return size, digest.hexdigest()
+
+
  #########################################################
  # Models for Static Website and Django Project Hosting   
 class Website(models.Model):
@@ -84,6 +102,9 @@ class Website(models.Model):
     title = models.CharField(max_length=200)
     subdomain = models.CharField(max_length=100, unique=True)
     uploaded_file = models.FileField(upload_to='website_uploads/')
+    # Filled in when a file is uploaded, so reports never stat the file
+    file_size = models.BigIntegerField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
     is_dynamic = models.BooleanField(default=False)
     custom_domain = models.CharField(max_length=200, blank=True, null=True)
     folder_name = models.CharField(max_length=500, blank=True, null=True)
@@ -95,6 +116,12 @@ class Website(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
+    def save(self, *args, **kwargs):
+        # A new upload hasn't been written to storage yet
+        if self.uploaded_file and not self.uploaded_file._committed:
+            self.file_size, self.content_hash = file_stats(self.uploaded_file)
+        super().save(*args, **kwargs)
+
     def get_site_url(self):
         if self.domain_name:
             return f"http://{self.domain_name}"
@@ -104,6 +131,36 @@ class Website(models.Model):
         ordering = ['-created_at']
 
 
+class WorkerNode(models.Model):
+    """Worker server running the node agent for Django project hosting"""
+
+    name = models.CharField(max_length=100, unique=True)
+    host = models.CharField(max_length=200, help_text="Address the edge Nginx and control plane use to reach the node")
+    agent_port = models.PositiveIntegerField(default=9100)
+    is_active = models.BooleanField(default=True, help_text="Inactive nodes receive no new deployments")
+
+    # Last heartbeat reported by the agent
+    total_memory_mb = models.FloatField(default=0.0)
+    available_memory_mb = models.FloatField(default=0.0)
+    cpu_count = models.PositiveIntegerField(default=0)
+    load_average = models.FloatField(default=0.0)
+    running_projects = models.PositiveIntegerField(default=0)
+    last_heartbeat = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=500, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.host}:{self.agent_port})"
+
+    def get_agent_url(self):
+        """Base URL of the node agent HTTP API"""
+        return f"http://{self.host}:{self.agent_port}"
+
+    class Meta:
+        ordering = ['name']
+
+
 class DjangoProject(models.Model):
     """Django project hosting model"""
     
@@ -115,6 +172,12 @@ class DjangoProject(models.Model):
         ('stopped', 'Stopped'),
     ]
     
+    CACHE_PROFILE_CHOICES = [
+        ('off', 'Off'),
+        ('micro', 'Micro-cache (1s)'),
+        ('custom', 'Custom TTL'),
+    ]
+    
     PYTHON_VERSION_CHOICES = [
         ('3.8', 'Python 3.8'),
         ('3.9', 'Python 3.9'),
@@ -132,6 +195,9 @@ class DjangoProject(models.Model):
         upload_to='django_projects/',
         help_text="Upload your Django project as a ZIP file"
     )
+    # Filled in when a file is uploaded, so reports never stat the file
+    file_size = models.BigIntegerField(null=True, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
     
     # Configuration
     python_version = models.CharField(
@@ -152,6 +218,14 @@ class DjangoProject(models.Model):
     domain_name = models.CharField(max_length=200, blank=True, null=True)
     
     # Deployment info
+    node = models.ForeignKey(
+        WorkerNode,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='django_projects',
+        help_text="Worker node running the project (empty when hosted on this server)"
+    )
     project_folder = models.CharField(max_length=500, blank=True, null=True)
     deployment_status = models.CharField(
         max_length=20,
@@ -165,6 +239,23 @@ class DjangoProject(models.Model):
     # Database configuration
     database_url = models.CharField(max_length=500, blank=True, null=True)
     
+    # Scaling
+    replicas = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Number of server processes behind the load balancer"
+    )
+    
+    # Edge caching of anonymous GET/HEAD responses
+    cache_profile = models.CharField(
+        max_length=10,
+        choices=CACHE_PROFILE_CHOICES,
+        default='off'
+    )
+    cache_ttl = models.PositiveIntegerField(
+        default=60,
+        help_text="Seconds responses are cached with the custom profile"
+    )
+    
     # Resource limits
     memory_limit = models.CharField(
         max_length=10,
@@ -187,6 +278,12 @@ class DjangoProject(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.project_name}"
 
+    def save(self, *args, **kwargs):
+        # A new upload hasn't been written to storage yet
+        if self.project_file and not self.project_file._committed:
+            self.file_size, self.content_hash = file_stats(self.project_file)
+        super().save(*args, **kwargs)
+
     def get_site_url(self):
         """Get the full URL where the Django project is accessible"""
         if self.domain_name:
@@ -209,6 +306,14 @@ class DjangoProject(models.Model):
         safe_name = "".join(c if c.isalnum() else "_" for c in self.project_name)
         return f"db_{self.user.username}_{safe_name}"
 
+    def get_cache_ttl(self):
+        """Edge cache lifetime in seconds; 0 disables caching"""
+        if self.cache_profile == 'micro':
+            return 1
+        if self.cache_profile == 'custom':
+            return self.cache_ttl
+        return 0
+
     def delete(self, *args, **kwargs):
         """Override delete to clean up files and deployment"""
         # Clean up uploaded file
@@ -228,6 +333,61 @@ class DjangoProject(models.Model):
         verbose_name_plural = "Django Projects"
 
 
+class PortLease(models.Model):
+    """Port held by one replica of a Django project on a host"""
+
+    django_project = models.ForeignKey(DjangoProject, on_delete=models.CASCADE, related_name='port_leases')
+    replica = models.PositiveSmallIntegerField(default=0)
+    host = models.CharField(max_length=200, default='127.0.0.1')
+    port = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.django_project.project_name} #{self.replica} - {self.host}:{self.port}"
+
+    class Meta:
+        ordering = ['django_project', 'replica']
+        constraints = [
+            models.UniqueConstraint(fields=['host', 'port'], name='unique_port_lease'),
+        ]
+
+
+class ProjectStatus(models.Model):
+    """Last observed runtime state of a Django project, kept current by the status collector"""
+
+    django_project = models.OneToOneField(DjangoProject, on_delete=models.CASCADE, related_name='status')
+    is_running = models.BooleanField(default=False)
+    replicas_running = models.PositiveSmallIntegerField(default=0)
+    ports = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    # Last replica exit seen by the process watcher; exit_code is negative for a signal
+    exit_code = models.IntegerField(null=True, blank=True)
+    exited_at = models.DateTimeField(null=True, blank=True)
+    # Only written when the state above changes
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.django_project.project_name} - {'running' if self.is_running else 'down'}"
+
+    def as_dict(self):
+        """Same shape as check_django_deployment_status() for templates"""
+        status = {
+            'status': self.is_running,
+            'replicas_running': self.replicas_running,
+            'ports': self.ports,
+            'changed_at': self.changed_at,
+        }
+        if self.error:
+            status['error'] = self.error
+        if self.exited_at:
+            status['exit_code'] = self.exit_code
+            status['exited_at'] = self.exited_at
+        return status
+
+    class Meta:
+        verbose_name_plural = "Project statuses"
+
+
 class DeploymentLog(models.Model):
     """Store deployment logs and history"""
     
@@ -274,12 +434,23 @@ class ServerResource(models.Model):
     """Track server resource usage"""
     
     user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Set on per-tenant samples written by the resource sampler
+    django_project = models.ForeignKey(
+        DjangoProject,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='resource_samples'
+    )
     
     # Resource usage
     cpu_usage = models.FloatField(default=0.0)  # Percentage
-    memory_usage = models.FloatField(default=0.0)  # MB
+    memory_usage = models.FloatField(default=0.0)  # MB (RSS)
+    memory_pss = models.FloatField(default=0.0)  # MB, 0 where PSS isn't available
     disk_usage = models.FloatField(default=0.0)  # MB
     bandwidth_usage = models.FloatField(default=0.0)  # MB
+    open_connections = models.PositiveIntegerField(default=0)
+    process_count = models.PositiveSmallIntegerField(default=0)
     
     # Limits
     memory_limit = models.FloatField(default=512.0)  # MB
@@ -306,6 +477,112 @@ class ServerResource(models.Model):
 
     class Meta:
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['user', 'recorded_at']),
+            models.Index(fields=['django_project', '-recorded_at']),
+        ]
+
+
+class ResourceRollup(models.Model):
+    """Per-project resource statistics over a 1-minute, 1-hour or 1-day bucket (see rollups.py)"""
+
+    RESOLUTION_CHOICES = [
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    METRIC_CHOICES = [
+        ('cpu', 'CPU %'),
+        ('memory', 'Memory MB'),
+        ('disk', 'Disk MB'),
+        ('connections', 'Open connections'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    django_project = models.ForeignKey(DjangoProject, on_delete=models.CASCADE, related_name='resource_rollups')
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the interval")
+
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    min = models.FloatField(default=0.0)
+    max = models.FloatField(default=0.0)
+    p95 = models.FloatField(default=0.0)
+    # Sparse log-scale histogram {bucket index: samples}, so p95 can be kept up to date
+    histogram = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"{self.django_project_id} {self.metric} {self.resolution} @ {self.bucket}"
+
+    @property
+    def avg(self):
+        return self.total / self.count if self.count else 0.0
+
+    class Meta:
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['django_project', 'metric', 'resolution', 'bucket'], name='unique_resource_rollup'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'resolution', 'bucket']),
+        ]
+
+
+class TenantTrafficMinute(models.Model):
+    """Requests, bandwidth and latency of one tenant over one minute, from its Nginx access log"""
+
+    tenant = models.CharField(max_length=200)
+    minute = models.DateTimeField()
+
+    requests = models.PositiveIntegerField(default=0)
+    status_2xx = models.PositiveIntegerField(default=0)
+    status_3xx = models.PositiveIntegerField(default=0)
+    status_4xx = models.PositiveIntegerField(default=0)
+    status_5xx = models.PositiveIntegerField(default=0)
+    bytes_sent = models.BigIntegerField(default=0)
+    bytes_received = models.BigIntegerField(default=0)
+
+    # Seconds; percentiles come from the log-scale histogram so partial minutes merge
+    request_time_total = models.FloatField(default=0.0)
+    request_time_max = models.FloatField(default=0.0)
+    request_time_p50 = models.FloatField(default=0.0)
+    request_time_p95 = models.FloatField(default=0.0)
+    request_time_p99 = models.FloatField(default=0.0)
+    request_time_histogram = models.JSONField(default=dict)
+    upstream_time_total = models.FloatField(default=0.0)
+    upstream_requests = models.PositiveIntegerField(default=0)
+
+    # Edge cache outcome ($upstream_cache_status); other requests bypassed the cache
+    cache_hits = models.PositiveIntegerField(default=0)
+    cache_misses = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.tenant} @ {self.minute}: {self.requests} requests"
+
+    class Meta:
+        ordering = ['-minute']
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'minute'], name='unique_tenant_traffic_minute'),
+        ]
+        indexes = [
+            models.Index(fields=['minute']),
+        ]
+
+
+class AccessLogOffset(models.Model):
+    """How far the access log follower has read a file; saved with the traffic it produced"""
+
+    path = models.CharField(max_length=500, unique=True)
+    inode = models.BigIntegerField(default=0)
+    offset = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} @ {self.offset}"
 
 
 class DatabaseBackup(models.Model):
@@ -382,6 +659,8 @@ class DeployedProject(models.Model):
     port = models.PositiveIntegerField(unique=True)
     running = models.BooleanField(default=False)
     pid = models.PositiveIntegerField(null=True, blank=True)
+    # Process start time (epoch seconds) for pid, so a recycled PID isn't mistaken for ours
+    pid_create_time = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -430,4 +709,42 @@ class DeployedProject(models.Model):
         return f"{self.name}.{MAIN_DOMAIN}"
 
     def __str__(self):
-        return f"{self.name} ({self.subdomain})"
\ No newline at end of file
+        return f"{self.name} ({self.subdomain})"
+
+
+class UpstreamHealth(models.Model):
+    """Result of HTTP health probes against one upstream (see health.py)"""
+
+    STATUS_CHOICES = [
+        ('unknown', 'Unknown'),
+        ('up', 'Up'),
+        ('down', 'Down'),
+    ]
+
+    upstream = models.CharField(max_length=255, unique=True, help_text="host:port that was probed")
+    django_project = models.ForeignKey(
+        DjangoProject, on_delete=models.CASCADE, null=True, blank=True, related_name='health_checks'
+    )
+    deployed_project = models.ForeignKey(
+        DeployedProject, on_delete=models.CASCADE, null=True, blank=True, related_name='health_checks'
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='unknown')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    latency_ms = models.FloatField(null=True, blank=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    checks = models.PositiveIntegerField(default=0)
+    successes = models.PositiveIntegerField(default=0)
+    last_error = models.CharField(max_length=500, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.upstream} - {self.status}"
+
+    @property
+    def availability(self):
+        """Percentage of successful probes since the upstream was first seen"""
+        return round(self.successes / self.checks * 100, 2) if self.checks else None
+
+    class Meta:
+        ordering = ['upstream']
@@ -0,0 +1,172 @@
+import sys
+import time
+import queue
+import logging
+import threading
+import subprocess
+from django.conf import settings
+
+from .metrics import nginx_reload_queue_depth, nginx_reload_seconds, nginx_reloads_total
+
+logger = logging.getLogger(__name__)
+
+# Changes arriving within this many seconds of each other share one reload
+NGINX_RELOAD_WINDOW = getattr(settings, 'NGINX_RELOAD_WINDOW', 0.5)
+# Upper bound on how long a busy stream of changes can postpone a reload
+NGINX_RELOAD_MAX_DELAY = getattr(settings, 'NGINX_RELOAD_MAX_DELAY', 3.0)
+NGINX_TEST_COMMAND = getattr(settings, 'NGINX_TEST_COMMAND', ['sudo', 'nginx', '-t'])
+NGINX_RELOAD_COMMAND = getattr(settings, 'NGINX_RELOAD_COMMAND', ['sudo', 'systemctl', 'reload', 'nginx'])
+
+
+class ConfigChange:
+    """One caller's Nginx config change waiting for the next batched reload"""
+
+    def __init__(self, description, config_paths=(), rollback=None):
+        self.description = description
+        self.config_paths = [str(p) for p in config_paths]
+        self.rollback = rollback
+        self.done = threading.Event()
+        self.success = False
+        self.message = ''
+
+    def finish(self, success, message):
+        self.success = success
+        self.message = message
+        self.done.set()
+
+    def undo(self):
+        if not self.rollback:
+            return
+        try:
+            self.rollback()
+        except Exception as e:
+            logger.error(f"Rollback failed for {self.description}: {str(e)}")
+
+
+class NginxReloadCoordinator:
+    """
+    Coalesces Nginx config changes from concurrent deploys into one
+    `nginx -t` and one reload per batch.
+
+    Callers write their config files, then block in submit() until the
+    batch they joined has been validated and reloaded. If validation fails,
+    the changes named in the error output are rolled back and the rest of
+    the batch is retried, so one bad tenant config doesn't fail everyone.
+    """
+
+    def __init__(self, window=NGINX_RELOAD_WINDOW, max_delay=NGINX_RELOAD_MAX_DELAY):
+        self.window = window
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reload_count = 0
+        self.failed_reload_count = 0
+        self.last_reload_seconds = 0.0
+
+    def submit(self, description, config_paths=(), rollback=None, timeout=60):
+        """Queue a change and wait for its batch. Returns (success, message)."""
+        if sys.platform == 'win32':
+            return True, "Nginx reload skipped (Windows environment)"
+
+        change = ConfigChange(description, config_paths, rollback)
+        self._ensure_worker()
+        self._queue.put(change)
+        nginx_reload_queue_depth.inc()
+
+        if not change.done.wait(timeout):
+            return False, "Timed out waiting for Nginx reload"
+        return change.success, change.message
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='nginx-reload', daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(self.window, remaining)))
+            except queue.Empty:
+                break
+        nginx_reload_queue_depth.dec(len(batch))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                with nginx_reload_seconds.time():
+                    self._process(batch)
+            except Exception as e:
+                logger.error(f"Nginx reload batch failed: {str(e)}")
+                for change in batch:
+                    if not change.done.is_set():
+                        change.finish(False, f"Nginx reload failed: {str(e)[:200]}")
+
+    def _run_command(self, command, timeout):
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+            return result.returncode == 0, (result.stderr or result.stdout or '').strip()
+        except subprocess.TimeoutExpired:
+            return False, "Nginx command timed out"
+        except FileNotFoundError:
+            return False, "sudo command not found. Install sudo or run as root."
+
+    def _process(self, batch):
+        logger.info(f"Validating Nginx config for {len(batch)} change(s)")
+        pending = list(batch)
+
+        ok, output = self._run_command(NGINX_TEST_COMMAND, timeout=10)
+        if not ok:
+            culprits = [c for c in pending if any(p in output for p in c.config_paths)]
+            if not culprits or len(culprits) == len(pending):
+                culprits = pending
+
+            # Undo newest first so shared files end up at their pre-batch state
+            for change in reversed(culprits):
+                change.undo()
+                change.finish(False, f"Nginx config test failed: {output[:300]}")
+            pending = [c for c in pending if c not in culprits]
+            nginx_reloads_total.inc(result='invalid')
+
+            if not pending:
+                return
+
+            ok, output = self._run_command(NGINX_TEST_COMMAND, timeout=10)
+            if not ok:
+                for change in reversed(pending):
+                    change.undo()
+                    change.finish(False, f"Nginx config test failed: {output[:300]}")
+                return
+
+        started = time.monotonic()
+        ok, output = self._run_command(NGINX_RELOAD_COMMAND, timeout=20)
+        self.last_reload_seconds = time.monotonic() - started
+
+        if ok:
+            self.reload_count += 1
+            nginx_reloads_total.inc(result='success')
+            logger.info(f"Nginx reloaded once for {len(pending)} change(s)")
+        else:
+            self.failed_reload_count += 1
+            nginx_reloads_total.inc(result='failed')
+            logger.error(f"Nginx reload failed: {output}")
+
+        for change in pending:
+            change.finish(ok, "Nginx reloaded successfully" if ok else f"Nginx reload failed: {output[:300]}")
+
+
+reload_coordinator = NginxReloadCoordinator()
+
+
+def request_nginx_reload(description, config_paths=(), rollback=None):
+    """Validate and reload Nginx together with any concurrent changes. Returns (success, message)."""
+    return reload_coordinator.submit(description, config_paths, rollback)
@@ -0,0 +1,296 @@
+import json
+import logging
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+
+from .models import WorkerNode, PortLease
+from .metrics import deploys_in_progress, deploys_total
+from .log_handlers import log_context
+from .routing import set_cache_ttl
+from .utils import (
+    BASE_DOMAIN,
+    after_drain,
+    deploy_django_project,
+    stop_django_project,
+    scale_django_project,
+    check_django_deployment_status,
+    cleanup_django_deployment,
+    generate_nginx_config,
+    remove_nginx_config,
+    tenant_key,
+)
+
+logger = logging.getLogger(__name__)
+
+NODE_AGENT_TOKEN = getattr(settings, 'NODE_AGENT_TOKEN', '')
+# Deploys run pip install and migrations on the node, so allow them plenty of time
+NODE_AGENT_TIMEOUT = getattr(settings, 'NODE_AGENT_TIMEOUT', 900)
+NODE_HEARTBEAT_TIMEOUT = getattr(settings, 'NODE_HEARTBEAT_TIMEOUT', 120)
+
+
+class NodeAgentError(Exception):
+    """Raised when a worker node agent cannot be reached or rejects a request"""
+
+
+class NodeAgentClient:
+    """Minimal JSON-over-HTTP client for the node agent (see run_node_agent)"""
+
+    def __init__(self, node, timeout=NODE_AGENT_TIMEOUT):
+        self.node = node
+        self.timeout = timeout
+
+    def _request(self, method, path, params=None, body=None, content_type='application/json', timeout=None):
+        url = f"{self.node.get_agent_url()}{path}"
+        if params:
+            url = f"{url}?{urllib.parse.urlencode(params)}"
+
+        request = urllib.request.Request(url, data=body, method=method)
+        request.add_header('Content-Type', content_type)
+        if NODE_AGENT_TOKEN:
+            request.add_header('X-Agent-Token', NODE_AGENT_TOKEN)
+
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                return json.loads(response.read().decode('utf-8') or '{}')
+        except urllib.error.HTTPError as e:
+            raise NodeAgentError(f"{self.node.name}: agent returned HTTP {e.code}")
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise NodeAgentError(f"{self.node.name}: {str(e)[:200]}")
+
+    def health(self):
+        return self._request('GET', '/health', timeout=5)
+
+    def deploy(self, username, project_name, uploaded_file_path, custom_domain=None, replicas=1):
+        """Upload the project ZIP to the node and run the normal deploy pipeline there"""
+        params = {'username': username, 'project_name': project_name, 'replicas': replicas}
+        if custom_domain:
+            params['custom_domain'] = custom_domain
+
+        with open(uploaded_file_path, 'rb') as f:
+            return self._request('POST', '/deploy', params=params, body=f.read(), content_type='application/zip')
+
+    def scale(self, username, project_name, replicas):
+        params = {'username': username, 'project_name': project_name, 'replicas': replicas}
+        return self._request('POST', '/scale', params=params)
+
+    def stop(self, username, project_name, cleanup=False):
+        params = {'username': username, 'project_name': project_name}
+        if cleanup:
+            params['cleanup'] = '1'
+        return self._request('POST', '/stop', params=params, timeout=30)
+
+    def status(self, username, project_name, domain_name):
+        params = {'username': username, 'project_name': project_name, 'domain_name': domain_name or ''}
+        return self._request('GET', '/status', params=params, timeout=10)
+
+
+def refresh_node_stats(nodes=None):
+    """Poll /health on every node and store the heartbeat"""
+    nodes = list(nodes if nodes is not None else WorkerNode.objects.filter(is_active=True))
+    now = timezone.now()
+
+    for node in nodes:
+        try:
+            stats = NodeAgentClient(node).health()
+            node.total_memory_mb = stats.get('total_memory_mb', 0.0)
+            node.available_memory_mb = stats.get('available_memory_mb', 0.0)
+            node.cpu_count = stats.get('cpu_count', 0)
+            node.load_average = stats.get('load_average', 0.0)
+            node.running_projects = stats.get('running_projects', 0)
+            node.last_heartbeat = now
+            node.last_error = ''
+        except NodeAgentError as e:
+            logger.warning(f"Node heartbeat failed: {str(e)}")
+            node.last_error = str(e)[:500]
+
+    WorkerNode.objects.bulk_update(nodes, [
+        'total_memory_mb', 'available_memory_mb', 'cpu_count',
+        'load_average', 'running_projects', 'last_heartbeat', 'last_error',
+    ])
+    return nodes
+
+
+def choose_node():
+    """
+    Pick the healthy node with the most free memory, or None when no
+    worker nodes are registered (single-server mode).
+    """
+    nodes = refresh_node_stats()
+    cutoff = timezone.now() - timedelta(seconds=NODE_HEARTBEAT_TIMEOUT)
+    healthy = [n for n in nodes if n.last_heartbeat and n.last_heartbeat >= cutoff and not n.last_error]
+
+    if not healthy:
+        if nodes:
+            logger.warning("No healthy worker nodes, deploying on the control plane")
+        return None
+
+    # Normalise load by core count so a busy big box still ranks sensibly
+    return max(healthy, key=lambda n: (n.available_memory_mb, -n.load_average / max(n.cpu_count, 1)))
+
+
+def _subdomain_for(domain_name):
+    return domain_name.replace(f".{BASE_DOMAIN}", "")
+
+
+def sync_port_leases(project, ports, host='127.0.0.1'):
+    """Record the ports currently held by the project's replicas"""
+    PortLease.objects.filter(django_project=project).delete()
+    PortLease.objects.filter(host=host, port__in=ports).delete()
+    PortLease.objects.bulk_create([
+        PortLease(django_project=project, replica=replica, host=host, port=port)
+        for replica, port in enumerate(ports)
+    ])
+
+
+def apply_cache_profile(project):
+    """Push the project's cache profile to its edge route. Returns (success, message)."""
+    subdomain = tenant_key(project)
+    return set_cache_ttl([f"{subdomain}.{BASE_DOMAIN}"], project.get_cache_ttl())
+
+
+def deploy_project(project, username, project_name, custom_domain=None):
+    """
+    Deploy a DjangoProject on the best worker node and point the edge Nginx
+    at it. Falls back to a local deploy when there are no worker nodes.
+
+    Returns the same result dict as utils.deploy_django_project.
+    """
+    deploys_in_progress.inc()
+    result = {'success': False}
+    try:
+        with log_context(project=project_name, user=username):
+            result = _deploy_project(project, username, project_name, custom_domain)
+        return result
+    finally:
+        deploys_in_progress.dec()
+        deploys_total.inc(result='success' if result.get('success') else 'failed')
+
+
+def _deploy_project(project, username, project_name, custom_domain=None):
+    node = project.node if project.node_id and project.node.is_active else choose_node()
+
+    if node is None:
+        result = deploy_django_project(
+            username, project_name, project.project_file.path, custom_domain, replicas=project.replicas
+        )
+        if result.get('success'):
+            sync_port_leases(project, result['ports'])
+            if project.node_id:
+                project.node = None
+                project.save(update_fields=['node'])
+            if project.get_cache_ttl():
+                apply_cache_profile(project)
+        return result
+
+    logger.info(f"Deploying {username}_{project_name} on node {node.name}")
+    try:
+        result = NodeAgentClient(node).deploy(
+            username, project_name, project.project_file.path, custom_domain, replicas=project.replicas
+        )
+    except NodeAgentError as e:
+        logger.error(f"Remote deployment failed: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+    if result.get('success'):
+        sync_port_leases(project, result['ports'], host=node.host)
+        nginx_success = generate_nginx_config(
+            _subdomain_for(result['domain_name']), result['ports'],
+            username, project_name, upstream_host=node.host
+        )
+        if not nginx_success:
+            logger.warning(f"Nginx configuration failed, but {project_name} is running on {node.name}")
+
+        if project.get_cache_ttl():
+            apply_cache_profile(project)
+
+        result['node'] = node.name
+        if project.node_id != node.id:
+            project.node = node
+            project.save(update_fields=['node'])
+
+    return result
+
+
+def scale_project(project, username, project_name, replicas):
+    """
+    Change the replica count of a deployed project. On a worker node the
+    edge upstream is shrunk and drained here before the agent stops anything.
+    """
+    subdomain = tenant_key(project)
+
+    if not project.node_id:
+        result = scale_django_project(username, project_name, replicas, subdomain=subdomain)
+        if result.get('ports'):
+            sync_port_leases(project, result['ports'])
+        return result
+
+    node = project.node
+    client = NodeAgentClient(node)
+    try:
+        current = client.status(username, project_name, project.domain_name).get('ports', [])
+        if replicas < len(current):
+            # Shrink the upstream now; the agent stops the removed replicas once they've drained
+            generate_nginx_config(subdomain, current[:replicas], username, project_name, upstream_host=node.host)
+            after_drain(_finish_remote_scale, project, username, project_name, replicas)
+            return {'success': True, 'ports': current[:replicas]}
+        result = client.scale(username, project_name, replicas)
+    except NodeAgentError as e:
+        logger.error(f"Remote scaling failed: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+    if result.get('ports'):
+        sync_port_leases(project, result['ports'], host=node.host)
+        if len(result['ports']) > len(current):
+            generate_nginx_config(subdomain, result['ports'], username, project_name, upstream_host=node.host)
+    return result
+
+
+def _finish_remote_scale(project, username, project_name, replicas):
+    """Second half of a remote scale-down, run after the drain period"""
+    try:
+        result = NodeAgentClient(project.node).scale(username, project_name, replicas)
+    except NodeAgentError as e:
+        logger.error(f"Remote scale-down failed after drain: {str(e)}")
+        return
+    if result.get('ports'):
+        sync_port_leases(project, result['ports'], host=project.node.host)
+
+
+def stop_project(project, username, project_name):
+    """Stop a project wherever it is running"""
+    if not project.node_id:
+        return stop_django_project(username, project_name)
+
+    try:
+        NodeAgentClient(project.node).stop(username, project_name)
+    except NodeAgentError as e:
+        logger.warning(f"Error stopping Django project: {str(e)}")
+
+
+def project_status(project, username, project_name, domain_name):
+    """Deployment status from the node running the project"""
+    if not project.node_id:
+        return check_django_deployment_status(username, project_name, domain_name)
+
+    try:
+        return NodeAgentClient(project.node).status(username, project_name, domain_name)
+    except NodeAgentError as e:
+        return {'status': False, 'error': str(e)}
+
+
+def cleanup_project(project, username, project_name):
+    """Stop the project, remove its files on the node and drop the edge Nginx config"""
+    if not project.node_id:
+        return cleanup_django_deployment(username, project_name)
+
+    try:
+        NodeAgentClient(project.node).stop(username, project_name, cleanup=True)
+    except NodeAgentError as e:
+        logger.error(f"Cleanup error: {str(e)}")
+
+    if project.subdomain:
+        remove_nginx_config(_subdomain_for(project.subdomain))
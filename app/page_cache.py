@@ -0,0 +1,95 @@
+"""
+Full-page cache for the public marketing pages.
+
+Anonymous GETs are answered from the cache: the page is rendered once
+per release, stored both plain and gzipped along with an ETag and
+Last-Modified, and repeat visits with a matching validator get a 304.
+Keys include RELEASE_VERSION, so a deploy starts from fresh pages.
+Signed-in users, query strings and anything but GET/HEAD go straight
+to the view.
+"""
+import re
+import time
+import hashlib
+import logging
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.text import compress_string
+
+logger = logging.getLogger(__name__)
+
+RELEASE_VERSION = getattr(settings, 'RELEASE_VERSION', 'dev')
+PUBLIC_PAGE_CACHE_TIMEOUT = getattr(settings, 'PUBLIC_PAGE_CACHE_TIMEOUT', 86400)
+# Bodies smaller than this aren't worth compressing
+GZIP_MIN_LENGTH = 200
+
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def page_key(path):
+    return f'public_page:{RELEASE_VERSION}:{path}'
+
+
+def _store(response):
+    content = response.content
+    page = {
+        'content': content,
+        'gzip': None,
+        'content_type': response['Content-Type'],
+        'etag': f'W/"{hashlib.md5(content, usedforsecurity=False).hexdigest()}"',
+        'last_modified': int(time.time()),
+    }
+    if len(content) >= GZIP_MIN_LENGTH:
+        compressed = compress_string(content)
+        if len(compressed) < len(content):
+            page['gzip'] = compressed
+    return page
+
+
+def _respond(request, page):
+    # Both encodings share a weak ETag: same page, different bytes
+    response = get_conditional_response(request, etag=page['etag'], last_modified=page['last_modified'])
+    if response is None:
+        response = HttpResponse(content_type=page['content_type'])
+        if page['gzip'] and accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            response.content = page['gzip']
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response.content = page['content']
+    response['ETag'] = page['etag']
+    response['Last-Modified'] = http_date(page['last_modified'])
+    # Signed-in visitors get a different page; make browsers revalidate
+    patch_vary_headers(response, ('Cookie', 'Accept-Encoding'))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def cache_public_page(view):
+    """Serve anonymous GETs of a static page from the cache"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.GET or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        key = page_key(request.path)
+        try:
+            page = cache.get(key)
+        except Exception as e:
+            logger.error(f"Could not read page cache for {request.path}: {str(e)}")
+            page = None
+
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            page = _store(response)
+            try:
+                cache.set(key, page, PUBLIC_PAGE_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Could not cache page {request.path}: {str(e)}")
+        return _respond(request, page)
+    return wrapper
@@ -0,0 +1,232 @@
+"""
+Process exit notifications without polling.
+
+On Linux each watched PID is opened as a pidfd (os.pidfd_open), which
+becomes readable the moment the process exits and, unlike a bare PID,
+can never end up pointing at a recycled process. Platforms without
+pidfds fall back to checking psutil every PROCESS_POLL_INTERVAL.
+"""
+import os
+import time
+import socket
+import logging
+import selectors
+import threading
+from collections import namedtuple
+import psutil
+
+logger = logging.getLogger(__name__)
+
+PROCESS_POLL_INTERVAL = 1.0
+# create_time and file mtimes are rounded differently across platforms
+CREATE_TIME_TOLERANCE = 1.0
+
+Exit = namedtuple('Exit', ['key', 'pid', 'exit_code', 'exited_at'])
+
+
+def started_before(pid, moment):
+    """
+    True if pid is alive and was created no later than `moment` (a
+    timestamp such as its pid file's mtime); a process created after the
+    file was written is a different process that reused the PID.
+    """
+    try:
+        proc = psutil.Process(pid)
+        return proc.status() != psutil.STATUS_ZOMBIE and proc.create_time() <= moment + CREATE_TIME_TOLERANCE
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+class _Watched:
+    def __init__(self, pid, fd=None, process=None):
+        self.pid = pid
+        self.fd = fd
+        self.process = process
+        self.proc = None
+
+
+class ProcessWatcher:
+    """
+    Watches PIDs under caller-chosen keys. `wait()` blocks until at least
+    one watched process exits (or the timeout passes) and returns their
+    Exit records; each process is reported once. `watch()` may be called
+    from other threads while `wait()` is blocked.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._lock = threading.Lock()
+        self._watched = {}
+
+    def watch(self, key, pid, started_by=None, process=None):
+        """
+        Start watching pid under key, replacing whatever key watched before.
+        started_by is the latest time the process can have started (see
+        started_before); process is our own subprocess.Popen, which lets the
+        exit code be collected. Returns False if the process is already gone.
+        """
+        self.forget(key)
+        fd = None
+        if hasattr(os, 'pidfd_open'):
+            try:
+                fd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                return False
+            except OSError:
+                fd = None
+
+        # Checked after opening the pidfd, so the identity can't change afterwards
+        if started_by is not None and not started_before(pid, started_by):
+            if fd is not None:
+                os.close(fd)
+            return False
+
+        watched = _Watched(pid, fd, process)
+        if fd is None:
+            try:
+                watched.proc = psutil.Process(pid)
+            except psutil.NoSuchProcess:
+                return False
+
+        with self._lock:
+            self._watched[key] = watched
+            if fd is not None:
+                self._selector.register(fd, selectors.EVENT_READ, key)
+        self._wake()
+        return True
+
+    def forget(self, key):
+        with self._lock:
+            watched = self._watched.pop(key, None)
+            if watched is not None and watched.fd is not None:
+                self._selector.unregister(watched.fd)
+                os.close(watched.fd)
+
+    def watched(self):
+        """{key: pid} currently being watched"""
+        with self._lock:
+            return {key: watched.pid for key, watched in self._watched.items()}
+
+    def _wake(self):
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _exit_code(self, watched):
+        """Exit code if the process was our child (negative for signals), else None"""
+        if watched.process is not None:
+            return watched.process.wait()
+        if watched.fd is not None and hasattr(os, 'waitid') and hasattr(os, 'P_PIDFD'):
+            try:
+                result = os.waitid(os.P_PIDFD, watched.fd, os.WEXITED | os.WNOHANG)
+            except ChildProcessError:
+                return None
+            if result is not None:
+                return result.si_status if result.si_code == os.CLD_EXITED else -result.si_status
+        return None
+
+    def _polled_exits(self):
+        with self._lock:
+            polled = [(key, w) for key, w in self._watched.items() if w.fd is None]
+        exited = []
+        for key, watched in polled:
+            try:
+                alive = watched.proc.is_running() and watched.proc.status() != psutil.STATUS_ZOMBIE
+            except psutil.NoSuchProcess:
+                alive = False
+            if not alive:
+                exited.append(key)
+        return exited
+
+    def wait(self, timeout=None):
+        with self._lock:
+            polling = any(w.fd is None for w in self._watched.values())
+        if polling:
+            timeout = PROCESS_POLL_INTERVAL if timeout is None else min(timeout, PROCESS_POLL_INTERVAL)
+
+        exited = []
+        for selector_key, _ in self._selector.select(timeout):
+            if selector_key.fileobj is self._wakeup_r:
+                try:
+                    while self._wakeup_r.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            exited.append(selector_key.data)
+        if polling:
+            exited.extend(self._polled_exits())
+
+        exits = []
+        for key in exited:
+            with self._lock:
+                watched = self._watched.get(key)
+            if watched is None:
+                continue
+            exit_code = self._exit_code(watched)
+            exits.append(Exit(key, watched.pid, exit_code, time.time()))
+            with self._lock:
+                if self._watched.get(key) is watched:
+                    self._watched.pop(key)
+                    if watched.fd is not None:
+                        self._selector.unregister(watched.fd)
+                        os.close(watched.fd)
+        return exits
+
+    def close(self):
+        for key in list(self._watched):
+            self.forget(key)
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+
+class ChildReaper:
+    """
+    Reaps subprocesses started by this process as soon as they exit and
+    hands their exit code to a callback, so finished replicas don't linger
+    as zombies until the next Popen call.
+    """
+
+    def __init__(self):
+        self._watcher = None
+        self._callbacks = {}
+        self._owner_pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_thread(self):
+        with self._lock:
+            # Threads don't survive fork; start afresh in a new process
+            if self._owner_pid == os.getpid():
+                return
+            self._owner_pid = os.getpid()
+            self._watcher = ProcessWatcher()
+            self._callbacks = {}
+            threading.Thread(target=self._run, args=(self._watcher,), name='child-reaper', daemon=True).start()
+
+    def reap(self, process, on_exit):
+        """Call on_exit(exit) once the subprocess.Popen process has exited"""
+        self._ensure_thread()
+        self._callbacks[process.pid] = on_exit
+        if not self._watcher.watch(process.pid, process.pid, process=process):
+            self._callbacks.pop(process.pid, None)
+            on_exit(Exit(process.pid, process.pid, process.wait(), time.time()))
+
+    def _run(self, watcher):
+        while True:
+            for exit in watcher.wait():
+                callback = self._callbacks.pop(exit.key, None)
+                if callback is None:
+                    continue
+                try:
+                    callback(exit)
+                except Exception as e:
+                    logger.error(f"Exit callback for PID {exit.pid} failed: {str(e)}")
+
+
+child_reaper = ChildReaper()
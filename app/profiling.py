@@ -0,0 +1,180 @@
+"""
+Opt-in request profiling for the platform's own views.
+
+With REQUEST_PROFILING = True, RequestProfilingMiddleware records wall
+time, DB query count/time and response size for a sample of requests
+into a fixed-size ring buffer kept in the cache (shared by all workers
+when the cache is). A smaller sample runs under cProfile, and the trace
+is kept when the request turns out slower than
+REQUEST_PROFILE_THRESHOLD_MS. The report lives at /admin/slow-views/.
+"""
+import io
+import math
+import time
+import random
+import pstats
+import cProfile
+import logging
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.shortcuts import render
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+REQUEST_PROFILING = getattr(settings, 'REQUEST_PROFILING', False)
+# Fraction of requests recorded, and of those the fraction run under cProfile
+REQUEST_PROFILING_SAMPLE_RATE = getattr(settings, 'REQUEST_PROFILING_SAMPLE_RATE', 1.0)
+REQUEST_PROFILE_TRACE_RATE = getattr(settings, 'REQUEST_PROFILE_TRACE_RATE', 0.05)
+REQUEST_PROFILE_THRESHOLD_MS = getattr(settings, 'REQUEST_PROFILE_THRESHOLD_MS', 500)
+REQUEST_PROFILING_BUFFER = getattr(settings, 'REQUEST_PROFILING_BUFFER', 2000)
+
+PROFILE_CACHE_PREFIX = 'request_profile'
+PROFILE_CACHE_TIMEOUT = 7 * 86400
+TRACE_LINES = 40
+
+
+class QueryTimer:
+    """connection.execute_wrapper that counts queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def format_trace(profiler):
+    """Top functions by cumulative time, as pstats prints them"""
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(TRACE_LINES)
+    return out.getvalue()
+
+
+def record_profile(record):
+    """Write one record into the next ring buffer slot"""
+    key = f'{PROFILE_CACHE_PREFIX}:next'
+    try:
+        slot = cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, PROFILE_CACHE_TIMEOUT)
+        slot = cache.incr(key)
+    cache.set(f'{PROFILE_CACHE_PREFIX}:{slot % REQUEST_PROFILING_BUFFER}', record, PROFILE_CACHE_TIMEOUT)
+
+
+def profile_records():
+    keys = [f'{PROFILE_CACHE_PREFIX}:{slot}' for slot in range(REQUEST_PROFILING_BUFFER)]
+    return [record for record in cache.get_many(keys).values() if record]
+
+
+def clear_profiles():
+    cache.delete_many([f'{PROFILE_CACHE_PREFIX}:{slot}' for slot in range(REQUEST_PROFILING_BUFFER)])
+
+
+class RequestProfilingMiddleware:
+    """Place first in MIDDLEWARE so middleware time is included"""
+
+    def __init__(self, get_response):
+        if not REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= REQUEST_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        queries = QueryTimer()
+        profiler = cProfile.Profile() if random.random() < REQUEST_PROFILE_TRACE_RATE else None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(queries))
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'view': match.view_name if match else 'unmatched',
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'wall_ms': round(elapsed_ms, 2),
+            'queries': queries.count,
+            'db_ms': round(queries.seconds * 1000, 2),
+            'size': None if response.streaming else len(response.content),
+            'at': timezone.now().isoformat(),
+        }
+        if profiler and elapsed_ms >= REQUEST_PROFILE_THRESHOLD_MS:
+            record['trace'] = format_trace(profiler)
+
+        try:
+            record_profile(record)
+        except Exception as e:
+            logger.error(f"Could not record request profile: {str(e)}")
+        return response
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of an ascending list"""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def summarize_profiles(records):
+    """Per-view rows sorted by p95, slowest first"""
+    views = {}
+    for record in records:
+        views.setdefault(record['view'], []).append(record)
+
+    rows = []
+    for view, samples in views.items():
+        wall = sorted(sample['wall_ms'] for sample in samples)
+        sizes = [sample['size'] for sample in samples if sample['size'] is not None]
+        rows.append({
+            'view': view,
+            'count': len(samples),
+            'p50': _percentile(wall, 0.50),
+            'p95': _percentile(wall, 0.95),
+            'p99': _percentile(wall, 0.99),
+            'max': wall[-1],
+            'queries': round(sum(s['queries'] for s in samples) / len(samples), 1),
+            'db_ms': round(sum(s['db_ms'] for s in samples) / len(samples), 2),
+            'size': round(sum(sizes) / len(sizes)) if sizes else None,
+        })
+    rows.sort(key=lambda row: row['p95'], reverse=True)
+    return rows
+
+
+@staff_member_required
+def slow_views_report(request):
+    """Admin page: latency percentiles per URL name and the slowest traces"""
+    if request.method == 'POST' and request.POST.get('clear'):
+        clear_profiles()
+
+    records = profile_records()
+    traces = sorted((r for r in records if r.get('trace')), key=lambda r: r['wall_ms'], reverse=True)
+    return render(request, 'admin/slow_views.html', {
+        'title': 'Slow views',
+        'enabled': REQUEST_PROFILING,
+        'rows': summarize_profiles(records),
+        'sampled': len(records),
+        'buffer_size': REQUEST_PROFILING_BUFFER,
+        'threshold_ms': REQUEST_PROFILE_THRESHOLD_MS,
+        'traces': traces[:20],
+    })
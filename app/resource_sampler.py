@@ -0,0 +1,154 @@
+"""
+Per-tenant resource sampling for projects hosted on this server.
+
+Each round walks every running project's process tree (the replica
+servers from the .pid files plus their workers), adds the project
+folder's disk usage and month-to-date bandwidth, and stores one
+ServerResource row per project, folding it into the rollups as it goes.
+Run it with `manage.py run_resource_sampler`.
+"""
+import time
+import logging
+import psutil
+from django.conf import settings
+
+from .models import DjangoProject, ServerResource
+from .utils import read_replica_files, tenant_key
+from .disk_usage import DiskUsageTracker
+from .rollups import record_rollups, prune_resource_data
+from .metrics import registry, tenant_cpu_percent, tenant_rss_bytes, tenant_disk_bytes
+from .access_logs import monthly_bandwidth
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_SAMPLE_INTERVAL = getattr(settings, 'RESOURCE_SAMPLE_INTERVAL', 15)
+DJANGO_PROJECT_DISK_LIMIT_MB = getattr(settings, 'DJANGO_PROJECT_DISK_LIMIT_MB', 1024.0)
+RESOURCE_PRUNE_INTERVAL = getattr(settings, 'RESOURCE_PRUNE_INTERVAL', 3600)
+
+MB = 1024 * 1024
+
+
+class TenantSampler:
+    """
+    Keeps psutil.Process objects between rounds: cpu_percent() reports
+    usage since the previous call on the same object, so a process is
+    measured from its second round onwards.
+    """
+
+    def __init__(self):
+        self._processes = {}
+        self.disk = DiskUsageTracker()
+
+    def _process(self, pid):
+        proc = self._processes.get(pid)
+        # is_running() also compares create_time, so a recycled PID gets a fresh object
+        if proc is None or not proc.is_running():
+            proc = psutil.Process(pid)
+            proc.cpu_percent(None)
+            self._processes[pid] = proc
+        return proc
+
+    def process_tree(self, root_pids):
+        """Root processes and all their descendants, each once"""
+        tree = {}
+        for pid in root_pids:
+            try:
+                root = self._process(pid)
+                tree[root.pid] = root
+                for child in root.children(recursive=True):
+                    tree.setdefault(child.pid, self._process(child.pid))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return list(tree.values())
+
+    def measure(self, processes):
+        totals = {'cpu_usage': 0.0, 'rss': 0, 'pss': 0, 'open_connections': 0, 'process_count': 0}
+        for proc in processes:
+            try:
+                with proc.oneshot():
+                    totals['cpu_usage'] += proc.cpu_percent(None)
+                    try:
+                        memory = proc.memory_full_info()
+                        totals['pss'] += getattr(memory, 'pss', 0)
+                    except psutil.AccessDenied:
+                        memory = proc.memory_info()
+                    totals['rss'] += memory.rss
+                    totals['open_connections'] += sum(
+                        1 for conn in proc.net_connections(kind='inet') if conn.status != psutil.CONN_LISTEN
+                    )
+                totals['process_count'] += 1
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+            except psutil.AccessDenied:
+                totals['process_count'] += 1
+        return totals
+
+    def sample(self):
+        """Take one sample of every running local project. Returns the rows written."""
+        projects = list(
+            DjangoProject.objects
+            .filter(node__isnull=True, is_active=True)
+            .select_related('user')
+        )
+        # Month-to-date bytes sent, from the access log follower
+        bandwidth = monthly_bandwidth([tenant_key(project) for project in projects]) if projects else {}
+
+        samples, seen = [], set()
+        for project in projects:
+            safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
+            pids = read_replica_files(project.user.username, safe_name, 'pid').values()
+            processes = self.process_tree(pids)
+            seen.update(proc.pid for proc in processes)
+
+            totals = self.measure(processes)
+            disk_bytes = self.disk.usage(project.project_folder) if project.project_folder else 0
+            samples.append(ServerResource(
+                user=project.user,
+                django_project=project,
+                cpu_usage=round(totals['cpu_usage'], 1),
+                memory_usage=round(totals['rss'] / MB, 1),
+                memory_pss=round(totals['pss'] / MB, 1),
+                disk_usage=round(disk_bytes / MB, 2),
+                bandwidth_usage=round(bandwidth.get(tenant_key(project), 0) / MB, 2),
+                disk_limit=DJANGO_PROJECT_DISK_LIMIT_MB,
+                open_connections=totals['open_connections'],
+                process_count=totals['process_count'],
+                active_django_projects=1 if totals['process_count'] else 0,
+            ))
+
+        # Forget processes that have exited
+        for pid in list(self._processes):
+            if pid not in seen:
+                del self._processes[pid]
+
+        tenant_cpu_percent.set_all({(tenant_key(s.django_project),): s.cpu_usage for s in samples})
+        tenant_rss_bytes.set_all({(tenant_key(s.django_project),): s.memory_usage * MB for s in samples})
+        tenant_disk_bytes.set_all({(tenant_key(s.django_project),): s.disk_usage * MB for s in samples})
+
+        if samples:
+            ServerResource.objects.bulk_create(samples)
+            record_rollups(samples)
+        return samples
+
+
+def run_sampler(interval=RESOURCE_SAMPLE_INTERVAL, rounds=None):
+    """Sample at a fixed interval until interrupted (or for `rounds` rounds)"""
+    from django.db import close_old_connections
+
+    sampler = TenantSampler()
+    registry.ensure_flusher()
+    completed = 0
+    pruned_at = float('-inf')
+    while rounds is None or completed < rounds:
+        started = time.monotonic()
+        close_old_connections()
+        try:
+            sampler.sample()
+            if started - pruned_at >= RESOURCE_PRUNE_INTERVAL:
+                prune_resource_data()
+                pruned_at = started
+        except Exception as e:
+            logger.error(f"Resource sampling failed: {str(e)}")
+        completed += 1
+        if rounds is None or completed < rounds:
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
@@ -0,0 +1,192 @@
+"""
+Time-series rollups of ServerResource samples.
+
+Every raw sample is folded into 1-minute, 1-hour and 1-day buckets as it
+is written, so charts never aggregate raw rows. Each bucket keeps count,
+sum, min, max and a log-scale histogram (about 10% wide bins) from which
+p95 is recomputed on every update. Raw samples and the finer rollups are
+pruned after their retention period.
+"""
+import math
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import F, FloatField, Sum
+from django.utils import timezone
+
+from .models import ServerResource, ResourceRollup
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# Seconds each series is kept for
+RESOURCE_RETENTION = {
+    'raw': 2 * 86400,
+    '1m': 7 * 86400,
+    '1h': 90 * 86400,
+    '1d': 2 * 365 * 86400,
+}
+RESOURCE_RETENTION.update(getattr(settings, 'RESOURCE_RETENTION', {}))
+
+# ServerResource field rolled up for each metric
+ROLLUP_METRICS = {
+    'cpu': 'cpu_usage',
+    'memory': 'memory_usage',
+    'disk': 'disk_usage',
+    'connections': 'open_connections',
+}
+
+MAX_CHART_POINTS = 360
+
+HISTOGRAM_MIN = 0.1
+HISTOGRAM_GROWTH = 1.1
+
+
+def histogram_index(value, minimum=HISTOGRAM_MIN):
+    """Bin 0 holds everything below minimum; bin i ends at minimum * GROWTH**i"""
+    if value < minimum:
+        return 0
+    return int(math.log(value / minimum, HISTOGRAM_GROWTH)) + 1
+
+
+def histogram_percentile(histogram, count, q, low, high, minimum=HISTOGRAM_MIN):
+    """Upper edge of the bin holding the q-th quantile, clamped to the observed range"""
+    if not count:
+        return 0.0
+    target = q * count
+    seen = 0
+    for index in sorted(histogram, key=int):
+        seen += histogram[index]
+        if seen >= target:
+            edge = minimum * HISTOGRAM_GROWTH ** int(index) if int(index) else minimum
+            return min(max(edge, low), high)
+    return high
+
+
+def bucket_start(moment, seconds):
+    epoch = int(moment.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=dt_timezone.utc)
+
+
+def _add(rollup, value):
+    if rollup.count:
+        rollup.min = min(rollup.min, value)
+        rollup.max = max(rollup.max, value)
+    else:
+        rollup.min = rollup.max = value
+    rollup.count += 1
+    rollup.total += value
+    index = str(histogram_index(value))
+    rollup.histogram[index] = rollup.histogram.get(index, 0) + 1
+
+
+def record_rollups(samples):
+    """Fold freshly inserted per-project samples into every resolution"""
+    values = {}
+    for sample in samples:
+        if not sample.django_project_id:
+            continue
+        for resolution, seconds in RESOLUTIONS.items():
+            bucket = bucket_start(sample.recorded_at, seconds)
+            for metric, field in ROLLUP_METRICS.items():
+                key = (sample.django_project_id, metric, resolution, bucket)
+                values.setdefault(key, (sample.user_id, []))[1].append(float(getattr(sample, field)))
+    if not values:
+        return
+
+    existing = {
+        (r.django_project_id, r.metric, r.resolution, r.bucket): r
+        for r in ResourceRollup.objects.filter(
+            django_project_id__in={key[0] for key in values},
+            bucket__in={key[3] for key in values},
+        )
+    }
+
+    created, updated = [], []
+    for key, (user_id, observed) in values.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            project_id, metric, resolution, bucket = key
+            rollup = ResourceRollup(
+                user_id=user_id, django_project_id=project_id,
+                metric=metric, resolution=resolution, bucket=bucket, histogram={}
+            )
+            created.append(rollup)
+        else:
+            updated.append(rollup)
+        for value in observed:
+            _add(rollup, value)
+        rollup.p95 = histogram_percentile(rollup.histogram, rollup.count, 0.95, rollup.min, rollup.max)
+
+    if created:
+        ResourceRollup.objects.bulk_create(created)
+    if updated:
+        ResourceRollup.objects.bulk_update(updated, ['count', 'total', 'min', 'max', 'p95', 'histogram'])
+
+
+def prune_resource_data(now=None):
+    """Drop raw samples and rollups past their retention. Returns rows deleted."""
+    now = now or timezone.now()
+    deleted, _ = ServerResource.objects.filter(
+        recorded_at__lt=now - timedelta(seconds=RESOURCE_RETENTION['raw'])
+    ).delete()
+    for resolution in RESOLUTIONS:
+        count, _ = ResourceRollup.objects.filter(
+            resolution=resolution,
+            bucket__lt=now - timedelta(seconds=RESOURCE_RETENTION[resolution]),
+        ).delete()
+        deleted += count
+    if deleted:
+        logger.info(f"Pruned {deleted} resource rows past retention")
+    return deleted
+
+
+def choose_resolution(span_seconds):
+    """
+    Finest resolution that still covers the whole span and keeps the chart
+    within MAX_CHART_POINTS; falls back to the coarsest.
+    """
+    for resolution, seconds in RESOLUTIONS.items():
+        if span_seconds <= RESOURCE_RETENTION[resolution] and span_seconds / seconds <= MAX_CHART_POINTS:
+            return resolution
+    return '1d'
+
+
+def resource_series(user, span_seconds, metrics=('cpu', 'memory')):
+    """
+    Chart series across all of a user's projects for the last span_seconds:
+    {'resolution', 'labels', metric: {'avg', 'p95', 'max'}}. Per-project
+    values are summed, so p95 is an upper bound on the combined p95.
+    """
+    resolution = choose_resolution(span_seconds)
+    since = timezone.now() - timedelta(seconds=span_seconds)
+
+    rows = (
+        ResourceRollup.objects
+        .filter(user=user, resolution=resolution, metric__in=metrics, bucket__gte=since)
+        .values('bucket', 'metric')
+        .annotate(
+            avg=Sum(F('total') / F('count'), output_field=FloatField()),
+            p95_total=Sum('p95'),
+            max_total=Sum('max'),
+        )
+        .order_by('bucket')
+    )
+
+    buckets = sorted({row['bucket'] for row in rows})
+    position = {bucket: i for i, bucket in enumerate(buckets)}
+    label_format = '%m/%d' if resolution == '1d' else '%m/%d %H:%M'
+    series = {
+        'resolution': resolution,
+        'labels': [timezone.localtime(bucket).strftime(label_format) for bucket in buckets],
+    }
+    for metric in metrics:
+        series[metric] = {name: [0.0] * len(buckets) for name in ('avg', 'p95', 'max')}
+    for row in rows:
+        i = position[row['bucket']]
+        metric = series[row['metric']]
+        metric['avg'][i] = round(row['avg'] or 0.0, 2)
+        metric['p95'][i] = round(row['p95_total'] or 0.0, 2)
+        metric['max'][i] = round(row['max_total'] or 0.0, 2)
+    return series
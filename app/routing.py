@@ -0,0 +1,475 @@
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+from .nginx_reload import request_nginx_reload
+from .static_publish import STATIC_PUBLISH_ROOT, STATIC_SITES_ROOT
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Directory holding the generated route tables. It must be writable by the
+# platform user; `install_nginx_routing` creates it and the wildcard server.
+NGINX_ROUTES_DIR = getattr(settings, 'NGINX_ROUTES_DIR', '/etc/nginx/tenants')
+NGINX_TENANT_SERVER_CONF = getattr(settings, 'NGINX_TENANT_SERVER_CONF', '/etc/nginx/sites-available/tenants.conf')
+NGINX_TENANT_SERVER_ENABLED = getattr(settings, 'NGINX_TENANT_SERVER_ENABLED', '/etc/nginx/sites-enabled/tenants.conf')
+NGINX_BROTLI_STATIC = getattr(settings, 'NGINX_BROTLI_STATIC', False)
+NGINX_CACHE_PATH = getattr(settings, 'NGINX_CACHE_PATH', '/var/cache/nginx/tenants')
+NGINX_CACHE_MAX_SIZE = getattr(settings, 'NGINX_CACHE_MAX_SIZE', '2g')
+NGINX_LOG_DIR = getattr(settings, 'NGINX_LOG_DIR', '/var/log/nginx')
+
+ROUTES_STATE = 'routes.json'
+ROUTES_MAP = 'routes.map'
+UPSTREAMS_CONF = 'upstreams.conf'
+CACHE_MAP = 'cache.map'
+CACHE_TIERS_CONF = 'cache_tiers.conf'
+# One access log for every tenant, each line naming its tenant. A per-tenant
+# path would be a variable, which Nginx opens per request as the worker
+# user and so usually can't create under the log directory.
+TENANT_ACCESS_LOG = 'tenants_access.log'
+
+_lock = threading.Lock()
+
+
+def upstream_name(tenant):
+    """Nginx upstream block name for a tenant; $tenant_name is derived back from it"""
+    return "tenant_" + re.sub(r'[^A-Za-z0-9_.-]', '_', tenant)
+
+
+def site_key(site):
+    """Map value marking a host as a static site served from disk"""
+    return "site_" + re.sub(r'[^A-Za-z0-9_.-]', '_', site)
+
+
+def render_upstream(tenant, servers):
+    """
+    Upstream block balancing across the tenant's replicas.
+    max_fails/fail_timeout passively eject a replica that stops answering.
+    """
+    lines = "\n".join(f"    server {server} max_fails=3 fail_timeout=10s;" for server in servers)
+    return f"""upstream {upstream_name(tenant)} {{
+    least_conn;
+{lines}
+    keepalive 16;
+}}
+"""
+
+
+def render_routes_map(routes):
+    """Body of the `map $host $tenant_upstream` block, one line per hostname"""
+    return "".join(
+        f"{hostname} {site_key(route['tenant']) if route.get('kind') == 'site' else upstream_name(route['tenant'])};\n"
+        for hostname, route in sorted(routes.items())
+    )
+
+
+def render_upstreams(routes):
+    """One upstream block per tenant; tenants with several hostnames share it"""
+    tenants = {}
+    for route in routes.values():
+        if route.get('kind') != 'site':
+            tenants[route['tenant']] = route['servers']
+    return "\n".join(render_upstream(tenant, servers) for tenant, servers in sorted(tenants.items()))
+
+
+def render_cache_map(routes):
+    """Body of the `map $host $tenant_cache_ttl` block for tenants with caching on"""
+    return "".join(
+        f"{hostname} {route['cache_ttl']};\n"
+        for hostname, route in sorted(routes.items())
+        if route.get('cache_ttl') and route.get('kind') != 'site'
+    )
+
+
+def render_cache_tiers(routes):
+    """
+    One internal location per cache TTL in use. proxy_cache_valid can't take
+    a variable, so cacheable requests are rewritten into /__cache/<ttl>/.
+    """
+    ttls = sorted({route['cache_ttl'] for route in routes.values() if route.get('cache_ttl')})
+    return "\n".join(f"""location ^~ /__cache/{ttl}/ {{
+    internal;
+    rewrite ^/__cache/{ttl}(/.*)$ $1 break;
+    proxy_pass http://$tenant_upstream;
+    proxy_cache tenant_cache;
+    proxy_cache_valid 200 301 302 {ttl}s;
+    add_header X-Cache-Status $upstream_cache_status;
+}}
+""" for ttl in ttls)
+
+
+def render_tenant_server(routes_dir=NGINX_ROUTES_DIR):
+    """
+    The single wildcard server that fronts every tenant. Per-tenant state
+    lives only in the map and upstream includes, so adding a tenant never
+    touches this file.
+    """
+    # brotli_static needs the third-party ngx_brotli module
+    brotli_static = "\n        brotli_static on;" if NGINX_BROTLI_STATIC else ""
+    return f"""# Wildcard server for all hosted tenants. Generated by install_nginx_routing.
+# Routes live in {routes_dir}/{ROUTES_MAP}; do not add per-tenant server blocks.
+
+map_hash_max_size 262144;
+map_hash_bucket_size 128;
+
+map $host $tenant_upstream {{
+    hostnames;
+    default "";
+    include {routes_dir}/{ROUTES_MAP};
+}}
+
+map $tenant_upstream $tenant_name {{
+    default "";
+    "~^(?:tenant|site)_(?<name>.+)$" $name;
+}}
+
+map $tenant_upstream $tenant_is_site {{
+    default 0;
+    "~^site_" 1;
+}}
+
+# Content-hashed file names can be cached forever; everything else revalidates by ETag
+map $uri $site_cache_control {{
+    default "no-cache";
+    "~\\.[0-9a-f]{{8,}}\\.[A-Za-z0-9]+$" "public, max-age=31536000, immutable";
+}}
+
+include {routes_dir}/{UPSTREAMS_CONF};
+
+# Only send "Connection: upgrade" for WebSocket requests so other requests
+# keep their upstream keepalive connection
+map $http_upgrade $tenant_connection_upgrade {{
+    default upgrade;
+    "" "";
+}}
+
+# Shared micro-cache for tenants with a cache profile
+proxy_cache_path {NGINX_CACHE_PATH} levels=1:2 keys_zone=tenant_cache:50m max_size={NGINX_CACHE_MAX_SIZE} inactive=10m use_temp_path=off;
+
+map $host $tenant_cache_ttl {{
+    hostnames;
+    default 0;
+    include {routes_dir}/{CACHE_MAP};
+}}
+
+# Only anonymous GET/HEAD requests are cached
+map "$request_method|$http_authorization$cookie_sessionid|$tenant_cache_ttl" $tenant_cache_path {{
+    default "";
+    "~^(?:GET|HEAD)\\|\\|(?<ttl>[1-9][0-9]*)$" /__cache/$ttl;
+}}
+
+# One JSON object per request, read by app/access_logs.py
+log_format tenant_json escape=json '{{"time":"$time_iso8601","tenant":"$tenant_name","host":"$host","remote_addr":"$remote_addr",'
+                                   '"method":"$request_method","uri":"$request_uri","status":$status,'
+                                   '"bytes_sent":$bytes_sent,"request_length":$request_length,'
+                                   '"request_time":$request_time,"upstream_response_time":"$upstream_response_time",'
+                                   '"cache":"$upstream_cache_status","referer":"$http_referer",'
+                                   '"user_agent":"$http_user_agent"}}';
+
+server {{
+    listen 80;
+    server_name ~.+;
+
+    if ($tenant_upstream = "") {{
+        return 404;
+    }}
+
+    # Static sites never reach an upstream; see location @site
+    error_page 418 = @site;
+
+    # Logging
+    access_log {NGINX_LOG_DIR}/{TENANT_ACCESS_LOG} tenant_json;
+    error_log {NGINX_LOG_DIR}/tenants_error.log;
+
+    # Proxy settings
+    proxy_set_header Host $host;
+    proxy_set_header X-Real-IP $remote_addr;
+    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+    proxy_set_header X-Forwarded-Proto $scheme;
+    proxy_set_header X-Forwarded-Host $host;
+
+    # WebSocket support
+    proxy_http_version 1.1;
+    proxy_set_header Upgrade $http_upgrade;
+    proxy_set_header Connection $tenant_connection_upgrade;
+
+    # Timeouts
+    proxy_connect_timeout 60s;
+    proxy_send_timeout 60s;
+    proxy_read_timeout 60s;
+
+    # Retry idempotent requests on another replica
+    proxy_next_upstream error timeout http_502 http_503;
+    proxy_next_upstream_tries 2;
+
+    # Cache behaviour for the /__cache/<ttl>/ tiers
+    proxy_cache_key $scheme$host$request_uri;
+    proxy_cache_lock on;
+    proxy_cache_lock_timeout 5s;
+    proxy_cache_use_stale error timeout updating http_500 http_502 http_503 http_504;
+    proxy_cache_background_update on;
+
+    location / {{
+        if ($tenant_is_site) {{
+            return 418;
+        }}
+        if ($tenant_cache_path) {{
+            rewrite ^(.*)$ $tenant_cache_path$1 last;
+        }}
+        proxy_pass http://$tenant_upstream;
+    }}
+
+    include {routes_dir}/{CACHE_TIERS_CONF};
+
+    # Static sites published by static_sites, served straight from disk
+    location @site {{
+        root {STATIC_SITES_ROOT}/$tenant_name/current/public;
+        gzip_static on;{brotli_static}
+        try_files $uri $uri/index.html $uri.html =404;
+        add_header Cache-Control $site_cache_control;
+    }}
+
+    # Files missing from the published tree (e.g. projects on a worker node) go to the app
+    location @tenant {{
+        proxy_pass http://$tenant_upstream;
+    }}
+
+    # Static files published by static_publish, with precompressed siblings
+    location /static/ {{
+        if ($tenant_is_site) {{
+            return 418;
+        }}
+        root {STATIC_PUBLISH_ROOT}/$tenant_name;
+        gzip_static on;{brotli_static}
+        try_files $uri @tenant;
+        expires 1h;
+
+        # ManifestStaticFilesStorage names (name.<12 hex>.ext) never change content
+        location ~ "\\.[0-9a-f]{{12}}\\.[A-Za-z0-9]+$" {{
+            gzip_static on;{brotli_static}
+            try_files $uri @tenant;
+            add_header Cache-Control "public, max-age=31536000, immutable";
+        }}
+    }}
+
+    # Media files
+    location /media/ {{
+        if ($tenant_is_site) {{
+            return 418;
+        }}
+        root {STATIC_PUBLISH_ROOT}/$tenant_name;
+        try_files $uri @tenant;
+        expires 30d;
+    }}
+}}
+"""
+
+
+def _atomic_write(path, content):
+    """Write via a temp file in the same directory and rename over the target"""
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class RouteTable:
+    """
+    hostname -> {'tenant': name, 'servers': ['host:port', ...]} persisted as
+    JSON next to the generated Nginx includes. Every mutation rewrites the
+    map and upstream files atomically under a file lock, so concurrent
+    deploys from several worker processes can't interleave.
+    """
+
+    def __init__(self, routes_dir=NGINX_ROUTES_DIR):
+        self.routes_dir = routes_dir
+        self.state_path = os.path.join(routes_dir, ROUTES_STATE)
+        self.map_path = os.path.join(routes_dir, ROUTES_MAP)
+        self.upstreams_path = os.path.join(routes_dir, UPSTREAMS_CONF)
+        self.cache_map_path = os.path.join(routes_dir, CACHE_MAP)
+        self.cache_tiers_path = os.path.join(routes_dir, CACHE_TIERS_CONF)
+
+    def load(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.error(f"Corrupt route table {self.state_path}: {str(e)}")
+            return {}
+
+    def write(self, routes):
+        os.makedirs(self.routes_dir, exist_ok=True)
+        # Upstreams first so the map never references an undefined block
+        _atomic_write(self.upstreams_path, render_upstreams(routes))
+        _atomic_write(self.cache_tiers_path, render_cache_tiers(routes))
+        _atomic_write(self.cache_map_path, render_cache_map(routes))
+        _atomic_write(self.map_path, render_routes_map(routes))
+        _atomic_write(self.state_path, json.dumps(routes, sort_keys=True))
+
+    @contextmanager
+    def _locked(self):
+        """Hold the in-process lock and the file lock shared with other processes"""
+        with _lock, open(os.path.join(self.routes_dir, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def update(self, mutate):
+        """
+        Apply mutate(routes) under the lock and rewrite the tables.
+
+        Returns a rollback callable that undoes only this change: each
+        hostname it touched is put back as it was, unless a later change
+        has since rewritten that hostname, in which case the later change
+        wins. Other changes made in between are left alone.
+        """
+        os.makedirs(self.routes_dir, exist_ok=True)
+        with self._locked():
+            previous = self.load()
+            routes = json.loads(json.dumps(previous))
+            mutate(routes)
+            self.write(routes)
+
+        changed = {
+            hostname: (previous.get(hostname), routes.get(hostname))
+            for hostname in set(previous) | set(routes)
+            if previous.get(hostname) != routes.get(hostname)
+        }
+
+        def rollback():
+            if not changed:
+                return
+            with self._locked():
+                current = self.load()
+                for hostname, (before, after) in changed.items():
+                    if current.get(hostname) != after:
+                        continue
+                    if before is None:
+                        current.pop(hostname, None)
+                    else:
+                        current[hostname] = before
+                self.write(current)
+
+        return rollback
+
+    def config_paths(self):
+        return [self.map_path, self.upstreams_path, self.cache_map_path, self.cache_tiers_path]
+
+
+route_table = RouteTable()
+
+
+def set_route(hostname, tenant, servers, cache_ttl=None):
+    """
+    Point hostname at the tenant's replicas (list of 'host:port') and
+    reload Nginx. cache_ttl=None keeps the route's current cache setting.
+    Returns (success, message).
+    """
+    def mutate(routes):
+        previous_ttl = routes.get(hostname, {}).get('cache_ttl', 0)
+        routes[hostname] = {'tenant': tenant, 'servers': list(servers)}
+        ttl = previous_ttl if cache_ttl is None else cache_ttl
+        if ttl:
+            routes[hostname]['cache_ttl'] = ttl
+        # Keep other hostnames of the same tenant on the same replica set
+        for route in routes.values():
+            if route['tenant'] == tenant and route.get('kind') != 'site':
+                route['servers'] = list(servers)
+
+    try:
+        rollback = route_table.update(mutate)
+    except Exception as e:
+        logger.error(f"Error updating route for {hostname}: {str(e)}")
+        return False, f"Failed to update routing table: {str(e)[:200]}"
+
+    success, message = request_nginx_reload(hostname, route_table.config_paths(), rollback)
+    if success:
+        logger.info(f"Route {hostname} -> {', '.join(servers)} applied")
+    else:
+        logger.error(f"Route for {hostname} not applied: {message}")
+    return success, message
+
+
+def set_cache_ttl(hostnames, ttl):
+    """Change edge caching for already-routed hostnames (0 disables it). Returns (success, message)."""
+    def mutate(routes):
+        for hostname in hostnames:
+            if hostname not in routes:
+                continue
+            if ttl:
+                routes[hostname]['cache_ttl'] = ttl
+            else:
+                routes[hostname].pop('cache_ttl', None)
+
+    try:
+        rollback = route_table.update(mutate)
+    except Exception as e:
+        logger.error(f"Error updating cache settings: {str(e)}")
+        return False, f"Failed to update routing table: {str(e)[:200]}"
+
+    return request_nginx_reload(f"cache {', '.join(hostnames)}", route_table.config_paths(), rollback)
+
+
+def set_site_route(hostnames, site):
+    """
+    Serve hostnames from the static site's published `current` release.
+    Returns (success, message).
+    """
+    def mutate(routes):
+        for hostname in hostnames:
+            routes[hostname] = {'tenant': site, 'kind': 'site', 'servers': []}
+
+    try:
+        rollback = route_table.update(mutate)
+    except Exception as e:
+        logger.error(f"Error updating route for {site}: {str(e)}")
+        return False, f"Failed to update routing table: {str(e)[:200]}"
+
+    return request_nginx_reload(site, route_table.config_paths(), rollback)
+
+
+def remove_route(hostname):
+    """Drop hostname from the routing table and reload Nginx. Returns (success, message)."""
+    try:
+        if hostname not in route_table.load():
+            return True, "Route not present"
+        rollback = route_table.update(lambda routes: routes.pop(hostname, None))
+    except Exception as e:
+        logger.error(f"Error removing route for {hostname}: {str(e)}")
+        return False, f"Failed to update routing table: {str(e)[:200]}"
+
+    return request_nginx_reload(f"remove {hostname}", route_table.config_paths(), rollback)
+
+
+def install_tenant_server():
+    """Write and enable the wildcard tenant server. Returns (success, message)."""
+    try:
+        os.makedirs(NGINX_ROUTES_DIR, exist_ok=True)
+        # Make sure every include exists before Nginx sees the server that includes them
+        route_table.update(lambda routes: None)
+        _atomic_write(NGINX_TENANT_SERVER_CONF, render_tenant_server())
+        if not os.path.lexists(NGINX_TENANT_SERVER_ENABLED):
+            os.symlink(NGINX_TENANT_SERVER_CONF, NGINX_TENANT_SERVER_ENABLED)
+    except Exception as e:
+        logger.error(f"Error installing tenant server: {str(e)}")
+        return False, f"Failed to install tenant server: {str(e)[:200]}"
+
+    return request_nginx_reload('tenant server', [NGINX_TENANT_SERVER_CONF])
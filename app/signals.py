@@ -0,0 +1,18 @@
+"""
+Keep cached per-user data in step with the rows it is built from.
+Connected from AppConfig.ready().
+"""
+from django.db.models.signals import post_delete, post_save
+
+from .models import Website, DjangoProject, UserFile, PaymentRequest
+from .summary import invalidate_user_summary
+
+
+def drop_user_summary(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        invalidate_user_summary(instance.user_id)
+
+
+for model in (Website, DjangoProject, UserFile, PaymentRequest):
+    post_save.connect(drop_user_summary, sender=model, dispatch_uid=f'user_summary_save_{model.__name__}')
+    post_delete.connect(drop_user_summary, sender=model, dispatch_uid=f'user_summary_delete_{model.__name__}')
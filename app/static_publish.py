@@ -0,0 +1,174 @@
+import os
+import json
+import gzip
+import time
+import shutil
+import logging
+import subprocess
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Nginx serves /static/ and /media/ for each tenant from {root}/{tenant}/
+STATIC_PUBLISH_ROOT = getattr(settings, 'STATIC_PUBLISH_ROOT', '/var/www')
+# Older releases are kept briefly so in-flight requests for old assets still resolve
+STATIC_RELEASES_KEPT = getattr(settings, 'STATIC_RELEASES_KEPT', 3)
+# Static (Website) sites live outside STATIC_PUBLISH_ROOT, where a tenant named
+# "sites" would otherwise share its web root with every static release
+STATIC_SITES_ROOT = getattr(settings, 'STATIC_SITES_ROOT', '/var/www-sites')
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.htm',
+    '.xml', '.ico', '.wasm', '.ttf', '.otf', '.eot',
+}
+MIN_COMPRESS_SIZE = 256
+
+
+def tenant_web_root(tenant):
+    return os.path.join(STATIC_PUBLISH_ROOT, tenant)
+
+
+def query_project_paths(project_root, python_cmd):
+    """Ask the tenant project where collectstatic wrote to and where uploads go"""
+    script = (
+        "import json; from django.conf import settings; "
+        "print(json.dumps([str(settings.STATIC_ROOT or ''), str(settings.MEDIA_ROOT or '')]))"
+    )
+    try:
+        result = subprocess.run(
+            [python_cmd, 'manage.py', 'shell', '-c', script],
+            cwd=project_root, capture_output=True, text=True, timeout=60
+        )
+        if result.returncode == 0:
+            static_root, media_root = json.loads(result.stdout.strip().splitlines()[-1])
+            return static_root or None, media_root or None
+        logger.warning(f"Could not read static settings: {result.stderr[-300:]}")
+    except Exception as e:
+        logger.warning(f"Could not read static settings: {str(e)}")
+
+    return os.path.join(project_root, 'staticfiles'), os.path.join(project_root, 'media')
+
+
+def _link_or_copy(src, dst):
+    """Hard link when the release lives on the same filesystem, copy otherwise"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def precompress(directory):
+    """
+    Write .gz (and .br when brotli is installed) next to every compressible
+    file for gzip_static/brotli_static. Returns the number of files written.
+    """
+    written = 0
+    for dirpath, _, filenames in os.walk(directory):
+        names = set(filenames)
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.getsize(path) < MIN_COMPRESS_SIZE:
+                continue
+
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            encoders = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+            if brotli:
+                encoders.append(('.br', lambda d: brotli.compress(d, quality=11)))
+
+            for suffix, encode in encoders:
+                # WhiteNoise's storage may already have produced these
+                if name + suffix in names:
+                    continue
+                compressed = encode(data)
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                os.utime(path + suffix, (os.path.getatime(path), os.path.getmtime(path)))
+                written += 1
+    return written
+
+
+def swap_symlink(target, link_path):
+    """Atomically point link_path at target"""
+    if os.path.isdir(link_path) and not os.path.islink(link_path):
+        shutil.rmtree(link_path)
+    temp_link = f"{link_path}.tmp"
+    if os.path.lexists(temp_link):
+        os.remove(temp_link)
+    os.symlink(target, temp_link)
+    os.replace(temp_link, link_path)
+
+
+def prune_releases(releases_dir, keep):
+    releases = sorted(
+        (entry for entry in os.scandir(releases_dir) if entry.is_dir(follow_symlinks=False)),
+        key=lambda entry: entry.name
+    )
+    for entry in releases[:-max(keep, 1)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def publish_static(tenant, static_root):
+    """
+    Copy collected static files into a new release under the tenant's web
+    root, precompress it and swap the `static` symlink over to it.
+    Returns the release path, or None if there was nothing to publish.
+    """
+    if not static_root or not os.path.isdir(static_root):
+        logger.warning(f"No collected static files for {tenant} at {static_root}")
+        return None
+
+    web_root = tenant_web_root(tenant)
+    releases_dir = os.path.join(web_root, 'releases')
+    os.makedirs(releases_dir, exist_ok=True)
+
+    release = os.path.join(releases_dir, f"static-{time.time_ns()}")
+    shutil.copytree(static_root, release, copy_function=_link_or_copy)
+    compressed = precompress(release)
+
+    swap_symlink(release, os.path.join(web_root, 'static'))
+    prune_releases(releases_dir, STATIC_RELEASES_KEPT)
+
+    logger.info(f"Published static files for {tenant} ({compressed} precompressed)")
+    return release
+
+
+def link_media(tenant, media_root):
+    """Point the tenant's served media path at the project's MEDIA_ROOT"""
+    if not media_root:
+        return
+    os.makedirs(media_root, exist_ok=True)
+    os.makedirs(tenant_web_root(tenant), exist_ok=True)
+    swap_symlink(os.path.abspath(media_root), os.path.join(tenant_web_root(tenant), 'media'))
+
+
+def publish_tenant_assets(tenant, django_info, python_cmd):
+    """Publish a deployed project's static and media files for Nginx. Returns True on success."""
+    manage_py_path = django_info.get('manage_py_path')
+    if not manage_py_path:
+        return False
+
+    try:
+        static_root, media_root = query_project_paths(os.path.dirname(manage_py_path), python_cmd)
+        release = publish_static(tenant, static_root)
+        link_media(tenant, media_root)
+        return release is not None
+    except Exception as e:
+        logger.error(f"Error publishing static files for {tenant}: {str(e)}")
+        return False
+
+
+def remove_tenant_assets(tenant):
+    web_root = tenant_web_root(tenant)
+    if os.path.isdir(web_root):
+        shutil.rmtree(web_root, ignore_errors=True)
@@ -0,0 +1,183 @@
+import os
+import re
+import json
+import stat
+import time
+import shutil
+import hashlib
+import logging
+import zipfile
+from django.conf import settings
+
+from .routing import set_site_route, remove_route
+from .static_publish import STATIC_SITES_ROOT, STATIC_RELEASES_KEPT, precompress, swap_symlink, prune_releases
+
+logger = logging.getLogger(__name__)
+
+STATIC_SITE_MAX_BYTES = getattr(settings, 'STATIC_SITE_MAX_BYTES', 500 * 1024 * 1024)
+STATIC_SITE_MAX_FILES = getattr(settings, 'STATIC_SITE_MAX_FILES', 20000)
+
+# Nginx derives ETags from mtime and size. Pinning mtime to the content hash
+# makes them strong validators that survive redeploys of unchanged files.
+ETAG_EPOCH = 1_000_000_000
+ETAG_SPAN = 2 ** 28
+
+READ_CHUNK = 1024 * 1024
+
+
+class StaticSiteError(Exception):
+    """Raised when an uploaded site archive cannot be published"""
+
+
+def site_label(name):
+    """DNS-safe host label for a site"""
+    return re.sub(r'[^a-z0-9-]+', '-', name.lower()).strip('-')[:63]
+
+
+def site_root(site):
+    return os.path.join(STATIC_SITES_ROOT, site)
+
+
+def _archive_prefix(names):
+    """Common top-level folder to strip when the ZIP wraps the site in one directory"""
+    tops = {name.split('/', 1)[0] for name in names if name}
+    if len(tops) == 1 and all('/' in name for name in names if name):
+        return tops.pop() + '/'
+    return ''
+
+
+def _safe_member_path(public_dir, name):
+    """Resolve an archive member under public_dir, refusing anything that escapes it"""
+    if name.startswith('/') or '\\' in name or re.match(r'^[A-Za-z]:', name):
+        raise StaticSiteError(f"Unsafe path in archive: {name}")
+    target = os.path.realpath(os.path.join(public_dir, name))
+    if target != public_dir and not target.startswith(public_dir + os.sep):
+        raise StaticSiteError(f"Unsafe path in archive: {name}")
+    return target
+
+
+def extract_release(zip_path, public_dir):
+    """
+    Stream the archive into public_dir, hashing each file as it is written.
+    Returns {relative_path: {'sha256', 'size'}}.
+    """
+    files = {}
+    total = 0
+
+    with zipfile.ZipFile(zip_path) as archive:
+        members = [
+            m for m in archive.infolist()
+            if not m.is_dir() and not m.filename.startswith('__MACOSX/')
+        ]
+        if len(members) > STATIC_SITE_MAX_FILES:
+            raise StaticSiteError(f"Archive has more than {STATIC_SITE_MAX_FILES} files")
+
+        prefix = _archive_prefix([m.filename for m in members])
+        for member in members:
+            name = member.filename[len(prefix):]
+            if not name or name.startswith('__MACOSX/') or os.path.basename(name) == '.DS_Store':
+                continue
+            if stat.S_ISLNK(member.external_attr >> 16):
+                logger.warning(f"Skipping symlink in archive: {member.filename}")
+                continue
+
+            target = _safe_member_path(public_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+
+            digest = hashlib.sha256()
+            size = 0
+            with archive.open(member) as source, open(target, 'wb') as out:
+                while True:
+                    chunk = source.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    total += len(chunk)
+                    if total > STATIC_SITE_MAX_BYTES:
+                        raise StaticSiteError(f"Site is larger than {STATIC_SITE_MAX_BYTES // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            files[name] = {'sha256': digest.hexdigest(), 'size': size}
+
+    return files
+
+
+def pin_mtimes(public_dir, files):
+    """Set each file's mtime from its content hash so Nginx ETags track content"""
+    for name, info in files.items():
+        mtime = ETAG_EPOCH + int(info['sha256'][:8], 16) % ETAG_SPAN
+        os.utime(os.path.join(public_dir, name), (mtime, mtime))
+        info['etag'] = f'"{mtime:x}-{info["size"]:x}"'
+
+
+def write_manifest(release, files):
+    """manifest.json sits next to public/ so it is never served"""
+    public_dir = os.path.join(release, 'public')
+    for name, info in files.items():
+        path = os.path.join(public_dir, name)
+        info['encodings'] = [ext for ext in ('gz', 'br') if os.path.exists(f"{path}.{ext}")]
+
+    manifest = {'created_at': int(time.time()), 'files': files}
+    with open(os.path.join(release, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def publish_site(site, zip_path):
+    """
+    Build a new release from the uploaded ZIP and make it current.
+    Returns the release path.
+    """
+    root = site_root(site)
+    releases_dir = os.path.join(root, 'releases')
+    release = os.path.join(releases_dir, f"site-{time.time_ns()}")
+    public_dir = os.path.join(release, 'public')
+    os.makedirs(public_dir)
+
+    try:
+        files = extract_release(zip_path, os.path.realpath(public_dir))
+        if 'index.html' not in files:
+            raise StaticSiteError("Archive has no index.html at its top level")
+        pin_mtimes(public_dir, files)
+        compressed = precompress(public_dir)
+        write_manifest(release, files)
+    except Exception:
+        # A first deploy that fails leaves nothing behind
+        target = root if not os.path.lexists(os.path.join(root, 'current')) else release
+        shutil.rmtree(target, ignore_errors=True)
+        raise
+
+    swap_symlink(release, os.path.join(root, 'current'))
+    prune_releases(releases_dir, STATIC_RELEASES_KEPT)
+
+    logger.info(f"Published static site {site}: {len(files)} files, {compressed} precompressed")
+    return release
+
+
+def deploy_static_site(site, zip_path, hostnames):
+    """Publish the site and route its hostnames to it. Returns (success, error)."""
+    try:
+        publish_site(site, zip_path)
+    except (StaticSiteError, zipfile.BadZipFile) as e:
+        logger.error(f"Static site {site} rejected: {str(e)}")
+        return False, str(e)
+    except Exception as e:
+        logger.error(f"Static site deployment error: {str(e)}")
+        return False, str(e)
+
+    success, message = set_site_route(hostnames, site)
+    if not success:
+        logger.error(f"Routing for static site {site} not applied: {message}")
+        return False, f"Site published but could not be routed: {message}"
+    return True, None
+
+
+def site_is_live(site):
+    """True when the site has a current release with an index page"""
+    return os.path.isfile(os.path.join(site_root(site), 'current', 'public', 'index.html'))
+
+
+def remove_static_site(site, hostnames):
+    for hostname in hostnames:
+        remove_route(hostname)
+    shutil.rmtree(site_root(site), ignore_errors=True)
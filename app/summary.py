@@ -0,0 +1,143 @@
+"""
+Per-user account summary shared by the dashboard, settings and reports.
+
+The counts, storage and purchased quota come from a single query and are
+cached per user. Signals in app/signals.py drop the entry whenever one
+of the rows it is built from is saved or deleted; code that writes with
+bulk_update() or QuerySet.update() (which send no signals) calls
+invalidate_user_summary() itself.
+
+Invalidation only reaches other processes (gunicorn workers, the
+collectors) through a shared cache. With the per-process locmem backend
+entries are kept for a few seconds instead, so a change made elsewhere
+shows up almost at once.
+"""
+import logging
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Website, DjangoProject, UserFile, PaymentRequest
+
+logger = logging.getLogger(__name__)
+
+USER_SUMMARY_CACHE_TIMEOUT = getattr(settings, 'USER_SUMMARY_CACHE_TIMEOUT', 3600)
+USER_SUMMARY_LOCAL_CACHE_TIMEOUT = getattr(settings, 'USER_SUMMARY_LOCAL_CACHE_TIMEOUT', 5)
+
+
+def _summary_key(user_id):
+    return f'user_summary:{user_id}'
+
+
+def _summary_timeout():
+    """Long-lived only where invalidations from other processes can reach the entry"""
+    if isinstance(caches['default'], LocMemCache):
+        return USER_SUMMARY_LOCAL_CACHE_TIMEOUT
+    return USER_SUMMARY_CACHE_TIMEOUT
+
+
+def _per_user(queryset, aggregate, output_field=None):
+    """Correlated subquery computing `aggregate` over the outer user's rows"""
+    rows = (
+        queryset
+        .filter(user=OuterRef('pk'))
+        .order_by()
+        .values('user')
+        .annotate(value=aggregate)
+        .values('value')
+    )
+    output_field = output_field or IntegerField()
+    return Coalesce(Subquery(rows, output_field=output_field), 0, output_field=output_field)
+
+
+def compute_user_summary(user_id):
+    """Counts, storage (bytes) and purchased GB for one user, in one query"""
+    active = Q(is_active=True)
+    row = (
+        User.objects
+        .filter(pk=user_id)
+        .annotate(
+            static_sites=_per_user(Website.objects, Count('id')),
+            active_static_sites=_per_user(Website.objects, Count('id', filter=active)),
+            site_storage=_per_user(Website.objects, Sum('file_size')),
+            django_projects=_per_user(DjangoProject.objects, Count('id')),
+            active_django_projects=_per_user(DjangoProject.objects, Count('id', filter=active)),
+            project_storage=_per_user(DjangoProject.objects, Sum('file_size')),
+            file_storage=_per_user(UserFile.objects, Sum('file_size')),
+            purchased_gb=_per_user(
+                PaymentRequest.objects.filter(status='approved'), Sum('gb_requested'),
+                DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        .values(
+            'static_sites', 'active_static_sites', 'site_storage',
+            'django_projects', 'active_django_projects', 'project_storage',
+            'file_storage', 'purchased_gb',
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    row['purchased_gb'] = float(row['purchased_gb'])
+    row['total_deployments'] = row['static_sites'] + row['django_projects']
+    row['active_sites'] = row['active_static_sites'] + row['active_django_projects']
+    row['deployment_storage'] = row['site_storage'] + row['project_storage']
+    return row
+
+
+def storage_usage(user_id):
+    """
+    (bytes used by uploads, purchased GB) read fresh for quota checks, as
+    the cached summary may be stale in other workers. Uploads saved
+    before sizes were recorded are stat'ed once and their size stored.
+    """
+    files = UserFile.objects.filter(user_id=user_id)
+    used = files.aggregate(total=Sum('file_size'))['total'] or 0
+    measured = 0
+    for user_file in files.filter(file_size__isnull=True).only('id', 'file'):
+        try:
+            size = user_file.file.size
+        except (OSError, ValueError):
+            continue
+        UserFile.objects.filter(pk=user_file.pk).update(file_size=size)
+        used += size
+        measured += 1
+    if measured:
+        invalidate_user_summary(user_id)
+
+    purchased = PaymentRequest.objects.filter(user_id=user_id, status='approved').aggregate(
+        total=Sum('gb_requested')
+    )['total'] or 0
+    return used, float(purchased)
+
+
+def get_user_summary(user):
+    """Cached summary for `user`; at most one query on a miss"""
+    key = _summary_key(user.pk)
+    try:
+        summary = cache.get(key)
+    except Exception as e:
+        logger.error(f"Could not read summary cache for user {user.pk}: {str(e)}")
+        summary = None
+    if summary is None:
+        summary = compute_user_summary(user.pk)
+        try:
+            cache.set(key, summary, _summary_timeout())
+        except Exception as e:
+            logger.error(f"Could not cache summary for user {user.pk}: {str(e)}")
+    return summary
+
+
+def invalidate_user_summary(*user_ids):
+    try:
+        cache.delete_many([_summary_key(user_id) for user_id in user_ids])
+    except Exception as e:
+        logger.error(f"Could not invalidate user summaries {user_ids}: {str(e)}")
+
+
+def clear_user_summaries():
+    """Drop every cached summary, after a bulk write across many users"""
+    invalidate_user_summary(*User.objects.values_list('pk', flat=True))
@@ -0,0 +1,312 @@
+"""
+Background collectors, run by `manage.py run_collectors` (and
+`manage.py run_process_watcher` for replica exits).
+
+Page views read what these store instead of probing every tenant on
+each request.
+"""
+import os
+import time
+import logging
+from datetime import datetime, timezone as dt_timezone
+from concurrent.futures import ThreadPoolExecutor
+import psutil
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import DjangoProject, ProjectStatus, DeployedProject
+from .nodes import project_status
+from .metrics import tenant_up, user_storage_bytes
+from .disk_usage import DiskUsageTracker
+from .process_watch import CREATE_TIME_TOLERANCE, ProcessWatcher
+from .summary import invalidate_user_summary
+from .utils import MEDIA_ROOT, runtime_file, read_replica_files, read_exit_file, tenant_key
+
+logger = logging.getLogger(__name__)
+
+STATUS_COLLECT_INTERVAL = getattr(settings, 'STATUS_COLLECT_INTERVAL', 30)
+# Remote checks are HTTP calls to node agents, so run a few side by side
+STATUS_COLLECT_WORKERS = getattr(settings, 'STATUS_COLLECT_WORKERS', 8)
+
+
+def _check(project):
+    safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
+    try:
+        return project_status(project, project.user.username, safe_name, project.domain_name)
+    except Exception as e:
+        logger.error(f"Error checking status for project {project.id}: {e}")
+        return {'status': False, 'error': str(e)}
+
+
+def _observed_state(status):
+    return {
+        'is_running': bool(status.get('status')),
+        'replicas_running': int(status.get('replicas_running') or 0),
+        'ports': list(status.get('ports') or []),
+        'error': str(status.get('error') or ''),
+    }
+
+
+def collect_project_status():
+    """
+    Check every deployed project and record the result. Rows are only
+    written when a project's state actually changed. Returns the number
+    of projects whose state changed.
+    """
+    projects = list(
+        DjangoProject.objects
+        .exclude(domain_name__isnull=True).exclude(domain_name='')
+        .exclude(deployment_status='failed')
+        .select_related('user', 'node', 'status')
+    )
+    if not projects:
+        tenant_up.set_all({})
+        return 0
+
+    with ThreadPoolExecutor(max_workers=STATUS_COLLECT_WORKERS) as pool:
+        results = list(pool.map(_check, projects))
+
+    now = timezone.now()
+    new_statuses, changed_statuses, changed_projects = [], [], []
+    up = {}
+
+    for project, status in zip(projects, results):
+        state = _observed_state(status)
+        up[(tenant_key(project),)] = 1 if state['is_running'] else 0
+
+        try:
+            current = project.status
+        except ProjectStatus.DoesNotExist:
+            current = None
+
+        if current is None:
+            new_statuses.append(ProjectStatus(django_project=project, changed_at=now, **state))
+        elif any(getattr(current, field) != value for field, value in state.items()):
+            for field, value in state.items():
+                setattr(current, field, value)
+            current.changed_at = now
+            changed_statuses.append(current)
+
+        if state['is_running'] and not project.is_active:
+            project.is_active = True
+            project.deployment_status = 'deployed'
+            changed_projects.append(project)
+        elif not state['is_running'] and project.is_active:
+            project.is_active = False
+            project.deployment_status = 'error'
+            changed_projects.append(project)
+
+    if new_statuses:
+        ProjectStatus.objects.bulk_create(new_statuses, ignore_conflicts=True)
+    if changed_statuses:
+        ProjectStatus.objects.bulk_update(
+            changed_statuses, ['is_running', 'replicas_running', 'ports', 'error', 'changed_at']
+        )
+    tenant_up.set_all(up)
+    if changed_projects:
+        DjangoProject.objects.bulk_update(changed_projects, ['is_active', 'deployment_status'])
+        invalidate_user_summary(*{project.user_id for project in changed_projects})
+        for project in changed_projects:
+            logger.info(f"Project {project.id} is now {project.deployment_status}")
+
+    return len(new_statuses) + len(changed_statuses)
+
+
+DEPLOYED_LIVENESS_CACHE_KEY = 'deployed_project_liveness'
+DEPLOYED_LIVENESS_TTL = getattr(settings, 'DEPLOYED_LIVENESS_TTL', 5)
+
+
+def refresh_deployed_liveness():
+    """
+    Check every DeployedProject's process against one snapshot of the
+    process table and save only the rows whose state changed.
+    Returns {project_id: running}.
+    """
+    live_pids = set(psutil.pids())
+    liveness, changed = {}, []
+
+    for project in DeployedProject.objects.only('id', 'pid', 'pid_create_time', 'running'):
+        running, create_time = False, project.pid_create_time
+        if project.pid and project.pid in live_pids:
+            try:
+                started = psutil.Process(project.pid).create_time()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                started = None
+            if started is not None:
+                if create_time is None:
+                    # First sighting since the PID was stored: adopt it
+                    create_time = started
+                running = abs(started - create_time) < CREATE_TIME_TOLERANCE
+
+        liveness[project.id] = running
+        if running != project.running or create_time != project.pid_create_time:
+            project.running = running
+            project.pid_create_time = create_time
+            changed.append(project)
+
+    if changed:
+        DeployedProject.objects.bulk_update(changed, ['running', 'pid_create_time'])
+
+    cache.set(DEPLOYED_LIVENESS_CACHE_KEY, liveness, DEPLOYED_LIVENESS_TTL)
+    return liveness
+
+
+def deployed_liveness():
+    """{project_id: running}, refreshed at most every DEPLOYED_LIVENESS_TTL seconds"""
+    liveness = cache.get(DEPLOYED_LIVENESS_CACHE_KEY)
+    if liveness is None:
+        liveness = refresh_deployed_liveness()
+    return liveness
+
+
+def invalidate_deployed_liveness():
+    """Call after starting or stopping a project so the next view sees it"""
+    cache.delete(DEPLOYED_LIVENESS_CACHE_KEY)
+
+
+_storage_tracker = DiskUsageTracker()
+
+
+def collect_user_storage():
+    """Bytes under MEDIA_ROOT/user_uploads/<username>/ for every user, for /metrics"""
+    uploads_root = os.path.join(settings.MEDIA_ROOT, 'user_uploads')
+    usage = {}
+    if os.path.isdir(uploads_root):
+        for entry in os.scandir(uploads_root):
+            if entry.is_dir(follow_symlinks=False):
+                usage[(entry.name,)] = _storage_tracker.usage(entry.path)
+    user_storage_bytes.set_all(usage)
+    return usage
+
+
+PROCESS_WATCH_REFRESH = getattr(settings, 'PROCESS_WATCH_REFRESH', 10)
+# Time given to the process that started a replica to record its exit code
+EXIT_CODE_GRACE = 0.5
+
+
+class ExitWatcher:
+    """
+    Records replica exits of locally hosted projects the moment they
+    happen. Pid files are re-read every PROCESS_WATCH_REFRESH seconds to
+    pick up new replicas; exits themselves arrive through ProcessWatcher.
+    A replica whose pid file was removed was stopped on purpose and is
+    not recorded.
+    """
+
+    def __init__(self, refresh=PROCESS_WATCH_REFRESH):
+        self.refresh = refresh
+        self.watcher = ProcessWatcher()
+        self.projects = {}
+        self._reported = {}
+        self._pending = []
+
+    def _replicas(self, username, safe_name):
+        project_folder = os.path.join(MEDIA_ROOT, f"{username}_{safe_name}")
+        replicas = {}
+        for replica, pid in read_replica_files(username, safe_name, 'pid').items():
+            try:
+                written_at = os.path.getmtime(runtime_file(project_folder, username, safe_name, 'pid', replica))
+            except OSError:
+                continue
+            replicas[replica] = (pid, written_at)
+        return replicas
+
+    def sync(self):
+        """Watch every replica named by a pid file; returns the number watched"""
+        projects = (
+            DjangoProject.objects
+            .filter(node__isnull=True)
+            .exclude(domain_name__isnull=True).exclude(domain_name='')
+            .exclude(deployment_status='failed')
+            .select_related('user')
+        )
+        watched = self.watcher.watched()
+        wanted = set()
+        self.projects = {}
+        for project in projects:
+            safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
+            self.projects[project.id] = (project.user.username, safe_name)
+            for replica, (pid, written_at) in self._replicas(project.user.username, safe_name).items():
+                key = (project.id, replica)
+                wanted.add(key)
+                if watched.get(key) == pid or self._reported.get(key) == pid:
+                    continue
+                if not self.watcher.watch(key, pid, started_by=written_at):
+                    # Died (or its PID was reused) while nobody was watching
+                    self._pending.append((0.0, key, pid, None, time.time()))
+
+        for key in set(watched) - wanted:
+            self.watcher.forget(key)
+        for key in set(self._reported) - wanted:
+            del self._reported[key]
+        return len(self.watcher.watched())
+
+    def poll(self, timeout):
+        """Wait up to timeout for exits; returns the ProjectStatus rows updated"""
+        for exit in self.watcher.wait(timeout if not self._pending else min(timeout, EXIT_CODE_GRACE)):
+            self._pending.append((time.monotonic() + EXIT_CODE_GRACE, exit.key, exit.pid, exit.exit_code, exit.exited_at))
+
+        ready, waiting = [], []
+        for deadline, key, pid, exit_code, exited_at in self._pending:
+            username, safe_name = self.projects.get(key[0], (None, None))
+            recorded = read_exit_file(username, safe_name, key[1], pid) if username and exit_code is None else None
+            if recorded:
+                exit_code, exited_at = recorded
+            if exit_code is not None or time.monotonic() >= deadline:
+                ready.append((key, pid, exit_code, exited_at))
+            else:
+                waiting.append((deadline, key, pid, exit_code, exited_at))
+        self._pending = waiting
+        return self.record(ready) if ready else []
+
+    def record(self, exits):
+        watched = self.watcher.watched()
+        updated = []
+        for (project_id, replica), pid, exit_code, exited_at in exits:
+            if project_id not in self.projects:
+                continue
+            username, safe_name = self.projects[project_id]
+            if self._replicas(username, safe_name).get(replica, (None,))[0] != pid:
+                logger.info(f"Project {project_id} replica {replica} (PID {pid}) was stopped")
+                continue
+            self._reported[(project_id, replica)] = pid
+
+            running = sum(1 for key in watched if key[0] == project_id)
+            exited_at = datetime.fromtimestamp(exited_at, tz=dt_timezone.utc)
+            how = f"exited with code {exit_code}" if exit_code is not None else "exited"
+            logger.warning(f"Project {project_id} replica {replica} (PID {pid}) {how}")
+
+            status, _ = ProjectStatus.objects.get_or_create(django_project_id=project_id)
+            status.exit_code = exit_code
+            status.exited_at = exited_at
+            status.replicas_running = running
+            status.error = f"Replica {replica} {how}"
+            if status.is_running != bool(running):
+                status.is_running = bool(running)
+                status.changed_at = exited_at
+            status.save(update_fields=['exit_code', 'exited_at', 'replicas_running', 'error', 'is_running', 'changed_at'])
+            updated.append(status)
+
+            if not running:
+                stopped = DjangoProject.objects.filter(id=project_id, is_active=True)
+                owners = list(stopped.values_list('user_id', flat=True))
+                if stopped.update(is_active=False, deployment_status='error'):
+                    invalidate_user_summary(*owners)
+        return updated
+
+    def run(self):
+        synced_at = float('-inf')
+        while True:
+            if time.monotonic() - synced_at >= self.refresh:
+                close_old_connections()
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.error(f"Could not read project replicas: {str(e)}")
+                synced_at = time.monotonic()
+            try:
+                self.poll(max(0.0, self.refresh - (time.monotonic() - synced_at)))
+            except Exception as e:
+                logger.error(f"Could not record replica exits: {str(e)}")
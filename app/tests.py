@@ -1,3 +1,776 @@
-from django.test import TestCase
+import io
+import sys
+import asyncio
+import subprocess
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+import logging
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Website, DjangoProject, PaymentRequest, UserFile
+from .summary import get_user_summary, storage_usage, _summary_timeout
+from .page_cache import page_key
+from .access_logs import AccessLogFollower, all_tenant_cache_stats, recent_cache_stats
+from .resource_sampler import TenantSampler
+from .downloads import can_access_media
+from .routing import RouteTable, TENANT_ACCESS_LOG, render_tenant_server
+from .models import WorkerNode, PortLease
+from .nodes import NodeAgentClient, NodeAgentError, choose_node
+from .management.commands.run_node_agent import make_server
+from .log_handlers import JSONFormatter, QueuedFileHandler, log_context
+from .utils import after_drain
+from .metrics import Registry
+from .edge_proxy import EdgeProxy, EdgeRoutes, read_head, get_header
+from .access_logs import TrafficAggregator, parse_line
+from .rollups import histogram_percentile, record_rollups
+from .models import ServerResource, ResourceRollup, TenantTrafficMinute
+from .process_watch import ProcessWatcher, started_before
+
+
+class ReportsQueryCountTests(TestCase):
+    """The reports page is built from a fixed number of queries"""
+
+    # session, user, account summary, 2 timeline groupings, 2 project lists, resource rollups
+    REPORT_QUERIES = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reporter', password='secret')
+        self.client.force_login(self.user)
+        self.created = 0
+
+    def add_projects(self, days):
+        """One static site and one Django project on each of the last `days` days"""
+        now = timezone.now()
+        for day in range(days):
+            n = self.created = self.created + 1
+            website = Website.objects.create(
+                user=self.user, title=f'Site {n}', subdomain=f'site-{n}', is_active=n % 2 == 0
+            )
+            project = DjangoProject.objects.create(
+                user=self.user, project_name=f'project{n}', subdomain=f'project-{n}'
+            )
+            # auto_now_add ignores values passed to create()
+            Website.objects.filter(pk=website.pk).update(created_at=now - timedelta(days=day))
+            DjangoProject.objects.filter(pk=project.pk).update(created_at=now - timedelta(days=day))
+
+    def get_reports(self):
+        with self.assertNumQueries(self.REPORT_QUERIES):
+            response = self.client.get(reverse('reports'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_projects(self):
+        self.add_projects(2)
+        self.get_reports()
+
+        self.add_projects(31)
+        response = self.get_reports()
+        self.assertEqual(response.context['total_deployments'], 66)
+        self.assertEqual(response.context['active_static_sites'], 16)
+        self.assertEqual(sum(json.loads(response.context['deployment_counts'])), 66)
+
+
+class StoredFileStatsTests(TestCase):
+    """Upload size and hash are recorded on the row instead of read from disk later"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username='uploader', password='secret')
+        self.content = b'PK' + b'x' * 5000
+
+    def test_size_and_hash_recorded_on_upload(self):
+        website = Website.objects.create(
+            user=self.user, title='Site', subdomain='site',
+            uploaded_file=SimpleUploadedFile('site.zip', self.content),
+        )
+        website.refresh_from_db()
+        self.assertEqual(website.file_size, len(self.content))
+        self.assertEqual(website.content_hash, hashlib.sha256(self.content).hexdigest())
+
+        # Saving again without a new upload leaves the values alone
+        website.title = 'Renamed'
+        website.save()
+        self.assertEqual(website.file_size, len(self.content))
+
+    def test_backfill_fills_missing_rows(self):
+        project = DjangoProject.objects.create(
+            user=self.user, project_name='app', subdomain='app',
+            project_file=SimpleUploadedFile('app.zip', self.content),
+        )
+        DjangoProject.objects.filter(pk=project.pk).update(file_size=None, content_hash='')
+
+        call_command('backfill_file_stats', stdout=io.StringIO())
+        project.refresh_from_db()
+        self.assertEqual(project.file_size, len(self.content))
+        self.assertEqual(project.content_hash, hashlib.sha256(self.content).hexdigest())
+
+
+class UserSummaryCacheTests(TestCase):
+    """Dashboard counts come from one cached query, dropped when a row changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='summary', password='secret')
+        self.client.force_login(self.user)
+        Website.objects.create(user=self.user, title='Site', subdomain='summary-site', is_active=True)
+        DjangoProject.objects.create(user=self.user, project_name='proj', subdomain='summary-proj')
+
+    def test_summary_cached_until_rows_change(self):
+        with self.assertNumQueries(1):
+            summary = get_user_summary(self.user)
+        self.assertEqual((summary['total_deployments'], summary['active_sites']), (2, 1))
+        with self.assertNumQueries(0):
+            get_user_summary(self.user)
+
+        DjangoProject.objects.filter(user=self.user).get().save()
+        with self.assertNumQueries(1):
+            get_user_summary(self.user)
+
+        PaymentRequest.objects.create(user=self.user, amount=10, gb_requested=2, status='approved')
+        self.assertEqual(get_user_summary(self.user)['purchased_gb'], 2.0)
+
+    def test_per_process_cache_keeps_summary_briefly(self):
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            get_user_summary(self.user)
+        self.assertEqual(cache_set.call_args.args[2], 5)
+
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.mkdtemp(),
+        }}):
+            self.addCleanup(shutil.rmtree, settings.CACHES['default']['LOCATION'], ignore_errors=True)
+            self.assertEqual(_summary_timeout(), 3600)
+
+    def test_quota_usage_is_fresh_and_measures_old_rows(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            get_user_summary(self.user)
+            user_file = UserFile.objects.create(
+                user=self.user, title='old', file=SimpleUploadedFile('old.bin', b'x' * 1000)
+            )
+            # A row from before sizes were recorded, written where no signal reaches this cache
+            UserFile.objects.filter(pk=user_file.pk).update(file_size=None)
+            PaymentRequest.objects.bulk_create([
+                PaymentRequest(user=self.user, amount=5, gb_requested=1, status='approved')
+            ])
+
+            self.assertEqual(storage_usage(self.user.id), (1000, 1.0))
+            user_file.refresh_from_db()
+            self.assertEqual(user_file.file_size, 1000)
+
+    def test_dashboard_reads_summary(self):
+        get_user_summary(self.user)
+        # session and user only
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['total_sites'], 2)
+        self.assertEqual(response.context['active_sites'], 1)
+
+
+class PublicPageCacheTests(TestCase):
+    """Marketing pages are rendered once per release for anonymous visitors"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_cached_with_validators(self):
+        url = reverse('home')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(cache.get(page_key(url)))
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        compressed = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(compressed['ETag'], first['ETag'])
+        self.assertLess(len(compressed.content), len(first.content))
+
+    def test_signed_in_users_bypass_cache(self):
+        user = User.objects.create_user(username='visitor', password='secret')
+        self.client.force_login(user)
+        response = self.client.get(reverse('about'))
+        self.assertContains(response, 'visitor')
+        self.assertIsNone(cache.get(page_key(reverse('about'))))
+
+
+class DashboardEventsTests(TestCase):
+    """The SSE endpoint answers with what changed since the client's cursor and ends"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamer', password='secret')
+        self.client.force_login(self.user)
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        self.project = DjangoProject.objects.create(
+            user=self.user, project_name='live', subdomain='live',
+            deployment_status='deployed', project_folder=self.folder,
+        )
+        self.log_path = os.path.join(self.folder, 'streamer_live.log')
+        self.write_log('booting\n')
+
+    def write_log(self, text):
+        with open(self.log_path, 'a') as f:
+            f.write(text)
+
+    def read(self, **headers):
+        response = self.client.get(reverse('dashboard_events'), **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        cursor = [line for line in body.splitlines() if line.startswith('id: ')][-1][4:]
+        return body, cursor
+
+    def test_first_response_carries_current_state(self):
+        body, cursor = self.read()
+        self.assertIn('event: deploy', body)
+        self.assertIn(f'"project_id": {self.project.id}', body)
+        self.assertIn('"lines": ["booting"]', body)
+
+        body, cursor = self.read(HTTP_LAST_EVENT_ID=cursor)
+        self.assertNotIn('event:', body)
+
+        DjangoProject.objects.filter(pk=self.project.pk).update(deployment_status='error')
+        self.write_log('ready\npartial')
+        body, cursor = self.read(HTTP_LAST_EVENT_ID=cursor)
+        self.assertIn('"deployment_status": "error"', body)
+        self.assertIn('"lines": ["ready"]', body)
+
+        self.write_log(' line\n')
+        body, _ = self.read(HTTP_LAST_EVENT_ID=cursor)
+        self.assertIn('"lines": ["partial line"]', body)
+        self.assertNotIn('event: deploy', body)
+
+    def test_cursor_is_not_tied_to_a_process(self):
+        _, cursor = self.read()
+        self.write_log('next\n')
+        # Resuming from the same cursor twice, as two workers would, gives the same events
+        first, _ = self.read(HTTP_LAST_EVENT_ID=cursor)
+        second, _ = self.read(HTTP_LAST_EVENT_ID=cursor)
+        self.assertEqual(first.split('id: ')[0], second.split('id: ')[0])
+        self.assertIn('"lines": ["next"]', first)
+
+        body, _ = self.read(HTTP_LAST_EVENT_ID='garbage')
+        self.assertIn('event: deploy', body)
+
+
+class TenantBandwidthTests(TestCase):
+    """Traffic read from a tenant's access log shows up in its resource samples"""
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir, ignore_errors=True)
+        self.user = User.objects.create_user(username='tenant', password='secret')
+        self.project = DjangoProject.objects.create(
+            user=self.user, project_name='shop', subdomain='shop.samitchaudhary.com.np',
+            domain_name='shop.samitchaudhary.com.np', is_active=True,
+        )
+
+    def test_logged_bytes_counted_in_sample(self):
+        line = json.dumps({
+            'time': timezone.now().isoformat(), 'status': 200,
+            'bytes_sent': 3 * 1024 * 1024, 'request_length': 300, 'request_time': 0.01, 'cache': 'HIT',
+        })
+        with open(f'{self.log_dir}/shop_access.log', 'w') as f:
+            f.write(line + '\n')
+
+        follower = AccessLogFollower(self.log_dir)
+        follower.poll()
+        follower.flush()
+        follower.close()
+
+        sample, = TenantSampler().sample()
+        self.assertEqual(sample.django_project, self.project)
+        self.assertEqual(sample.bandwidth_usage, 3.0)
+        self.assertEqual(recent_cache_stats('shop'), {'hits': 1, 'misses': 0, 'hit_ratio': 1.0})
+
+    def test_shared_log_lines_counted_per_tenant(self):
+        now = timezone.now().isoformat()
+        with open(f'{self.log_dir}/{TENANT_ACCESS_LOG}', 'w') as f:
+            for tenant, cache_status in (('shop', 'MISS'), ('blog', 'HIT'), ('', 'HIT')):
+                f.write(json.dumps({
+                    'time': now, 'tenant': tenant, 'status': 200, 'bytes_sent': 1024, 'cache': cache_status,
+                }) + '\n')
+
+        follower = AccessLogFollower(self.log_dir)
+        follower.poll()
+        follower.flush()
+        follower.close()
+
+        self.assertEqual(recent_cache_stats('shop'), {'hits': 0, 'misses': 1, 'hit_ratio': 0.0})
+        self.assertEqual(recent_cache_stats('blog'), {'hits': 1, 'misses': 0, 'hit_ratio': 1.0})
+        self.assertEqual(set(TenantTrafficMinute.objects.values_list('tenant', flat=True)), {'shop', 'blog'})
+        self.assertEqual(all_tenant_cache_stats(self.log_dir)['blog']['hits'], 1)
+
+
+class MediaAccessTests(TestCase):
+    """Owner checks on media downloads, and the URLs that stay public"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.owner = User.objects.create_user(username='owner', password='secret')
+        self.other = User.objects.create_user(username='other', password='secret')
+
+    def test_deployment_folder_uses_safe_name(self):
+        DjangoProject.objects.create(user=self.owner, project_name='my-app', subdomain='my-app')
+        self.assertTrue(can_access_media(self.owner, 'websites/owner_my_app/db.sqlite3'))
+        self.assertFalse(can_access_media(self.other, 'websites/owner_my_app/db.sqlite3'))
+
+    def test_shared_urls_stay_public(self):
+        self.assertTrue(can_access_media(self.other, 'user_uploads/owner/photo.png'))
+
+        site_dir = f'{self.media_root}/websites/owner_site'
+        os.makedirs(site_dir)
+        with open(f'{site_dir}/index.html', 'w') as f:
+            f.write('<h1>hi</h1>')
+        response = self.client.get('/sites/owner_site/index.html')
+        self.assertEqual(b''.join(response.streaming_content), b'<h1>hi</h1>')
+        self.assertEqual(self.client.get('/sites/../../etc/passwd').status_code, 404)
+
+
+class RouteTableRollbackTests(TestCase):
+    """Rolling back one change leaves later changes in place"""
+
+    def setUp(self):
+        routes_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, routes_dir, ignore_errors=True)
+        self.table = RouteTable(routes_dir)
+
+    def route(self, hostname, tenant, port):
+        def mutate(routes):
+            routes[hostname] = {'tenant': tenant, 'servers': [f'127.0.0.1:{port}']}
+        return self.table.update(mutate)
+
+    def test_rollback_keeps_later_changes(self):
+        self.route('a.example.com', 'a', 8001)
+        rollback_b = self.route('b.example.com', 'b', 8002)
+        rollback_a = self.route('a.example.com', 'a', 8003)
+        self.route('c.example.com', 'c', 8004)
+
+        rollback_b()
+        rollback_a()
+        routes = self.table.load()
+        self.assertNotIn('b.example.com', routes)
+        self.assertEqual(routes['a.example.com']['servers'], ['127.0.0.1:8001'])
+        self.assertIn('c.example.com', routes)
+        with open(self.table.map_path) as f:
+            self.assertIn('c.example.com', f.read())
+
+    def test_rollback_skips_hostname_rewritten_since(self):
+        rollback = self.route('a.example.com', 'a', 8001)
+        self.route('a.example.com', 'a', 8002)
+        rollback()
+        self.assertEqual(self.table.load()['a.example.com']['servers'], ['127.0.0.1:8002'])
+
+
+class NodeAgentProtocolTests(TestCase):
+    """The control plane talks to several local agent processes over HTTP"""
+
+    def start_agent(self, name, token=''):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        server = make_server('127.0.0.1', 0, token, upload_dir)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return WorkerNode.objects.create(name=name, host='127.0.0.1', agent_port=server.server_address[1])
+
+    def test_placement_polls_every_agent(self):
+        nodes = [self.start_agent('node-a'), self.start_agent('node-b')]
+        chosen = choose_node()
+        self.assertIn(chosen, nodes)
+        for node in nodes:
+            node.refresh_from_db()
+            self.assertIsNotNone(node.last_heartbeat)
+            self.assertGreater(node.total_memory_mb, 0)
+
+    def test_rejects_bad_token_and_unsafe_names(self):
+        with self.assertRaises(NodeAgentError):
+            NodeAgentClient(self.start_agent('locked', token='s3cret')).health()
+
+        client = NodeAgentClient(self.start_agent('open'))
+        with self.assertRaisesRegex(NodeAgentError, 'HTTP 400'):
+            client.stop('..', 'app')
+        with self.assertRaisesRegex(NodeAgentError, 'HTTP 400'):
+            client.status('../../etc', 'app', '')
+        for project_name in ('x/../../..', '..', ''):
+            with self.assertRaisesRegex(NodeAgentError, 'HTTP 400'):
+                client.stop('owner', project_name, cleanup=True)
+            with self.assertRaisesRegex(NodeAgentError, 'HTTP 400'):
+                client.status('owner', project_name, '')
+        with self.assertRaisesRegex(NodeAgentError, 'HTTP 400'):
+            client.scale('owner', 'app', 'many')
+
+    def test_refuses_public_bind_without_token(self):
+        with override_settings(NODE_AGENT_TOKEN=''):
+            with self.assertRaises(CommandError):
+                call_command('run_node_agent', host='0.0.0.0', port=0)
+
+
+class QueuedFileHandlerTests(TestCase):
+    """JSON records reach the file, which is reopened after external rotation"""
+
+    def setUp(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir, ignore_errors=True)
+        self.path = os.path.join(log_dir, 'platform.log')
+        self.handler = QueuedFileHandler(self.path)
+        self.handler.setFormatter(JSONFormatter())
+        self.logger = logging.getLogger('app.tests.queued')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def wait_for(self, path):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if os.path.exists(path) and os.path.getsize(path):
+                return
+            time.sleep(0.01)
+        self.fail(f'{path} was never written')
+
+    def test_records_written_and_file_reopened_after_rotation(self):
+        with log_context(project='shop', stage='migrate'):
+            self.logger.warning('before %s', 'rotation')
+        self.wait_for(self.path)
+        os.rename(self.path, self.path + '.1')
+
+        self.logger.warning('after rotation')
+        self.wait_for(self.path)
+        self.handler.close()
+
+        with open(self.path + '.1') as f:
+            entry = json.loads(f.readline())
+        self.assertEqual((entry['message'], entry['project'], entry['stage']), ('before rotation', 'shop', 'migrate'))
+        with open(self.path) as f:
+            self.assertEqual(json.loads(f.readline())['message'], 'after rotation')
+
+
+class AfterDrainTests(TestCase):
+    """Stopping drained replicas happens off the request thread"""
+
+    def test_action_runs_later_on_another_thread(self):
+        ran = threading.Event()
+        threads = []
+
+        def stop(replicas):
+            threads.append((threading.current_thread(), replicas))
+            ran.set()
+
+        with mock.patch('app.utils.REPLICA_DRAIN_SECONDS', 0.05):
+            after_drain(stop, replicas=[2])
+        self.assertFalse(ran.is_set())
+        self.assertTrue(ran.wait(5))
+        self.assertIsNot(threads[0][0], threading.current_thread())
+        self.assertEqual(threads[0][1], [2])
+
+
+class MetricsRegistryTests(TestCase):
+    """Per-process metric files are merged on scrape, which needs the token"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.registry = Registry(directory)
+        self.up = self.registry.gauge('test_tenant_up', "Tenant is running", ['tenant'])
+
+    def test_clearing_every_series_is_written(self):
+        self.up.set_all({('shop',): 1})
+        self.assertEqual(self.registry.collect()['test_tenant_up'], {('shop',): 1})
+
+        self.up.set_all({})
+        self.assertNotIn('test_tenant_up', self.registry.collect())
+        self.assertNotIn('shop', self.registry.render())
+
+    def test_scrape_requires_token_even_from_loopback(self):
+        # The test client, like a request proxied by the local Nginx, comes from 127.0.0.1
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with mock.patch('app.metrics.METRICS_TOKEN', 's3cret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE platform_deploys_total counter', response.content)
+
+
+class EdgeProxyTests(TestCase):
+    """The edge proxy routes by Host and keeps both sides' connections open"""
+
+    def setUp(self):
+        self.handlers = []
+
+    def tracked(self, handler):
+        """Connection handler whose task is awaited before the loop shuts down"""
+        async def run(reader, writer):
+            self.handlers.append(asyncio.current_task())
+            await handler(reader, writer)
+        return run
+
+    async def start_upstream(self, name):
+        """Stub tenant answering '<name> <path>' and counting its connections"""
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            while True:
+                head = await read_head(reader, 5)
+                if head is None:
+                    break
+                body = f"{name} {head[0].split(' ')[1]}".encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+                )
+                await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(self.tracked(handle), '127.0.0.1', 0)
+        return server, server.sockets[0].getsockname()[:2], connections
+
+    async def fetch(self, reader, writer, host, path='/'):
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        status_line, headers = await read_head(reader, 5)
+        body = await reader.readexactly(int(get_header(headers, 'Content-Length')))
+        return status_line, headers, body
+
+    def test_routes_by_host_over_kept_alive_connections(self):
+        async def scenario():
+            shop, shop_address, shop_connections = await self.start_upstream('shop')
+            blog, blog_address, _ = await self.start_upstream('blog')
+            proxy = EdgeProxy(EdgeRoutes({'shop.example.com': [shop_address], 'blog.example.com': [blog_address]}))
+            edge = await asyncio.start_server(self.tracked(proxy.handle_client), '127.0.0.1', 0)
+            reader, writer = await asyncio.open_connection(*edge.sockets[0].getsockname()[:2])
+            try:
+                results = [
+                    await self.fetch(reader, writer, 'shop.example.com', '/a'),
+                    await self.fetch(reader, writer, 'SHOP.example.com:80', '/b'),
+                    await self.fetch(reader, writer, 'blog.example.com', '/c'),
+                    await self.fetch(reader, writer, 'unknown.example.com'),
+                ]
+                return results, len(shop_connections)
+            finally:
+                writer.close()
+                proxy.pool.close()
+                await asyncio.wait(self.handlers, timeout=5)
+                for server in (edge, shop, blog):
+                    server.close()
+
+        results, shop_connections = asyncio.run(scenario())
+        self.assertEqual([body for _, _, body in results[:3]], [b'shop /a', b'shop /b', b'blog /c'])
+        self.assertEqual(get_header(results[1][1], 'Connection'), 'keep-alive')
+        # Both shop requests went over one pooled upstream connection
+        self.assertEqual(shop_connections, 1)
+        self.assertTrue(results[3][0].startswith('HTTP/1.1 404'))
+
+
+class RouteRenderingTests(TestCase):
+    """Route table state is rendered into the Nginx map and upstream includes"""
+
+    def test_tenant_hostnames_share_one_upstream(self):
+        routes_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, routes_dir, ignore_errors=True)
+        table = RouteTable(routes_dir)
+
+        def mutate(routes):
+            routes['shop.example.com'] = {'tenant': 'shop', 'servers': ['127.0.0.1:8001'], 'cache_ttl': 60}
+            routes['www.shop.com'] = {'tenant': 'shop', 'servers': ['127.0.0.1:8001']}
+            routes['docs.example.com'] = {'tenant': 'docs', 'kind': 'site', 'servers': []}
+        table.update(mutate)
+
+        with open(table.map_path) as f:
+            self.assertEqual(f.read(), (
+                "docs.example.com site_docs;\n"
+                "shop.example.com tenant_shop;\n"
+                "www.shop.com tenant_shop;\n"
+            ))
+        with open(table.upstreams_path) as f:
+            upstreams = f.read()
+        self.assertEqual(upstreams.count('upstream tenant_shop {'), 1)
+        self.assertNotIn('docs', upstreams)
+        with open(table.cache_map_path) as f:
+            self.assertEqual(f.read(), "shop.example.com 60;\n")
+
+    def test_one_access_log_for_every_tenant(self):
+        server = render_tenant_server('/etc/nginx/tenants')
+        self.assertIn(f'access_log /var/log/nginx/{TENANT_ACCESS_LOG} tenant_json;', server)
+        self.assertNotIn('${tenant_name}_access.log', server)
+        self.assertIn('"tenant":"$tenant_name"', server)
+
+
+class AccessLogParsingTests(TestCase):
+    """Both Nginx log formats are parsed and folded into per-minute totals"""
+
+    def test_text_and_json_lines(self):
+        entry = parse_line(
+            '10.0.0.1 - - [05/Mar/2025:10:15:42 +0000] "GET / HTTP/1.1" 200 512 "-" "curl/8" cache=HIT rt=0.004'
+        )
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(entry['bytes_sent'], 512)
+        self.assertEqual(entry['request_time'], 0.004)
+        self.assertEqual(entry['time'], '2025-03-05T10:15:42+00:00')
+        self.assertEqual(parse_line('{"status": 404, "cache": "MISS"}'), {'status': 404, 'cache': 'MISS'})
+        self.assertIsNone(parse_line('{"truncated'))
+        self.assertIsNone(parse_line('not an access log line'))
+
+    def test_aggregated_per_tenant_minute(self):
+        aggregator = TrafficAggregator()
+        for seconds, status, cache_status in ((1, 200, 'HIT'), (30, 502, 'MISS'), (61, 200, '-')):
+            aggregator.add('shop', {
+                'time': f'2025-03-05T10:{15 + seconds // 60:02d}:{seconds % 60:02d}+00:00',
+                'status': status, 'bytes_sent': 100, 'request_time': 0.01,
+                'upstream_response_time': '0.002, 0.003', 'cache': cache_status,
+            })
+
+        minutes = aggregator.drain()
+        self.assertEqual(aggregator.minutes, {})
+        first = minutes[('shop', datetime(2025, 3, 5, 10, 15, tzinfo=dt_timezone.utc))]
+        self.assertEqual(first['requests'], 2)
+        self.assertEqual((first['status_2xx'], first['status_5xx']), (1, 1))
+        self.assertEqual(first['bytes_sent'], 200)
+        self.assertAlmostEqual(first['upstream_time_total'], 0.01)
+        self.assertEqual((first['cache_hits'], first['cache_misses']), (1, 1))
+        self.assertEqual(len(minutes), 2)
+
+
+class ResourceRollupTests(TestCase):
+    """Samples are folded into every resolution as they are recorded"""
+
+    def test_samples_folded_into_buckets(self):
+        user = User.objects.create_user(username='tenant', password='secret')
+        project = DjangoProject.objects.create(user=user, project_name='shop', subdomain='shop')
+        start = datetime(2025, 3, 5, 10, 15, tzinfo=dt_timezone.utc)
+        for batch in ((10.0, 30.0), (50.0,)):
+            samples = [ServerResource.objects.create(user=user, django_project=project, cpu_usage=cpu) for cpu in batch]
+            for sample in samples:
+                sample.recorded_at = start
+            record_rollups(samples)
+
+        rollups = ResourceRollup.objects.filter(django_project=project, metric='cpu')
+        self.assertEqual(rollups.count(), 3)
+        for rollup in rollups:
+            self.assertEqual((rollup.count, rollup.total, rollup.min, rollup.max), (3, 90.0, 10.0, 50.0))
+            self.assertTrue(45.0 <= rollup.p95 <= 50.0)
+
+    def test_percentile_clamped_to_observed_range(self):
+        self.assertEqual(histogram_percentile({}, 0, 0.95, 0, 0), 0.0)
+        self.assertEqual(histogram_percentile({'0': 4}, 4, 0.95, 0.01, 0.05), 0.05)
+
+
+class ProcessWatcherTests(TestCase):
+    """Exits of watched processes are reported once, with their exit code"""
+
+    def setUp(self):
+        self.watcher = ProcessWatcher()
+        self.addCleanup(self.watcher.close)
+
+    def spawn(self, code):
+        process = subprocess.Popen([sys.executable, '-c', code])
+        self.addCleanup(process.kill)
+        return process
+
+    def test_exit_reported_with_code(self):
+        process = self.spawn('import sys, time; time.sleep(0.2); sys.exit(3)')
+        self.assertTrue(self.watcher.watch('shop', process.pid, process=process))
+        self.assertEqual(self.watcher.watched(), {'shop': process.pid})
+
+        exits = []
+        deadline = time.monotonic() + 10
+        while not exits and time.monotonic() < deadline:
+            exits = self.watcher.wait(timeout=1)
+        exit_record, = exits
+        self.assertEqual((exit_record.key, exit_record.pid, exit_record.exit_code), ('shop', process.pid, 3))
+        self.assertEqual(self.watcher.watched(), {})
+        self.assertEqual(self.watcher.wait(timeout=0), [])
+
+    def test_reused_pid_not_watched(self):
+        process = self.spawn('import time; time.sleep(30)')
+        # A pid file written before the process started belongs to an older process
+        self.assertFalse(started_before(process.pid, time.time() - 60))
+        self.assertFalse(self.watcher.watch('shop', process.pid, started_by=time.time() - 60))
+        self.assertTrue(self.watcher.watch('shop', process.pid, started_by=time.time()))
+
+
+class ProjectRestartTests(TestCase):
+    """Restart stops the project through the node layer and redeploys it"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='secret')
+        self.client.force_login(self.user)
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, ignore_errors=True)
+        self.project = DjangoProject.objects.create(
+            user=self.user, project_name='my-app', subdomain='my-app',
+            project_folder=folder, deployment_status='deployed',
+        )
+
+    def test_restart_stops_and_redeploys(self):
+        with mock.patch('app.nodes.stop_django_project') as stop, \
+                mock.patch('app.views.deploy_project', return_value={'success': True}) as deploy:
+            self.client.post(reverse('restart_django_project', args=[self.project.id]))
+
+        stop.assert_called_once_with('owner', 'my_app')
+        deploy.assert_called_once()
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.deployment_status, 'deployed')
+
+
+class RouteRebuildTests(TestCase):
+    """install_nginx_routing --rebuild keeps every hostname the deploy paths route"""
+
+    def setUp(self):
+        routes_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, routes_dir, ignore_errors=True)
+        self.table = RouteTable(routes_dir)
+        for patcher in (
+            mock.patch('app.management.commands.install_nginx_routing.route_table', self.table),
+            mock.patch('app.management.commands.install_nginx_routing.install_tenant_server',
+                       return_value=(True, "Tenant server installed")),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='owner', password='secret')
+
+    def test_rebuild_keeps_sites_and_custom_domains(self):
+        Website.objects.create(
+            user=self.user, title='Blog', subdomain='owner-blog-abc123', uploaded_file='website_uploads/blog.zip',
+            domain_name='owner-blog-abc123.samitchaudhary.com.np', custom_domain='blog.example.com', is_active=True,
+        )
+        project = DjangoProject.objects.create(
+            user=self.user, project_name='shop', subdomain='shop', domain_name='shop.samitchaudhary.com.np',
+            custom_domain='www.shop.com', deployment_status='deployed',
+        )
+        PortLease.objects.create(django_project=project, replica=0, port=8001)
+        self.table.update(lambda routes: routes.update({'stale.example.com': {'tenant': 'stale', 'servers': []}}))
+
+        call_command('install_nginx_routing', rebuild=True, stdout=io.StringIO())
+
+        routes = self.table.load()
+        site_route = {'tenant': 'owner-blog-abc123', 'kind': 'site', 'servers': []}
+        self.assertEqual(routes['owner-blog-abc123.samitchaudhary.com.np'], site_route)
+        self.assertEqual(routes['blog.example.com'], site_route)
+        for hostname in ('shop.samitchaudhary.com.np', 'www.shop.com'):
+            self.assertEqual(routes[hostname], {'tenant': 'shop', 'servers': ['127.0.0.1:8001']})
+        self.assertNotIn('stale.example.com', routes)
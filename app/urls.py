@@ -22,6 +22,7 @@ urlpatterns = [
 
     # Django Project Management
     path('dashboard/django/', views.django_projects_view, name='django_projects'),
+    path('dashboard/events/', views.dashboard_events, name='dashboard_events'),
     path('dashboard/django/deploy/', views.deploy_django_view, name='deploy_django'),
     path('dashboard/django/<int:project_id>/', views.django_project_detail, name='django_project_detail'),
     path('dashboard/django/<int:project_id>/delete/', views.delete_django_project, name='delete_django_project'),
@@ -43,6 +44,8 @@ urlpatterns = [
     path('dashboard/django/<int:project_id>/toggle-status/', views.toggle_django_project_status, name='toggle_django_project_status'),
     path('dashboard/django/<int:project_id>/update/', views.update_django_project, name='update_django_project'),
     path('dashboard/django/<int:project_id>/metrics/', views.django_project_metrics, name='django_project_metrics'),
+    path('dashboard/django/<int:project_id>/scale/', views.scale_django_project, name='scale_django_project'),
+    path('dashboard/django/<int:project_id>/cache/', views.update_cache_profile, name='update_cache_profile'),
 
 
     # Static Website Management
@@ -10,8 +10,17 @@ import signal
 import time
 import sys
 import re
+import threading
+from contextlib import contextmanager
 from django.conf import settings
 from pathlib import Path
+from .routing import set_route, remove_route
+from .nginx_reload import request_nginx_reload
+from .static_publish import publish_tenant_assets, remove_tenant_assets
+from .static_sites import site_label, site_root, deploy_static_site, site_is_live, remove_static_site
+from .metrics import deploy_stage_seconds
+from .log_handlers import log_context
+from .process_watch import child_reaper, started_before
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +28,15 @@ logger = logging.getLogger(__name__)
 IS_WINDOWS = platform.system() == 'Windows'
 MEDIA_ROOT = getattr(settings, 'WEBSITES_ROOT', os.path.join(settings.MEDIA_ROOT, "websites"))
 
+# Seconds a replica removed from the upstream keeps serving in-flight requests
+REPLICA_DRAIN_SECONDS = getattr(settings, 'REPLICA_DRAIN_SECONDS', 10)
+
+@contextmanager
+def deploy_stage(stage):
+    """Time a deployment stage and tag the log records written during it"""
+    with deploy_stage_seconds.time(stage=stage), log_context(stage=stage):
+        yield
+
 def get_local_ip():
     """
     Get the local IP address of the server
@@ -36,9 +54,13 @@ def get_local_ip():
         # Fallback to localhost
         return "127.0.0.1"
 
-def deploy_django_project(username, project_name, uploaded_file_path, custom_domain=None):
+def deploy_django_project(username, project_name, uploaded_file_path, custom_domain=None, configure_nginx=True, replicas=1):
     """
     Deploy Django project with subdomain support
+
+    Worker node agents pass configure_nginx=False; the control plane
+    writes the edge Nginx config pointing at the node instead.
+    replicas runserver instances are started behind one upstream.
     """
     try:
         python_cmd = sys.executable
@@ -58,7 +80,7 @@ def deploy_django_project(username, project_name, uploaded_file_path, custom_dom
 
         # Extract uploaded Django project
         logger.info(f"Extracting project from {uploaded_file_path}")
-        with zipfile.ZipFile(uploaded_file_path, 'r') as zip_ref:
+        with deploy_stage('extract'), zipfile.ZipFile(uploaded_file_path, 'r') as zip_ref:
             zip_ref.extractall(project_folder)
 
         # Detect Django project structure
@@ -83,9 +105,9 @@ def deploy_django_project(username, project_name, uploaded_file_path, custom_dom
         logger.info(f"Using domain: {domain_name}")
 
         # Deploy without virtual environment
-        success, port, error_msg = deploy_django_no_venv(
+        success, ports, error_msg = deploy_django_no_venv(
             username, safe_name, project_folder, django_info, 
-            domain_name, python_cmd, local_ip
+            domain_name, python_cmd, local_ip, configure_nginx, replicas
         )
         
         if success:
@@ -93,7 +115,8 @@ def deploy_django_project(username, project_name, uploaded_file_path, custom_dom
             return {
                 'success': True, 
                 'domain_name': domain_name, 
-                'port': port, 
+                'port': ports[0], 
+                'ports': ports,
                 'ip': local_ip,
                 'full_url': f"http://{domain_name}"
             }
@@ -105,18 +128,22 @@ def deploy_django_project(username, project_name, uploaded_file_path, custom_dom
         return {'success': False, 'error': str(e)}
 
 
-def deploy_django_no_venv(username, project_name, project_folder, django_info, domain_name, python_cmd, local_ip):
+def deploy_django_no_venv(username, project_name, project_folder, django_info, domain_name, python_cmd, local_ip, configure_nginx=True, replicas=1):
     """
     Deploy Django project without virtual environment (updated with Nginx)
+
+    Returns (success, ports, error) with one port per started replica.
     """
     try:
         logger.info(f"Starting deployment without virtual environment for {username}_{project_name}")
         
-        # Find available port
-        available_port = find_available_port(8000)
+        # Find available ports, one per replica
+        replica_ports = allocate_replica_ports(range(max(replicas, 1)))
+        available_port = replica_ports[0]
         
         # Install project dependencies first
-        install_success = install_project_requirements(project_folder, python_cmd)
+        with deploy_stage('install'):
+            install_success = install_project_requirements(project_folder, python_cmd)
         if not install_success:
             logger.warning("Some dependencies might not have been installed, but continuing...")
         
@@ -126,21 +153,34 @@ def deploy_django_no_venv(username, project_name, project_folder, django_info, d
             return False, None, "Failed to configure Django settings"
         
         # Run database migrations
-        run_django_migrations_direct(project_folder, django_info, python_cmd)
+        with deploy_stage('migrate'):
+            run_django_migrations_direct(project_folder, django_info, python_cmd)
+        
+        # Publish collected static files where Nginx serves them
+        subdomain = domain_name.replace(f".{BASE_DOMAIN}", "")
+        if not IS_WINDOWS:
+            with deploy_stage('publish_static'):
+                publish_tenant_assets(subdomain, django_info, python_cmd)
         
-        # Start Django development server on localhost (not 0.0.0.0)
+        # Start Django development servers on localhost (not 0.0.0.0)
         # Nginx will handle external requests
-        success = start_django_server_direct(username, project_name, project_folder, django_info, available_port, python_cmd, '127.0.0.1')
+        with deploy_stage('start'):
+            started = start_django_replicas(username, project_name, project_folder, django_info, python_cmd, '127.0.0.1', replica_ports)
         
-        if success:
-            # Generate Nginx configuration for subdomain
-            subdomain = domain_name.replace(f".{BASE_DOMAIN}", "")
-            nginx_success = generate_nginx_config(subdomain, available_port, username, project_name)
+        if started:
+            ports = list(started.values())
+            if len(started) < len(replica_ports):
+                logger.warning(f"Only {len(started)} of {len(replica_ports)} replicas started")
             
-            if not nginx_success:
-                logger.warning("Nginx configuration failed, but Django server is running")
+            # Generate Nginx configuration for subdomain
+            if configure_nginx:
+                with deploy_stage('nginx'):
+                    nginx_success = generate_nginx_config(subdomain, ports, username, project_name)
+                
+                if not nginx_success:
+                    logger.warning("Nginx configuration failed, but Django server is running")
             
-            return True, available_port, None
+            return True, ports, None
         else:
             return False, None, "Failed to start Django server"
 
@@ -790,56 +830,156 @@ def run_django_migrations_direct(project_folder, django_info, python_cmd):
         logger.warning(f"Migration error: {str(e)}")
         return False
 
-def start_django_server_direct(username, project_name, project_folder, django_info, port, python_cmd, local_ip):
+def runtime_file(project_folder, username, project_name, ext, replica=0):
     """
-    Start Django server on all interfaces (0.0.0.0) to be accessible via IP
+    Path of a per-replica runtime file (pid, port, log, ip).
+    Replica 0 keeps the original single-instance file names.
     """
+    suffix = f".{ext}" if replica == 0 else f".{replica}.{ext}"
+    return os.path.join(project_folder, f'{username}_{project_name}{suffix}')
+
+def read_replica_files(username, project_name, ext):
+    """Read integer runtime files for every replica, e.g. {0: 8001, 1: 8002}"""
+    project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
+    pattern = re.compile(rf'^{re.escape(f"{username}_{project_name}")}(?:\.(\d+))?\.{ext}$')
+    values = {}
+
+    if not os.path.isdir(project_folder):
+        return values
+
+    for filename in os.listdir(project_folder):
+        match = pattern.match(filename)
+        if not match:
+            continue
+        try:
+            with open(os.path.join(project_folder, filename), 'r') as f:
+                values[int(match.group(1) or 0)] = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+
+    return dict(sorted(values.items()))
+
+def write_exit_file(project_folder, username, project_name, replica, exit):
+    """Record how a replica exited as 'pid exit_code exited_at' for the process watcher"""
     try:
-        logger.info(f"Starting Django server on {local_ip}:{port}")
-        
-        manage_py_path = django_info.get('manage_py_path')
-        if not manage_py_path:
-            return False
-        
-        project_root = os.path.dirname(manage_py_path)
-        
-        # Create log files for debugging
-        log_file = os.path.join(project_folder, f'{username}_{project_name}.log')
-        
-        # Start server process on 0.0.0.0 to listen on all interfaces
-        if IS_WINDOWS:
-            process = subprocess.Popen([
-                python_cmd, 'manage.py', 'runserver', f'0.0.0.0:{port}', '--noreload'
-            ], cwd=project_root, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
-               stdout=open(log_file, 'w'), stderr=subprocess.STDOUT)
-        else:
-            process = subprocess.Popen([
-                python_cmd, 'manage.py', 'runserver', f'0.0.0.0:{port}', '--noreload'
-            ], cwd=project_root, 
-               stdout=open(log_file, 'w'), stderr=subprocess.STDOUT)
-        
-        # Save PID and port
-        pid_file = os.path.join(project_folder, f'{username}_{project_name}.pid')
-        with open(pid_file, 'w') as f:
-            f.write(str(process.pid))
-        
-        port_file = os.path.join(project_folder, f'{username}_{project_name}.port')
-        with open(port_file, 'w') as f:
-            f.write(str(port))
-        
-        # Save IP address
-        ip_file = os.path.join(project_folder, f'{username}_{project_name}.ip')
-        with open(ip_file, 'w') as f:
-            f.write(local_ip)
-        
-        # Wait and check
-        time.sleep(5)
-        
+        with open(runtime_file(project_folder, username, project_name, 'exit', replica), 'w') as f:
+            f.write(f"{exit.pid} {exit.exit_code} {exit.exited_at}")
+    except OSError as e:
+        logger.warning(f"Could not record exit of PID {exit.pid}: {str(e)}")
+
+def read_exit_file(username, project_name, replica, pid):
+    """(exit_code, exited_at) recorded for pid by the process that started it, or None"""
+    project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
+    try:
+        with open(runtime_file(project_folder, username, project_name, 'exit', replica), 'r') as f:
+            recorded_pid, exit_code, exited_at = f.read().split()
+    except (OSError, ValueError):
+        return None
+    if int(recorded_pid) != pid:
+        return None
+    return (None if exit_code == 'None' else int(exit_code)), float(exited_at)
+
+def replica_running(username, project_name, replica, pid):
+    """pid from a replica's pid file is alive and is the process that wrote it"""
+    project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
+    try:
+        written_at = os.path.getmtime(runtime_file(project_folder, username, project_name, 'pid', replica))
+    except OSError:
+        return False
+    return started_before(pid, written_at)
+
+def get_replica_ports(username, project_name):
+    """Ports of all started replicas keyed by replica index"""
+    return read_replica_files(username, project_name, 'port')
+
+def spawn_django_server(username, project_name, project_folder, django_info, port, python_cmd, local_ip, replica=0):
+    """
+    Launch one runserver replica and record its PID/port files.
+    Returns (process, log_file) or (None, None).
+    """
+    manage_py_path = django_info.get('manage_py_path')
+    if not manage_py_path:
+        return None, None
+    
+    project_root = os.path.dirname(manage_py_path)
+    
+    # Create log files for debugging
+    log_file = runtime_file(project_folder, username, project_name, 'log', replica)
+    
+    # Start server process on 0.0.0.0 to listen on all interfaces
+    if IS_WINDOWS:
+        process = subprocess.Popen([
+            python_cmd, 'manage.py', 'runserver', f'0.0.0.0:{port}', '--noreload'
+        ], cwd=project_root, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
+           stdout=open(log_file, 'w'), stderr=subprocess.STDOUT)
+    else:
+        process = subprocess.Popen([
+            python_cmd, 'manage.py', 'runserver', f'0.0.0.0:{port}', '--noreload'
+        ], cwd=project_root, 
+           stdout=open(log_file, 'w'), stderr=subprocess.STDOUT)
+    
+    # Save PID and port
+    with open(runtime_file(project_folder, username, project_name, 'pid', replica), 'w') as f:
+        f.write(str(process.pid))
+    
+    # Reap the replica as soon as it exits and leave its exit code for the process watcher
+    try:
+        os.remove(runtime_file(project_folder, username, project_name, 'exit', replica))
+    except OSError:
+        pass
+    child_reaper.reap(
+        process, lambda exit: write_exit_file(project_folder, username, project_name, replica, exit)
+    )
+    
+    with open(runtime_file(project_folder, username, project_name, 'port', replica), 'w') as f:
+        f.write(str(port))
+    
+    # Save IP address
+    with open(runtime_file(project_folder, username, project_name, 'ip', replica), 'w') as f:
+        f.write(local_ip)
+    
+    return process, log_file
+
+def start_django_server_direct(username, project_name, project_folder, django_info, port, python_cmd, local_ip, replica=0):
+    """
+    Start Django server on all interfaces (0.0.0.0) to be accessible via IP
+    """
+    started = start_django_replicas(
+        username, project_name, project_folder, django_info, python_cmd, local_ip,
+        {replica: port}
+    )
+    return replica in started
+
+def start_django_replicas(username, project_name, project_folder, django_info, python_cmd, local_ip, replica_ports):
+    """
+    Start several runserver replicas at once and wait for them together.
+    replica_ports maps replica index -> port; returns the subset that came up.
+    """
+    processes = {}
+    for replica, port in replica_ports.items():
+        try:
+            logger.info(f"Starting Django server replica {replica} on {local_ip}:{port}")
+            process, log_file = spawn_django_server(
+                username, project_name, project_folder, django_info, port, python_cmd, local_ip, replica
+            )
+            if process:
+                processes[replica] = (process, log_file, port)
+        except Exception as e:
+            logger.error(f"Server start error: {str(e)}")
+    
+    if not processes:
+        return {}
+    
+    # Wait and check
+    time.sleep(5)
+    
+    started = {}
+    for replica, (process, log_file, port) in processes.items():
         if process.poll() is None:
             logger.info(f"Django server started successfully on {local_ip}:{port}")
-            return True
+            started[replica] = port
         else:
-            logger.error("Django server failed to start")
+            logger.error(f"Django server replica {replica} failed to start")
             # Log the error for debugging
             try:
                 with open(log_file, 'r') as f:
@@ -847,15 +987,14 @@ def start_django_server_direct(username, project_name, project_folder, django_in
                     logger.error(f"Server logs: {log_content}")
             except:
                 pass
-            return False
-        
-    except Exception as e:
-        logger.error(f"Server start error: {str(e)}")
-        return False
+    
+    return started
 
-def find_available_port(start_port=8000):
+def find_available_port(start_port=8000, exclude=()):
     """Find an available port"""
     for port in range(start_port, start_port + 100):
+        if port in exclude:
+            continue
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
                 s.bind(('0.0.0.0', port))
@@ -864,26 +1003,104 @@ def find_available_port(start_port=8000):
             continue
     return start_port
 
-def stop_django_project(username, project_name):
-    """Stop Django project"""
-    try:
-        project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
-        pid_file = os.path.join(project_folder, f'{username}_{project_name}.pid')
-        
-        if os.path.exists(pid_file):
-            with open(pid_file, 'r') as f:
-                pid = int(f.read().strip())
-            
+def allocate_replica_ports(replicas, start_port=8000):
+    """Pick a distinct free port for each replica index"""
+    ports = {}
+    for replica in replicas:
+        ports[replica] = find_available_port(start_port, exclude=set(ports.values()))
+    return ports
+
+def stop_django_project(username, project_name, replicas=None):
+    """Stop Django project (all replicas, or only the given replica indexes)"""
+    project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
+    
+    for replica, pid in read_replica_files(username, project_name, 'pid').items():
+        if replicas is not None and replica not in replicas:
+            continue
+        try:
             if IS_WINDOWS:
                 subprocess.run(['taskkill', '/PID', str(pid), '/F'], capture_output=True)
             else:
                 os.kill(pid, signal.SIGTERM)
-            
-            os.remove(pid_file)
             logger.info(f"Stopped Django server with PID {pid}")
-            
+        except Exception as e:
+            logger.warning(f"Error stopping Django project: {str(e)}")
+        
+        try:
+            os.remove(runtime_file(project_folder, username, project_name, 'pid', replica))
+            # Replica 0's port file is kept so the last known address stays readable
+            if replica:
+                os.remove(runtime_file(project_folder, username, project_name, 'port', replica))
+        except OSError:
+            pass
+
+def after_drain(action, *args, **kwargs):
+    """
+    Run action(*args, **kwargs) on a background thread once replicas taken
+    out of the upstream have had REPLICA_DRAIN_SECONDS to finish in-flight
+    requests, so the caller can return straight away
+    """
+    def run():
+        from django.db import close_old_connections
+        try:
+            action(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Post-drain {getattr(action, '__name__', 'action')} failed: {str(e)}")
+        finally:
+            close_old_connections()
+
+    timer = threading.Timer(REPLICA_DRAIN_SECONDS, run)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
+def scale_django_project(username, project_name, replicas, subdomain=None, upstream_host='127.0.0.1', configure_nginx=True):
+    """
+    Change the number of runserver replicas without dropping requests.
+
+    Scaling up starts the new replicas and waits for them before adding them
+    to the upstream. Scaling down removes replicas from the upstream first,
+    reloads Nginx (old workers finish in-flight requests) and stops the
+    processes in the background after REPLICA_DRAIN_SECONDS.
+    """
+    try:
+        project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
+        django_info = detect_django_structure(project_folder)
+        if not django_info['is_django']:
+            return {'success': False, 'error': 'Project is not deployed'}
+        
+        running = read_replica_files(username, project_name, 'pid')
+        current = {r: p for r, p in get_replica_ports(username, project_name).items() if r in running}
+        
+        if replicas > len(current):
+            wanted = [r for r in range(replicas) if r not in current][:replicas - len(current)]
+            new_ports = allocate_replica_ports(wanted)
+            started = start_django_replicas(
+                username, project_name, project_folder, django_info, sys.executable, '127.0.0.1', new_ports
+            )
+            current.update(started)
+            if configure_nginx and subdomain:
+                generate_nginx_config(subdomain, list(current.values()), username, project_name, upstream_host)
+            if len(started) < len(wanted):
+                return {'success': False, 'ports': list(current.values()), 'error': 'Some replicas failed to start'}
+        
+        elif replicas < len(current):
+            keep = dict(list(current.items())[:replicas])
+            removed = [r for r in current if r not in keep]
+            if configure_nginx and subdomain:
+                generate_nginx_config(subdomain, list(keep.values()), username, project_name, upstream_host)
+                after_drain(stop_django_project, username, project_name, replicas=removed)
+            else:
+                # The caller has already drained them
+                stop_django_project(username, project_name, replicas=removed)
+            current = keep
+        
+        return {'success': True, 'ports': list(current.values())}
+    
     except Exception as e:
-        logger.warning(f"Error stopping Django project: {str(e)}")
+        logger.error(f"Scaling error: {str(e)}")
+        return {'success': False, 'error': str(e)}
 
 def detect_django_structure(project_folder):
     """Detect Django project structure"""
@@ -920,26 +1137,26 @@ def check_django_deployment_status(username, project_name, domain_name):
     """Check deployment status"""
     try:
         project_folder = os.path.join(MEDIA_ROOT, f"{username}_{project_name}")
-        pid_file = os.path.join(project_folder, f'{username}_{project_name}.pid')
         log_file = os.path.join(project_folder, f'{username}_{project_name}.log')
+        pids = read_replica_files(username, project_name, 'pid')
         
-        if os.path.exists(pid_file):
-            with open(pid_file, 'r') as f:
-                pid = int(f.read().strip())
-            
-            try:
-                if IS_WINDOWS:
-                    result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'], 
-                                          capture_output=True, text=True)
-                    process_running = str(pid) in result.stdout
-                else:
-                    os.kill(pid, 0)
-                    process_running = True
-            except (OSError, ProcessLookupError):
-                process_running = False
+        if pids:
+            running_replicas = 0
+            for replica, pid in pids.items():
+                try:
+                    if IS_WINDOWS:
+                        result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'], 
+                                              capture_output=True, text=True)
+                        running_replicas += str(pid) in result.stdout
+                    else:
+                        # Unlike os.kill(pid, 0), not fooled by a recycled PID
+                        running_replicas += replica_running(username, project_name, replica, pid)
+                except (OSError, ProcessLookupError):
+                    pass
+            process_running = running_replicas > 0
             
             # Get logs if available
-            logs = f'Process PID: {pid}'
+            logs = f'Process PID: {pids.get(0, next(iter(pids.values())))}'
             if os.path.exists(log_file):
                 try:
                     with open(log_file, 'r') as f:
@@ -953,6 +1170,8 @@ def check_django_deployment_status(username, project_name, domain_name):
                 'container_running': process_running,
                 'web_accessible': process_running,
                 'db_running': True,
+                'replicas_running': running_replicas,
+                'ports': list(get_replica_ports(username, project_name).values()),
                 'logs': logs
             }
         else:
@@ -981,6 +1200,7 @@ def cleanup_django_deployment(username, project_name):
             if project and project.subdomain:
                 subdomain = project.subdomain.replace(f".{BASE_DOMAIN}", "")
                 remove_nginx_config(subdomain)
+                remove_tenant_assets(subdomain)
         except:
             pass
         
@@ -999,16 +1219,40 @@ def get_django_project_info(project_folder):
         'apps': []
     }
 
-# Placeholder functions
-def deploy_website(username, title, file_path, is_dynamic=False, custom_domain=None):
-    local_ip = get_local_ip()
-    return f"{local_ip}:8080"
+# Static website hosting
+def website_hostnames(site, custom_domain=None):
+    hostnames = [f"{site}.{BASE_DOMAIN}"]
+    if custom_domain:
+        hostnames.append(custom_domain.strip().lower())
+    return hostnames
+
+def deploy_website(username, title, file_path, is_dynamic=False, custom_domain=None, subdomain=None):
+    """
+    Publish a static website from its uploaded ZIP and route it through Nginx.
+    Returns the site's hostname, or None if publishing failed.
+    """
+    site = site_label(subdomain or f"{username}-{title}")
+    success, error = deploy_static_site(site, file_path, website_hostnames(site, custom_domain))
+    if not success:
+        logger.error(f"Static website {site} failed to deploy: {error}")
+        return None
+    return f"{site}.{BASE_DOMAIN}"
 
 def check_deployment_status(username, title, domain_name):
-    return True
+    """True when the site behind domain_name has a live release"""
+    if not domain_name:
+        return False
+    return site_is_live(domain_name.split('.', 1)[0])
 
-def cleanup_deployment(username, title):
-    pass
+def cleanup_deployment(username, title, domain_name=None, custom_domain=None):
+    """Unroute a static website and delete its releases"""
+    if not domain_name:
+        return
+    try:
+        site = domain_name.split('.', 1)[0]
+        remove_static_site(site, website_hostnames(site, custom_domain))
+    except Exception as e:
+        logger.error(f"Cleanup error: {str(e)}")
 
 
 
@@ -1016,130 +1260,73 @@ NGINX_SITES_AVAILABLE = "/etc/nginx/sites-available"
 NGINX_SITES_ENABLED = "/etc/nginx/sites-enabled"
 BASE_DOMAIN = "samitchaudhary.com.np"
 
-def generate_nginx_config(subdomain, port, username, project_name):
+
+def tenant_key(project):
     """
-    Generate Nginx configuration for a subdomain
+    A project's tenant label: the key of its route, the name of its
+    access log (and so of its traffic rows) and its metrics label
     """
-    try:
-        config_name = f"{subdomain}"
-        config_path = os.path.join(NGINX_SITES_AVAILABLE, config_name)
-        
-        nginx_config = f"""# Nginx configuration for {subdomain}
-# Generated automatically for user: {username}, project: {project_name}
+    return (project.domain_name or project.subdomain).replace(f".{BASE_DOMAIN}", "")
 
-server {{
-    listen 80;
-    server_name {subdomain}.{BASE_DOMAIN};
-    
-    # Logging
-    access_log /var/log/nginx/{subdomain}_access.log;
-    error_log /var/log/nginx/{subdomain}_error.log;
-    
-    # Proxy settings
-    location / {{
-        proxy_pass http://127.0.0.1:{port};
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        proxy_set_header X-Forwarded-Host $server_name;
-        
-        # WebSocket support
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection "upgrade";
-        
-        # Timeouts
-        proxy_connect_timeout 60s;
-        proxy_send_timeout 60s;
-        proxy_read_timeout 60s;
-    }}
-    
-    # Static files (if served by Nginx)
-    location /static/ {{
-        alias /var/www/{subdomain}/staticfiles/;
-        expires 30d;
-        add_header Cache-Control "public, immutable";
-    }}
-    
-    # Media files
-    location /media/ {{
-        alias /var/www/{subdomain}/media/;
-        expires 30d;
-    }}
-}}
-"""
-        
-        # Write configuration file
-        with open(config_path, 'w') as f:
-            f.write(nginx_config)
-        
-        logger.info(f"Nginx config created at {config_path}")
-        
-        # Create symbolic link to enable the site
-        enabled_path = os.path.join(NGINX_SITES_ENABLED, config_name)
-        if not os.path.exists(enabled_path):
-            os.symlink(config_path, enabled_path)
-            logger.info(f"Enabled site: {config_name}")
-        
-        # Test Nginx configuration
-        test_result = subprocess.run(
-            ['sudo', 'nginx', '-t'],
-            capture_output=True, text=True
-        )
+def generate_nginx_config(subdomain, port, username, project_name, upstream_host='127.0.0.1'):
+    """
+    Route a subdomain to the project through the shared tenant routing table
+
+    port may be a single port or a list of replica ports. upstream_host is
+    the worker node running the project; it stays 127.0.0.1 for projects
+    deployed on this server.
+    """
+    try:
+        ports = list(port) if isinstance(port, (list, tuple)) else [port]
+        servers = [f"{upstream_host}:{p}" for p in ports]
         
-        if test_result.returncode == 0:
-            logger.info("Nginx configuration test passed")
-            
-            # Reload Nginx
-            reload_result = subprocess.run(
-                ['sudo', 'systemctl', 'reload', 'nginx'],
-                capture_output=True, text=True
-            )
-            
-            if reload_result.returncode == 0:
-                logger.info("Nginx reloaded successfully")
-                return True
-            else:
-                logger.error(f"Nginx reload failed: {reload_result.stderr}")
-                return False
+        success, message = set_route(f"{subdomain}.{BASE_DOMAIN}", subdomain, servers)
+        if success:
+            # An old per-tenant server block would shadow the wildcard server
+            remove_legacy_nginx_site(subdomain)
+            logger.info(f"Nginx route for {subdomain} ({username}/{project_name}) applied")
         else:
-            logger.error(f"Nginx config test failed: {test_result.stderr}")
-            # Rollback
-            os.remove(config_path)
-            if os.path.exists(enabled_path):
-                os.remove(enabled_path)
-            return False
+            logger.error(f"Nginx route for {subdomain} not applied: {message}")
+        return success
         
     except Exception as e:
         logger.error(f"Error generating Nginx config: {str(e)}")
         return False
 
 
+def remove_legacy_nginx_site(config_name):
+    """
+    Delete a per-tenant server file left over from before the shared
+    routing table, and reload Nginx if there was one. Call it only once
+    the hostname's route is live (or removed), so a failed route change
+    leaves the old site serving.
+    """
+    removed = False
+    for path in (os.path.join(NGINX_SITES_ENABLED, config_name), os.path.join(NGINX_SITES_AVAILABLE, config_name)):
+        try:
+            if os.path.lexists(path):
+                os.remove(path)
+                removed = True
+                logger.info(f"Removed legacy Nginx site: {path}")
+        except OSError as e:
+            logger.warning(f"Could not remove legacy Nginx site {path}: {str(e)}")
+    if removed:
+        success, message = request_nginx_reload(f"legacy site {config_name}")
+        if not success:
+            logger.warning(f"Nginx reload after removing legacy site {config_name} failed: {message}")
+    return removed
+
+
 def remove_nginx_config(subdomain):
     """
-    Remove Nginx configuration for a subdomain
+    Remove a subdomain from the tenant routing table
     """
     try:
-        config_name = f"{subdomain}"
-        config_path = os.path.join(NGINX_SITES_AVAILABLE, config_name)
-        enabled_path = os.path.join(NGINX_SITES_ENABLED, config_name)
-        
-        # Remove symbolic link
-        if os.path.exists(enabled_path):
-            os.remove(enabled_path)
-            logger.info(f"Removed enabled site: {config_name}")
-        
-        # Remove configuration file
-        if os.path.exists(config_path):
-            os.remove(config_path)
-            logger.info(f"Removed config: {config_path}")
-        
-        # Reload Nginx
-        subprocess.run(
-            ['sudo', 'systemctl', 'reload', 'nginx'],
-            capture_output=True, text=True
-        )
+        success, message = remove_route(f"{subdomain}.{BASE_DOMAIN}")
+        if success:
+            remove_legacy_nginx_site(subdomain)
+        else:
+            logger.error(f"Nginx reload after removing {subdomain} failed: {message}")
         
         return True
         
@@ -4,32 +4,43 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import WebsiteForm, SignupForm, DjangoProjectForm
-from .models import Website, DjangoProject
+from .models import Website, DjangoProject, ProjectStatus
 from .utils import (
-    deploy_django_project, 
-    check_django_deployment_status,
-    cleanup_django_deployment,
     get_django_project_info,
-    get_local_ip
+    get_local_ip,
+    tenant_key,
 )
+from .nodes import deploy_project, scale_project, project_status, cleanup_project, apply_cache_profile
+from .nodes import stop_project as stop_node_project
+from .access_logs import recent_cache_stats
+from .health import summarize_health
+from .events import poll_events, EVENT_STREAM_RETRY_MS
+from .summary import get_user_summary, storage_usage
+from .page_cache import cache_public_page
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 import os
 import uuid
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Existing public pages
+@cache_public_page
 def home(request):
     return render(request, 'home.html')
 
+@cache_public_page
 def about(request):
     return render(request, 'about.html')
 
+@cache_public_page
 def plans(request):
     return render(request, 'plans.html')
 
+@cache_public_page
 def contact(request):
     return render(request, 'contact.html')
 
@@ -77,15 +88,14 @@ def logout_view(request):
 # Dashboard
 @login_required
 def dashboard_view(request):
-    # Get both static websites and Django projects
-    websites = Website.objects.filter(user=request.user)
-    django_projects = DjangoProject.objects.filter(user=request.user)
+    summary = get_user_summary(request.user)
     
     context = {
-        'websites': websites,
-        'django_projects': django_projects,
-        'total_sites': websites.count() + django_projects.count(),
-        'active_sites': websites.filter(is_active=True).count() + django_projects.filter(is_active=True).count()
+        'static_sites': summary['static_sites'],
+        'django_projects': summary['django_projects'],
+        'total_sites': summary['total_deployments'],
+        'active_sites': summary['active_sites'],
+        'total_storage': round(summary['deployment_storage'] / (1024 * 1024), 2),
     }
     
     return render(request, 'dashboard.html', context)
@@ -180,10 +190,10 @@ def deploy_django_view(request):
 
                 # Deploy the project
                 try:
-                    deployment_result = deploy_django_project(
+                    deployment_result = deploy_project(
+                        django_project,
                         request.user.username,
                         safe_name,
-                        django_project.project_file.path,
                         django_project.custom_domain
                     )
                     
@@ -336,35 +346,16 @@ def toggle_django_project_status(request, project_id):
 @login_required
 def django_projects_view(request):
     """List all Django projects with subdomain URLs"""
-    projects = DjangoProject.objects.filter(user=request.user)
+    # Status comes from the background collector (manage.py run_collectors)
+    # Availability comes from the health prober (manage.py run_health_prober)
+    projects = DjangoProject.objects.filter(user=request.user).select_related('status').prefetch_related('health_checks')
     
-    # Update status for each project
     for project in projects:
-        if project.domain_name and project.deployment_status != 'failed':
-            safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
-            try:
-                status = check_django_deployment_status(
-                    request.user.username,
-                    safe_name,
-                    project.domain_name
-                )
-                project.current_status = status
-                
-                # Update database status if needed
-                if status.get('status') and not project.is_active:
-                    project.is_active = True
-                    project.deployment_status = 'deployed'
-                    project.save()
-                elif not status.get('status') and project.is_active:
-                    project.is_active = False
-                    project.deployment_status = 'error'
-                    project.save()
-                    
-            except Exception as e:
-                logger.error(f"Error checking status for project {project.id}: {e}")
-                project.current_status = {'status': False, 'error': str(e)}
-        else:
+        try:
+            project.current_status = project.status.as_dict()
+        except ProjectStatus.DoesNotExist:
             project.current_status = {'status': False}
+        project.health = summarize_health(project.health_checks.all())
     
     return render(request, 'django_projects.html', {'projects': projects})
 
@@ -379,7 +370,8 @@ def django_project_detail(request, project_id):
     if project.domain_name and project.deployment_status != 'failed':
         safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
         try:
-            status = check_django_deployment_status(
+            status = project_status(
+                project,
                 request.user.username,
                 safe_name,
                 project.domain_name
@@ -435,7 +427,7 @@ def delete_django_project(request, project_id):
         safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
         
         # Cleanup deployment resources
-        cleanup_django_deployment(request.user.username, safe_name)
+        cleanup_project(project, request.user.username, safe_name)
         
         # Remove project files
         if project.project_folder and os.path.exists(project.project_folder):
@@ -468,14 +460,13 @@ def restart_django_project(request, project_id):
         
         if project_folder and os.path.exists(project_folder):
             # Stop and restart the server
-            from .utils import stop_django_project
-            stop_django_project(request.user.username, safe_name)
+            stop_node_project(project, request.user.username, safe_name)
             
             # Redeploy
-            deployment_result = deploy_django_project(
+            deployment_result = deploy_project(
+                project,
                 request.user.username,
                 safe_name,
-                project.project_file.path,
                 project.custom_domain
             )
             
@@ -546,19 +537,18 @@ def update_django_project(request, project_id):
             
             try:
                 # Stop current server
-                from .utils import stop_django_project
                 safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
-                stop_django_project(request.user.username, safe_name)
+                stop_node_project(project, request.user.username, safe_name)
                 
                 # Save new file
                 project.project_file = project_file
                 project.save()
                 
                 # Redeploy
-                deployment_result = deploy_django_project(
+                deployment_result = deploy_project(
+                    project,
                     request.user.username,
                     safe_name,
-                    project.project_file.path,
                     project.custom_domain
                 )
                 
@@ -591,60 +581,127 @@ def update_django_project(request, project_id):
         logger.error(f"Update project error for project {project_id}: {str(e)}")
         return JsonResponse({'success': False, 'error': str(e)})
 
+@login_required
+def scale_django_project(request, project_id):
+    """Change the number of replicas serving a Django project"""
+    try:
+        project = get_object_or_404(DjangoProject, id=project_id, user=request.user)
+        
+        if request.method != 'POST':
+            return JsonResponse({'success': False, 'error': 'Method not allowed'})
+        
+        data = json.loads(request.body or '{}')
+        max_replicas = getattr(settings, 'MAX_REPLICAS_PER_PROJECT', 8)
+        try:
+            replicas = int(data.get('replicas', 1))
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Replicas must be a number'})
+        
+        if not 1 <= replicas <= max_replicas:
+            return JsonResponse({'success': False, 'error': f'Replicas must be between 1 and {max_replicas}'})
+        
+        if project.deployment_status != 'deployed':
+            return JsonResponse({'success': False, 'error': 'Project must be deployed before scaling'})
+        
+        safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
+        result = scale_project(project, request.user.username, safe_name, replicas)
+        
+        if result.get('success'):
+            project.replicas = replicas
+            project.save(update_fields=['replicas', 'updated_at'])
+            return JsonResponse({
+                'success': True,
+                'message': f'Project scaled to {replicas} replica(s)',
+                'ports': result.get('ports', []),
+            })
+        
+        return JsonResponse({'success': False, 'error': result.get('error', 'Scaling failed')})
+        
+    except Exception as e:
+        logger.error(f"Scale error for project {project_id}: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)})
+
+@login_required
+def update_cache_profile(request, project_id):
+    """Change how the edge caches a Django project's anonymous GET responses"""
+    try:
+        project = get_object_or_404(DjangoProject, id=project_id, user=request.user)
+        
+        if request.method != 'POST':
+            return JsonResponse({'success': False, 'error': 'Method not allowed'})
+        
+        data = json.loads(request.body or '{}')
+        profile = data.get('profile', 'off')
+        if profile not in dict(DjangoProject.CACHE_PROFILE_CHOICES):
+            return JsonResponse({'success': False, 'error': 'Unknown cache profile'})
+        
+        max_ttl = getattr(settings, 'MAX_CACHE_TTL', 3600)
+        if profile == 'custom':
+            try:
+                ttl = int(data.get('ttl', project.cache_ttl))
+            except (TypeError, ValueError):
+                return JsonResponse({'success': False, 'error': 'TTL must be a number'})
+            if not 1 <= ttl <= max_ttl:
+                return JsonResponse({'success': False, 'error': f'TTL must be between 1 and {max_ttl} seconds'})
+            project.cache_ttl = ttl
+        
+        project.cache_profile = profile
+        project.save(update_fields=['cache_profile', 'cache_ttl', 'updated_at'])
+        
+        if project.deployment_status == 'deployed':
+            success, message = apply_cache_profile(project)
+            if not success:
+                return JsonResponse({'success': False, 'error': message})
+        
+        return JsonResponse({'success': True, 'message': f'Cache profile set to {project.get_cache_profile_display()}'})
+        
+    except Exception as e:
+        logger.error(f"Cache profile error for project {project_id}: {str(e)}")
+        return JsonResponse({'success': False, 'error': str(e)})
+
 @login_required
 def django_project_metrics(request, project_id):
     """Get Django project metrics"""
-    import subprocess
     try:
         project = get_object_or_404(DjangoProject, id=project_id, user=request.user)
-        safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
         
         metrics = {
             'cpu_usage': 0,
             'memory_usage': 0,
+            'memory_pss': 0,
+            'open_connections': 0,
             'disk_usage': 0,
-            'status': 'unknown'
+            'disk_limit': None,
+            'over_limit': False,
+            'status': 'unknown',
+            'sampled_at': None,
+            'cache_hit_ratio': None,
         }
         
         try:
-            # Check if process is running
-            pid_file = os.path.join(project.project_folder, f'{request.user.username}_{safe_name}.pid')
+            # Written by the background status collector and resource sampler
+            status = ProjectStatus.objects.filter(django_project=project).first()
+            if status:
+                metrics['status'] = 'running' if status.is_running else 'stopped'
             
-            if os.path.exists(pid_file):
-                with open(pid_file, 'r') as f:
-                    pid = int(f.read().strip())
-                
-                # Check if process exists
-                import platform
-                if platform.system() == 'Windows':
-                    result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'], 
-                                          capture_output=True, text=True)
-                    metrics['status'] = 'running' if str(pid) in result.stdout else 'stopped'
-                else:
-                    try:
-                        os.kill(pid, 0)
-                        metrics['status'] = 'running'
-                    except:
-                        metrics['status'] = 'stopped'
-            else:
-                metrics['status'] = 'stopped'
-                
-            # Get disk usage
-            if project.project_folder and os.path.exists(project.project_folder):
-                def get_dir_size(path):
-                    total_size = 0
-                    for dirpath, dirnames, filenames in os.walk(path):
-                        for filename in filenames:
-                            filepath = os.path.join(dirpath, filename)
-                            try:
-                                total_size += os.path.getsize(filepath)
-                            except:
-                                pass
-                    return total_size
+            sample = project.resource_samples.first()
+            if sample:
+                metrics.update({
+                    'cpu_usage': sample.cpu_usage,
+                    'memory_usage': sample.memory_usage,
+                    'memory_pss': sample.memory_pss,
+                    'open_connections': sample.open_connections,
+                    'disk_usage': f"{sample.disk_usage} MB",
+                    'disk_limit': f"{sample.disk_limit:g} MB",
+                    'bandwidth_usage': f"{sample.bandwidth_usage} MB",
+                    'bandwidth_limit': f"{sample.bandwidth_limit:g} MB",
+                    'over_limit': sample.is_over_limit(),
+                    'sampled_at': sample.recorded_at.isoformat(),
+                })
                 
-                size_bytes = get_dir_size(project.project_folder)
-                size_mb = round(size_bytes / (1024 * 1024), 2)
-                metrics['disk_usage'] = f"{size_mb} MB"
+            # Edge cache effectiveness, from the traffic the log follower stored
+            if project.get_cache_ttl():
+                metrics['cache_hit_ratio'] = recent_cache_stats(tenant_key(project))['hit_ratio']
             
         except Exception as e:
             logger.error(f"Error getting metrics for project {project_id}: {e}")
@@ -656,6 +713,36 @@ def django_project_metrics(request, project_id):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+@login_required
+def dashboard_events(request):
+    """
+    Server-Sent Events of the user's project status, deploy state, metrics
+    and log lines. Each response carries what changed since the client's
+    Last-Event-ID and ends, so no worker is held open; EventSource
+    reconnects after `retry`.
+    """
+    cursor = request.headers.get('Last-Event-ID')
+    try:
+        events, cursor = poll_events(request.user.id, cursor)
+    except Exception as e:
+        logger.error(f"Dashboard events failed for user {request.user.id}: {str(e)}")
+        events = []
+
+    def stream():
+        yield f"retry: {EVENT_STREAM_RETRY_MS}\n\n"
+        for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+        if cursor:
+            # An id on its own moves the browser's Last-Event-ID without dispatching an event
+            yield f"id: {cursor}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop Nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # Static Website Management
 @login_required
 def deploy_static_view(request):
@@ -672,19 +759,18 @@ def deploy_static_view(request):
             unique_id = uuid.uuid4().hex[:6]
             website.subdomain = f"{request.user.username}-{safe_title}-{unique_id}".lower()
 
-            WEBSITES_ROOT = getattr(settings, 'WEBSITES_ROOT', 
-                                  os.path.join(settings.BASE_DIR, "media", "websites"))
-            website.folder_name = os.path.join(WEBSITES_ROOT, f"{request.user.username}_{safe_title}")
+            from .utils import deploy_website, site_label, site_root
+            website.folder_name = site_root(site_label(website.subdomain))
             
             website.save()
 
-            from .utils import deploy_website
             domain_link = deploy_website(
                 request.user.username,
                 safe_title,
                 website.uploaded_file.path,
                 is_dynamic=False,
-                custom_domain=website.custom_domain
+                custom_domain=website.custom_domain,
+                subdomain=website.subdomain
             )
 
             if domain_link:
@@ -725,7 +811,7 @@ def delete_website(request, website_id):
         
         from .utils import cleanup_deployment
         safe_title = "".join(c if c.isalnum() else "_" for c in website.title)
-        cleanup_deployment(request.user.username, safe_title)
+        cleanup_deployment(request.user.username, safe_title, website.domain_name, website.custom_domain)
         
         if website.folder_name and os.path.exists(website.folder_name):
             import shutil
@@ -744,10 +830,11 @@ def delete_website(request, website_id):
 
 @login_required
 def settings_view(request):
+    summary = get_user_summary(request.user)
     context = {
-        'total_deployments': Website.objects.filter(user=request.user).count() + DjangoProject.objects.filter(user=request.user).count(),
-        'active_sites': Website.objects.filter(user=request.user, is_active=True).count() + DjangoProject.objects.filter(user=request.user, is_active=True).count(),
-        'storage_used': 0,
+        'total_deployments': summary['total_deployments'],
+        'active_sites': summary['active_sites'],
+        'storage_used': round((summary['deployment_storage'] + summary['file_storage']) / (1024 * 1024), 2),
         'bandwidth_used': 0,
     }
     
@@ -772,141 +859,11 @@ def settings_view(request):
 
 
 
-from django.db.models import Count, Q
+from django.db.models import Count
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 import json
 from datetime import datetime, timedelta
-@login_required
-def reports(request):
-    """Comprehensive reports and analytics view"""
-    user = request.user
-    
-    # Get all user's projects
-    websites = Website.objects.filter(user=user)
-    django_projects = DjangoProject.objects.filter(user=user)
-    
-    # Basic stats
-    total_static_sites = websites.count()
-    total_django_projects = django_projects.count()
-    total_deployments = total_static_sites + total_django_projects
-    
-    active_static_sites = websites.filter(is_active=True).count()
-    active_django_projects = django_projects.filter(is_active=True).count()
-    active_sites = active_static_sites + active_django_projects
-    
-    # Calculate success rate (percentage of active vs total)
-    success_rate = round((active_sites / total_deployments * 100) if total_deployments > 0 else 0, 1)
-    
-    # Calculate storage usage (in MB)
-    storage_used = 0
-    for website in websites:
-        try:
-            if website.uploaded_file and hasattr(website.uploaded_file, 'size'):
-                storage_used += website.uploaded_file.size
-        except:
-            pass
-    
-    for project in django_projects:
-        try:
-            if project.project_file and hasattr(project.project_file, 'size'):
-                storage_used += project.project_file.size
-        except:
-            pass
-    
-    storage_used = round(storage_used / (1024 * 1024), 2)  # Convert to MB
-    
-    # Generate deployment timeline data (last 30 days)
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=30)
-    
-    deployment_dates = []
-    deployment_counts = []
-    
-    # Create date range for the last 30 days
-    current_date = start_date
-    while current_date <= end_date:
-        deployment_dates.append(current_date.strftime('%m/%d'))
-        
-        # Count deployments for this date
-        daily_websites = websites.filter(created_at__date=current_date).count()
-        daily_django = django_projects.filter(created_at__date=current_date).count()
-        daily_total = daily_websites + daily_django
-        
-        deployment_counts.append(daily_total)
-        current_date += timedelta(days=1)
-    
-    # Recent deployments (last 10)
-    recent_websites = list(websites.order_by('-created_at')[:5])
-    recent_django = list(django_projects.order_by('-created_at')[:5])
-    
-    # Combine and sort recent deployments
-    recent_deployments = recent_websites + recent_django
-    recent_deployments.sort(key=lambda x: x.created_at, reverse=True)
-    recent_deployments = recent_deployments[:10]
-    
-    # All projects for the table (combine both types)
-    all_projects = []
-    
-    # Add websites
-    for website in websites.order_by('-created_at'):
-        all_projects.append({
-            'title': website.title,
-            'project_name': None,  # This helps distinguish in template
-            'is_active': website.is_active,
-            'domain_name': website.domain_name,
-            'created_at': website.created_at,
-            'project_file': None,
-            'uploaded_file': website.uploaded_file
-        })
-    
-    # Add Django projects
-    for project in django_projects.order_by('-created_at'):
-        all_projects.append({
-            'title': None,
-            'project_name': project.project_name,
-            'is_active': project.is_active,
-            'domain_name': project.domain_name,
-            'created_at': project.created_at,
-            'project_file': project.project_file,
-            'uploaded_file': None
-        })
-    
-    # Sort all projects by creation date
-    all_projects.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    # Convert objects to template-friendly format
-    all_projects_formatted = []
-    for project in all_projects:
-        project_data = type('obj', (object,), project)
-        all_projects_formatted.append(project_data)
-    
-    context = {
-        # Basic stats
-        'total_deployments': total_deployments,
-        'total_static_sites': total_static_sites,
-        'total_django_projects': total_django_projects,
-        'active_sites': active_sites,
-        'active_static_sites': active_static_sites,
-        'active_django_projects': active_django_projects,
-        'storage_used': storage_used,
-        'success_rate': success_rate,
-        
-        # Chart data
-        'deployment_dates': json.dumps(deployment_dates),
-        'deployment_counts': json.dumps(deployment_counts),
-        'django_count': total_django_projects,
-        'static_count': total_static_sites,
-        
-        # Lists
-        'recent_deployments': recent_deployments,
-        'all_projects': all_projects_formatted,
-        
-        # Additional stats
-        'websites': websites,
-        'django_projects': django_projects,
-    }
-    
-    return render(request, 'reports.html', context)
 
 @login_required
 def update_custom_domain(request, project_id):
@@ -939,16 +896,14 @@ def update_custom_domain(request, project_id):
             # Restart project to apply changes (optional)
             try:
                 safe_name = "".join(c if c.isalnum() else "_" for c in project.project_name)
-                from .utils import stop_django_project, deploy_django_project
-                
                 # Stop existing server
-                stop_django_project(request.user.username, safe_name)
+                stop_node_project(project, request.user.username, safe_name)
                 
                 # Redeploy with custom domain
-                deployment_result = deploy_django_project(
+                deployment_result = deploy_project(
+                    project,
                     request.user.username,
                     safe_name,
-                    project.project_file.path,
                     custom_domain
                 )
                 
@@ -1023,16 +978,14 @@ def remove_custom_domain(request, project_id):
             
             # Restart project with new configuration (optional)
             try:
-                from .utils import stop_django_project, deploy_django_project
-                
                 # Stop existing server
-                stop_django_project(request.user.username, safe_name)
+                stop_node_project(project, request.user.username, safe_name)
                 
                 # Redeploy without custom domain
-                deployment_result = deploy_django_project(
+                deployment_result = deploy_project(
+                    project,
                     request.user.username,
                     safe_name,
-                    project.project_file.path,
                     None  # No custom domain
                 )
                 
@@ -1078,148 +1031,96 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from .models import UserFile, StorageSettings, PaymentRequest
 from .forms import FileUploadForm, PaymentRequestForm
+from .rollups import resource_series
+
+# Chart ranges offered on the reports page, in seconds
+REPORT_RANGES = {'1h': 3600, '24h': 86400, '7d': 7 * 86400, '30d': 30 * 86400, '90d': 90 * 86400}
 
 @login_required
 def reports(request):
     """Comprehensive reports and analytics view"""
-    import os
-    from django.core.files.storage import default_storage
-    
     user = request.user
     
-    # Get all user's projects
     websites = Website.objects.filter(user=user)
     django_projects = DjangoProject.objects.filter(user=user)
     
-    # Basic stats
-    total_static_sites = websites.count()
-    total_django_projects = django_projects.count()
-    total_deployments = total_static_sites + total_django_projects
+    # Basic stats and storage from the cached per-user summary
+    summary = get_user_summary(user)
+    
+    total_static_sites = summary['static_sites']
+    total_django_projects = summary['django_projects']
+    total_deployments = summary['total_deployments']
     
-    active_static_sites = websites.filter(is_active=True).count()
-    active_django_projects = django_projects.filter(is_active=True).count()
-    active_sites = active_static_sites + active_django_projects
+    active_static_sites = summary['active_static_sites']
+    active_django_projects = summary['active_django_projects']
+    active_sites = summary['active_sites']
     
     # Calculate success rate (percentage of active vs total)
     success_rate = round((active_sites / total_deployments * 100) if total_deployments > 0 else 0, 1)
     
-    # Calculate storage usage (in MB)
-    storage_used = 0
+    # File sizes are stored at upload time (manage.py backfill_file_stats for older rows)
+    storage_used = round(summary['deployment_storage'] / (1024 * 1024), 2)  # Convert to MB
     
-    # Process websites
-    for website in websites:
-        try:
-            if website.uploaded_file:
-                # Check if file actually exists before accessing size
-                if default_storage.exists(website.uploaded_file.name):
-                    storage_used += website.uploaded_file.size
-                else:
-                    # Optional: Log missing files
-                    print(f"Warning: File not found for website {website.id}: {website.uploaded_file.name}")
-        except Exception as e:
-            print(f"Error processing website {website.id}: {e}")
-            pass
-    
-    # Process Django projects
-    for project in django_projects:
-        try:
-            if project.project_file:
-                # Check if file actually exists before accessing size
-                if default_storage.exists(project.project_file.name):
-                    storage_used += project.project_file.size
-                else:
-                    # Optional: Log missing files
-                    print(f"Warning: File not found for project {project.id}: {project.project_file.name}")
-        except Exception as e:
-            print(f"Error processing project {project.id}: {e}")
-            pass
-    
-    storage_used = round(storage_used / (1024 * 1024), 2)  # Convert to MB
-    
-    # Generate deployment timeline data (last 30 days)
+    # Deployment timeline (last 30 days): one grouped query per model
     end_date = timezone.now().date()
     start_date = end_date - timedelta(days=30)
     
+    daily_counts = {}
+    for queryset in (websites, django_projects):
+        rows = (
+            queryset
+            .filter(created_at__date__gte=start_date)
+            .annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for row in rows:
+            daily_counts[row['day']] = daily_counts.get(row['day'], 0) + row['count']
+    
     deployment_dates = []
     deployment_counts = []
-    
-    # Create date range for the last 30 days
     current_date = start_date
     while current_date <= end_date:
         deployment_dates.append(current_date.strftime('%m/%d'))
-        
-        # Count deployments for this date
-        daily_websites = websites.filter(created_at__date=current_date).count()
-        daily_django = django_projects.filter(created_at__date=current_date).count()
-        daily_total = daily_websites + daily_django
-        
-        deployment_counts.append(daily_total)
+        deployment_counts.append(daily_counts.get(current_date, 0))
         current_date += timedelta(days=1)
     
-    # Recent deployments (last 10)
-    recent_websites = list(websites.order_by('-created_at')[:5])
-    recent_django = list(django_projects.order_by('-created_at')[:5])
-    
-    # Combine and sort recent deployments
-    recent_deployments = recent_websites + recent_django
-    recent_deployments.sort(key=lambda x: x.created_at, reverse=True)
-    recent_deployments = recent_deployments[:10]
-    
     # All projects for the table (combine both types)
     all_projects = []
     
-    # Add websites
-    for website in websites.order_by('-created_at'):
-        # Check if file exists for size display
-        file_size = None
-        if website.uploaded_file:
-            try:
-                if default_storage.exists(website.uploaded_file.name):
-                    file_size = website.uploaded_file.size
-            except:
-                pass
-        
+    for website in websites.only('title', 'is_active', 'domain_name', 'created_at', 'file_size').order_by('-created_at'):
         all_projects.append({
             'title': website.title,
             'project_name': None,
             'is_active': website.is_active,
             'domain_name': website.domain_name,
             'created_at': website.created_at,
-            'project_file': None,
-            'uploaded_file': website.uploaded_file if file_size else None,
-            'file_size': file_size,
+            'file_size': website.file_size,
         })
     
-    # Add Django projects
-    for project in django_projects.order_by('-created_at'):
-        # Check if file exists for size display
-        file_size = None
-        if project.project_file:
-            try:
-                if default_storage.exists(project.project_file.name):
-                    file_size = project.project_file.size
-            except:
-                pass
-        
+    for project in django_projects.only('project_name', 'is_active', 'domain_name', 'created_at', 'file_size').order_by('-created_at'):
         all_projects.append({
             'title': None,
             'project_name': project.project_name,
             'is_active': project.is_active,
             'domain_name': project.domain_name,
             'created_at': project.created_at,
-            'project_file': project.project_file if file_size else None,
-            'uploaded_file': None,
-            'file_size': file_size,
+            'file_size': project.file_size,
         })
     
     # Sort all projects by creation date
     all_projects.sort(key=lambda x: x['created_at'], reverse=True)
     
     # Convert objects to template-friendly format
-    all_projects_formatted = []
-    for project in all_projects:
-        project_data = type('obj', (object,), project)
-        all_projects_formatted.append(project_data)
+    all_projects_formatted = [type('obj', (object,), project) for project in all_projects]
+    recent_deployments = all_projects_formatted[:10]
+    
+    # Resource usage charts from the rollups, at a resolution that suits the range
+    chart_range = request.GET.get('range', '24h')
+    if chart_range not in REPORT_RANGES:
+        chart_range = '24h'
+    resource_usage = resource_series(user, REPORT_RANGES[chart_range])
     
     context = {
         # Basic stats
@@ -1237,14 +1138,14 @@ def reports(request):
         'deployment_counts': json.dumps(deployment_counts),
         'django_count': total_django_projects,
         'static_count': total_static_sites,
+        'resource_usage': json.dumps(resource_usage),
+        'resource_resolution': resource_usage['resolution'],
+        'chart_range': chart_range,
+        'report_ranges': list(REPORT_RANGES),
         
         # Lists
         'recent_deployments': recent_deployments,
         'all_projects': all_projects_formatted,
-        
-        # Additional stats
-        'websites': websites,
-        'django_projects': django_projects,
     }
     
     return render(request, 'reports.html', context)
@@ -1257,17 +1158,13 @@ def upload_file(request):
         defaults={'price_per_gb': 5.00, 'free_limit_gb': 1.0}
     )
 
-    # Total GB user purchased (approved payments)
-    approved_payments = PaymentRequest.objects.filter(user=request.user, status='approved')
-    purchased_gb = sum([p.gb_requested for p in approved_payments])
+    # Bytes already used and GB purchased (approved payments), read fresh for the quota
+    total_used_bytes, purchased_gb = storage_usage(request.user.id)
 
     # Total allowed storage in bytes
-    total_allowed_gb = settings.free_limit_gb + purchased_gb
+    total_allowed_gb = float(settings.free_limit_gb) + purchased_gb
     total_allowed_bytes = total_allowed_gb * 1024 * 1024 * 1024
 
-    # Total already used storage in bytes
-    total_used_bytes = sum(f.file.size for f in UserFile.objects.filter(user=request.user))
-
     if request.method == 'POST':
         form = FileUploadForm(request.POST, request.FILES)
         if form.is_valid():
@@ -1300,8 +1197,7 @@ def upload_list(request):
         id=1,
         defaults={'price_per_gb': 5.00, 'free_limit_gb': 1.0}
     )
-    approved_payments = PaymentRequest.objects.filter(user=request.user, status='approved')
-    purchased_gb = sum(float(p.gb_requested) for p in approved_payments)
+    purchased_gb = get_user_summary(request.user)['purchased_gb']
     total_gb = float(storage_settings.free_limit_gb) + purchased_gb
 
     used_bytes = 0
@@ -1395,8 +1291,7 @@ def storage_overview(request):
     )
 
     # Approved purchased storage
-    approved_payments = PaymentRequest.objects.filter(user=request.user, status='approved')
-    purchased_gb = sum(float(p.gb_requested) for p in approved_payments)
+    purchased_gb = get_user_summary(request.user)['purchased_gb']
 
     # Total available storage (free + purchased)
     total_storage_gb = float(storage_settings.free_limit_gb) + purchased_gb
@@ -1431,6 +1326,7 @@ def storage_overview(request):
         'file_reports': file_reports,
     })
 
+@cache_public_page
 def help_view(request):
     """
     Renders the Help & Support page with developer info,
@@ -1548,6 +1444,9 @@ except ImportError:
 
 from .forms import DeployForm
 from .models import DeployedProject
+from .tasks import deployed_liveness, invalidate_deployed_liveness
+from .routing import set_route, remove_route
+from .utils import remove_legacy_nginx_site
 
 PYTHON = sys.executable
 MAIN_DOMAIN = getattr(settings, 'MAIN_DOMAIN', 'samitchaudhary.com.np')
@@ -1651,87 +1550,22 @@ def get_available_port(start_port=8000, end_port=9000):
 
 
 def setup_nginx_subdomain(project_name, port):
-    """Create Nginx configuration for subdomain routing using sudo"""
+    """Route the project's subdomain through the shared tenant routing table"""
     if sys.platform == 'win32':
         return False, "Nginx configuration skipped (Windows environment)"
     
-    nginx_config = f"""server {{
-    listen 80;
-    server_name {project_name}.{MAIN_DOMAIN};
-
-    location / {{
-        proxy_pass http://127.0.0.1:{port};
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-    }}
-
-    location /static/ {{
-        alias /var/www/{project_name}/static/;
-        expires 30d;
-    }}
-
-    location /media/ {{
-        alias /var/www/{project_name}/media/;
-        expires 30d;
-    }}
-}}
-"""
-    
+    hostname = f"{project_name}.{MAIN_DOMAIN}"
     try:
-        # Write config to a temporary file first
-        temp_config = Path(f"/tmp/nginx_{project_name}.conf")
-        temp_config.write_text(nginx_config)
+        # Test and reload Nginx, batched with concurrent changes
+        success, message = set_route(hostname, project_name, [f"127.0.0.1:{port}"])
+        if not success:
+            return False, message
         
-        nginx_conf_path = f"/etc/nginx/sites-available/{project_name}.{MAIN_DOMAIN}"
-        nginx_enabled_path = f"/etc/nginx/sites-enabled/{project_name}.{MAIN_DOMAIN}"
+        # An old per-tenant server block would shadow the wildcard server
+        remove_legacy_nginx_site(hostname)
         
-        # Use sudo to move the config file
-        result = subprocess.run(
-            ['sudo', 'mv', str(temp_config), nginx_conf_path],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
+        return True, f"Nginx configured successfully for {hostname}"
         
-        if result.returncode != 0:
-            return False, f"Failed to create nginx config: {result.stderr}"
-        
-        # Create symbolic link with sudo
-        subprocess.run(
-            ['sudo', 'ln', '-sf', nginx_conf_path, nginx_enabled_path],
-            capture_output=True,
-            text=True,
-            timeout=5,
-            check=True
-        )
-        
-        # Test Nginx configuration
-        result = subprocess.run(
-            ['sudo', 'nginx', '-t'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if result.returncode != 0:
-            return False, f"Nginx config test failed: {result.stderr}"
-        
-        # Reload Nginx
-        subprocess.run(
-            ['sudo', 'systemctl', 'reload', 'nginx'],
-            capture_output=True,
-            text=True,
-            timeout=10,
-            check=True
-        )
-        
-        return True, f"Nginx configured successfully for {project_name}.{MAIN_DOMAIN}"
-        
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.decode() if hasattr(e.stderr, 'decode') else str(e)
-        return False, f"Command failed: {error_msg[:200]}"
     except subprocess.TimeoutExpired:
         return False, "Nginx command timed out"
     except FileNotFoundError:
@@ -1741,38 +1575,17 @@ def setup_nginx_subdomain(project_name, port):
 
 
 def remove_nginx_subdomain(project_name):
-    """Remove Nginx configuration for a subdomain using sudo"""
+    """Remove a subdomain from the shared tenant routing table"""
     if sys.platform == 'win32':
         return True, "Nginx not configured (Windows)"
     
-    nginx_conf_path = f"/etc/nginx/sites-available/{project_name}.{MAIN_DOMAIN}"
-    nginx_enabled_path = f"/etc/nginx/sites-enabled/{project_name}.{MAIN_DOMAIN}"
-    
+    hostname = f"{project_name}.{MAIN_DOMAIN}"
     try:
-        # Remove symbolic link
-        subprocess.run(
-            ['sudo', 'rm', '-f', nginx_enabled_path],
-            capture_output=True,
-            timeout=5,
-            check=False
-        )
-        
-        # Remove config file
-        subprocess.run(
-            ['sudo', 'rm', '-f', nginx_conf_path],
-            capture_output=True,
-            timeout=5,
-            check=False
-        )
-        
-        # Reload Nginx
-        subprocess.run(
-            ['sudo', 'systemctl', 'reload', 'nginx'],
-            capture_output=True,
-            timeout=10,
-            check=True
-        )
+        success, message = remove_route(hostname)
+        if not success:
+            return False, message
         
+        remove_legacy_nginx_site(hostname)
         return True, "Nginx configuration removed successfully"
     except subprocess.TimeoutExpired:
         return False, "Nginx command timed out"
@@ -1874,16 +1687,7 @@ def github_view(request):
 def github_success(request, pk):
     """Display deployment success page"""
     dp = get_object_or_404(DeployedProject, pk=pk)
-    
-    if dp.pid:
-        try:
-            proc = psutil.Process(dp.pid)
-            dp.running = proc.is_running()
-        except psutil.NoSuchProcess:
-            dp.running = False
-        except Exception:
-            dp.running = False
-        dp.save()
+    dp.running = deployed_liveness().get(dp.id, dp.running)
     
     return render(request, "github/hosting/deploy_success.html", {
         "project": dp,
@@ -1894,17 +1698,10 @@ def github_success(request, pk):
 def hosted_projects(request):
     """List all hosted projects with live status"""
     projects = DeployedProject.objects.order_by('-created_at')
+    liveness = deployed_liveness()
     
     for project in projects:
-        if project.pid:
-            try:
-                proc = psutil.Process(project.pid)
-                project.running = proc.is_running()
-            except psutil.NoSuchProcess:
-                project.running = False
-            except Exception:
-                project.running = False
-            project.save()
+        project.running = liveness.get(project.id, project.running)
     
     return render(request, "github/hosting/hosted_projects.html", {
         "projects": projects,
@@ -1940,6 +1737,7 @@ def stop_project(request, pk):
             except Exception as e:
                 messages.error(request, f"Error stopping process: {str(e)[:200]}")
         
+        invalidate_deployed_liveness()
         nginx_success, nginx_msg = remove_nginx_subdomain(project.name)
         if not nginx_success and sys.platform != 'win32':
             messages.warning(request, f"Nginx cleanup warning: {nginx_msg}")
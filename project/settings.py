@@ -47,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Inactive unless REQUEST_PROFILING = True; report at /admin/slow-views/
+    'app.profiling.RequestProfilingMiddleware',
+    'app.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', 
@@ -156,6 +159,51 @@ ALLOWED_UPLOAD_EXTENSIONS = ['.zip']
 # Docker settings
 DOCKER_REGISTRY = 'localhost:5000'  # Optional: for private registry
 
+# Worker nodes (manage.py run_node_agent). Shared secret sent by the control plane.
+NODE_AGENT_TOKEN = os.getenv('NODE_AGENT_TOKEN', '')
+
+# How protected downloads are delivered: 'nginx' (X-Accel-Redirect) or 'python' (FileResponse)
+SENDFILE_BACKEND = os.getenv('SENDFILE_BACKEND', 'python' if DEBUG else 'nginx')
+
+# Identifies the running release; cached public pages are keyed by it so a
+# deploy never serves pages rendered by the previous one
+def _git_revision():
+    head = BASE_DIR / '.git' / 'HEAD'
+    try:
+        ref = head.read_text().strip()
+        if ref.startswith('ref: '):
+            ref = (BASE_DIR / '.git' / ref[5:]).read_text().strip()
+        return ref[:12]
+    except OSError:
+        return 'dev'
+
+RELEASE_VERSION = os.getenv('RELEASE_VERSION') or _git_revision()
+
+# Cache: per-process memory by default. When running several workers, set
+# CACHE_BACKEND to 'file' (CACHE_LOCATION is a shared directory) or to
+# 'redis' / 'memcached' (CACHE_LOCATION is the server URL) so they share it.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION', {
+            'locmem': 'platform',
+            'file': os.path.join(BASE_DIR, 'cache'),
+        }.get(CACHE_BACKEND, '')),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000} if CACHE_BACKEND in ('locmem', 'file') else {},
+    }
+}
+
+# Anonymous copies of home/about/plans/contact/help (app/page_cache.py)
+PUBLIC_PAGE_CACHE_TIMEOUT = 86400
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -165,13 +213,18 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {process:d} {thread:d} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'app.log_handlers.JSONFormatter',
+        },
     },
     'handlers': {
+        # Records are queued and written by a background thread (app/log_handlers.py).
+        # Every platform process appends here, so rotation is left to logrotate.
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'app.log_handlers.QueuedFileHandler',
             'filename': os.path.join(BASE_DIR, 'deployment.log'),
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
         'console': {
             'level': 'DEBUG',
@@ -180,9 +233,14 @@ LOGGING = {
         },
     },
     'loggers': {
-        'your_app_name': {
+        'app': {
             'handlers': ['file', 'console'],
             'level': 'INFO',
+            'propagate': False,
+        },
+        'django.request': {
+            'handlers': ['file'],
+            'level': 'WARNING',
             'propagate': True,
         },
     },
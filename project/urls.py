@@ -15,23 +15,26 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path,include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
-import os
+from app import downloads
+from app.metrics import metrics_view
+from app.profiling import slow_views_report
 
 urlpatterns = [
+    path('admin/slow-views/', slow_views_report, name='slow_views_report'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('app.urls')),
     #  path('api/', include('app.urls')),
 
 ]
-urlpatterns += static('/sites/', document_root=os.path.join(settings.BASE_DIR, 'media', 'websites'))
-
-# Serve uploaded user files
-urlpatterns += static('/uploads/', document_root=os.path.join(settings.BASE_DIR, 'media', 'uploads'))
-
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
+# Files are looked up and access-checked here, then delivered by Nginx via
+# X-Accel-Redirect (or FileResponse in development); see app/downloads.py
+urlpatterns += [
+    path('sites/<path:path>', downloads.serve_site_file, name='serve_site_file'),
+    # Serve uploaded user files
+    path('uploads/<path:path>', downloads.serve_upload, name='serve_upload'),
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', downloads.serve_media, name='serve_media'),
+]